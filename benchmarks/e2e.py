@@ -0,0 +1,375 @@
+"""
+Offline end-to-end benchmark of the batch pipeline.
+
+Replays the saved articles in output/content, plus optional synthetic articles built
+from their paragraphs, through every stage of a batch run: fetch (from a private page
+cache, offline), index (embedded vector backend), analyze, script and engagement. LLM
+calls go to a local fake completion server (benchmarks/fake_llm_server.py) with
+configurable latency, rate limit and error rate; embeddings come from a feature-hashing
+stand-in unless --embeddings model is given. Token counts use the cl100k_base encoding
+bundled with llama-index instead of downloading it. Nothing touches the network or the
+regular output and cache directories, and every setting the run depends on is fixed
+in `configure`, so results do not depend on the local config.py.
+
+Reports throughput, p50/p95 latency per stage (and script time to first token with
+--stream), peak memory, tokens per script and topics degraded to meet --topic-budget, and
+compares them with a stored baseline: the run fails (exit status 1) when throughput
+drops, a stage gets slower, memory grows or scripts use more tokens by more than the
+tolerance. Record a baseline on a quiet machine with --update-baseline.
+
+Usage:
+    python benchmarks/e2e.py [--synthetic 50] [--audiences kids teens adults --fan-out]
+        [--latency 0.05] [--requests-per-minute 600] [--stream] [--topic-budget 30]
+        [--concurrency analyze=8 script=8] [--baseline benchmarks/baselines/e2e.json]
+        [--tolerance 0.2] [--update-baseline] [--output e2e_results.json]
+"""
+import argparse
+import glob
+import importlib.util
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import types
+import zlib
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+try:
+    import config
+except ImportError:
+    # config.py holds the API keys, which the benchmark does not need; configure() sets the rest
+    config = sys.modules['config'] = types.ModuleType('config')
+
+from benchmarks.fake_llm_server import FakeCompletionServer
+from modules import batch, content_indexer, embeddings, instrumentation, llm_gateway
+from modules.lexical_index import tokenize
+from modules.page_cache import PageCache
+from modules.token_counter import FALLBACK_ENCODING, TokenCounter
+from modules.wikipedia_fetcher import WikipediaFetcher
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines', 'e2e.json')
+
+# Spans whose latency percentiles are reported and checked against the baseline
+REPORTED_SPANS = [f'stage.{stage}' for stage in batch.STAGES] + ['llm', 'embed', 'upsert', 'search']
+
+# Stage p95 changes below this many seconds are noise, whatever the relative change
+MIN_LATENCY_DELTA = 0.01
+
+
+class HashingEmbedding:
+    """
+    Deterministic feature-hashing embedder used instead of the sentence transformer.
+
+    It costs almost nothing, needs no model download and still gives texts sharing
+    words similar vectors, so indexing and retrieval do realistic work.
+    """
+
+    def __init__(self, dim: int = 384):
+        self.dim = dim
+
+    def embed(self, texts, normalize: bool = False) -> np.ndarray:
+        texts = list(texts)
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for token in tokenize(text):
+                digest = zlib.crc32(token.encode('utf-8'))
+                vectors[row, digest % self.dim] += 1.0 if digest & 0x80000000 else -1.0
+        if normalize:
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            vectors /= np.where(norms == 0, 1.0, norms)
+        return vectors
+
+    def close(self) -> None:
+        pass
+
+
+def load_articles(content_dir: str):
+    articles = []
+    for path in sorted(glob.glob(os.path.join(content_dir, '*.json'))):
+        with open(path, 'r', encoding='utf-8') as f:
+            articles.append(json.load(f))
+    if not articles:
+        raise SystemExit(f"No article JSON files found in {content_dir}")
+    return articles
+
+
+def synthetic_articles(articles, count: int, paragraphs: int, seed: int):
+    """Articles of `paragraphs` paragraphs sampled from the real ones, each with its own title and vocabulary."""
+    pool = [p.strip() for article in articles for p in article['content'].split('\n\n') if len(p.strip()) > 80]
+    rng = random.Random(seed)
+    generated = []
+    for i in range(count):
+        title = f"Synthetic Article {i:04d}"
+        body = [f"{title} paragraph {j}: {rng.choice(pool)}" for j in range(paragraphs)]
+        generated.append({
+            'title': title,
+            'summary': body[0],
+            'content': '\n\n'.join(body),
+            'url': f"https://en.wikipedia.org/wiki/{title.replace(' ', '_')}",
+            'retrieval_date': '2024-01-01T00:00:00',
+        })
+    return generated
+
+
+def use_bundled_tokenizer() -> None:
+    """
+    Load tiktoken encodings from the cache shipped with llama-index instead of downloading
+    them, and fail with a clear message when the encoding is not available offline.
+    """
+    if 'TIKTOKEN_CACHE_DIR' not in os.environ:
+        spec = importlib.util.find_spec('llama_index.core')
+        if spec is not None and spec.origin:
+            os.environ['TIKTOKEN_CACHE_DIR'] = os.path.join(os.path.dirname(spec.origin), '_static', 'tiktoken_cache')
+    import tiktoken
+    try:
+        # Every model the pipeline counts tokens for (LLM, chunking) uses this encoding
+        tiktoken.get_encoding(FALLBACK_ENCODING)
+    except Exception as e:
+        raise SystemExit(f"The {FALLBACK_ENCODING} tiktoken encoding is not available offline ({type(e).__name__}). "
+                         f"Install llama-index, which bundles it, or point TIKTOKEN_CACHE_DIR at a tiktoken cache "
+                         f"holding it.")
+
+
+def configure(work_dir: str, args) -> None:
+    """Point every store the pipeline uses into the scratch directory and fix every setting it reads."""
+    overrides = {
+        # Stores, all in the scratch directory
+        'VECTOR_BACKEND': 'embedded',
+        'EMBEDDED_VECTOR_STORE_PATH': os.path.join(work_dir, 'vectors'),
+        'EMBEDDED_VECTOR_DTYPE': args.vector_dtype,
+        'EMBEDDED_IVF_THRESHOLD': 100000,
+        'EMBEDDED_IVF_NPROBE': 8,
+        'INGESTION_STATE_DIR': os.path.join(work_dir, 'ingestion'),
+        'ARTIFACT_STORE_ENABLED': True,
+        'ARTIFACT_STORE_DIR': os.path.join(work_dir, 'artifacts'),
+        # Kept on like in production runs, but starting empty in the scratch directory
+        'SEMANTIC_CACHE_ENABLED': True,
+        'SEMANTIC_CACHE_PATH': os.path.join(work_dir, 'semantic_analysis'),
+        'SEMANTIC_CACHE_THRESHOLD': 0.9,
+        'WIKIPEDIA_ARTICLE_STORE': None,
+        'WIKIPEDIA_OFFLINE': True,
+        # Pipeline settings at their defaults
+        'LLM_MODEL': 'claude-2.1',
+        'EMBEDDING_MODEL': 'hugging_face',
+        'CHUNK_SIZE_TOKENS': 512,
+        'CHUNK_OVERLAP_TOKENS': 32,
+        'BULK_LOAD_MIN_DOCUMENTS': 16,
+        'SEARCH_MODE': 'hybrid',
+        'HYBRID_CANDIDATE_FACTOR': 4,
+        'ANALYSIS_TOKEN_BUDGET': 3000,
+        'ANALYSIS_TOP_K': 8,
+        # Only --topic-budget sets a deadline
+        'TOPIC_TIME_BUDGET': None,
+        'STAGE_TIME_BUDGETS': {},
+    }
+    if args.embeddings == 'hashing':
+        # The name under which the stand-in is registered
+        overrides['HUGGINGFACE_MODEL_NAME'] = 'feature-hashing'
+    elif not getattr(config, 'HUGGINGFACE_MODEL_NAME', None):
+        raise SystemExit("--embeddings model needs config.HUGGINGFACE_MODEL_NAME")
+    for name, value in overrides.items():
+        setattr(config, name, value)
+
+
+def peak_rss_mb(tracer) -> float:
+    peak = tracer.peak_rss / 1048576
+    try:
+        import resource
+        # ru_maxrss is in kilobytes on Linux
+        peak = max(peak, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024)
+    except ImportError:
+        pass
+    return round(peak, 1)
+
+
+def run(args) -> dict:
+    articles = load_articles(args.content_dir)
+    articles += synthetic_articles(articles, args.synthetic, args.synthetic_paragraphs, args.seed)
+
+    use_bundled_tokenizer()
+    work_dir = tempfile.mkdtemp(prefix='e2e_bench_')
+    server = FakeCompletionServer(latency=args.latency, latency_per_token=args.latency_per_token, jitter=args.jitter,
+                                  requests_per_minute=args.requests_per_minute, error_rate=args.error_rate,
+                                  seed=args.seed)
+    try:
+        configure(work_dir, args)
+        url = server.start()
+        gateway = llm_gateway.LLMGateway(transport=llm_gateway.HTTPTransport(url),
+                                         max_concurrency=args.llm_concurrency, requests_per_minute=None,
+                                         tokens_per_minute=None, backoff_base=0.1, cache=None)
+        llm_gateway.set_gateway(gateway)
+        if args.embeddings == 'hashing':
+            embeddings.set_embedding_model(HashingEmbedding())
+
+        cache = PageCache(os.path.join(work_dir, 'pages.sqlite3'))
+        for article in articles:
+            cache.put(article['title'], None, article)
+        fetcher = WikipediaFetcher(cache=cache, offline=True)
+
+        token_counter = TokenCounter()
+        jobs = [{'topic': article['title'], 'audience': audience} for article in articles for audience in args.audiences]
+        tracer = instrumentation.start_tracing(os.path.join(work_dir, 'trace.jsonl'), sample_interval=0.25)
+        runner = batch.BatchRunner(os.path.join(work_dir, 'output'), token_counter, wikipedia_fetcher=fetcher,
+                                   indexer=content_indexer.load_index(token_counter),
+                                   concurrency=batch.parse_concurrency(args.concurrency),
+                                   manifest_path=os.path.join(work_dir, 'manifest.json'), fan_out=args.fan_out,
+                                   topic_budget=args.topic_budget, stream=args.stream)
+        start = time.perf_counter()
+        runner.run(jobs)
+        elapsed = time.perf_counter() - start
+        spans = instrumentation.stop_tracing()
+    finally:
+        server.stop()
+        if args.keep:
+            print(f"Work directory kept at {work_dir}")
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    summary = runner.summary()
+    scripts = max(summary['completed'], 1)
+    ttfts = [job['script_ttft'] for job in jobs if job.get('script_ttft') is not None]
+    return {
+        'settings': {
+            'articles': len(articles),
+            'synthetic': args.synthetic,
+            'synthetic_paragraphs': args.synthetic_paragraphs,
+            'audiences': len(args.audiences),
+            'fan_out': args.fan_out,
+            'embeddings': args.embeddings,
+            'vector_dtype': args.vector_dtype,
+            'latency': args.latency,
+            'latency_per_token': args.latency_per_token,
+            'requests_per_minute': args.requests_per_minute,
+            'error_rate': args.error_rate,
+            'stream': args.stream,
+            'topic_budget': args.topic_budget,
+            'concurrency': runner.concurrency,
+            'llm_concurrency': args.llm_concurrency,
+        },
+        'completed': summary['completed'],
+        'failed': summary['failed'],
+        'elapsed_seconds': round(elapsed, 3),
+        'scripts_per_minute': round(summary['completed'] * 60 / elapsed, 2) if elapsed > 0 else 0.0,
+        'latency': {name: {'p50': spans[name]['p50'], 'p95': spans[name]['p95']}
+                    for name in REPORTED_SPANS if name in spans},
+        'script_ttft': {'p50': round(float(np.percentile(ttfts, 50)), 4),
+                        'p95': round(float(np.percentile(ttfts, 95)), 4)} if ttfts else None,
+        'degraded': summary['degraded'],
+        'peak_rss_mb': peak_rss_mb(tracer),
+        'tokens_per_script': {
+            'prompt': round(token_counter.prompt_llm_token_count / scripts, 1),
+            'completion': round(token_counter.completion_llm_token_count / scripts, 1),
+            'embedding': round(token_counter.total_embedding_token_count / scripts, 1),
+        },
+        'llm': {'requests': gateway.stats['requests'], 'retries': gateway.stats['retries'],
+                'server_rate_limited': server.stats['rate_limited'], 'server_errors': server.stats['errors']},
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float, token_tolerance: float):
+    """List the regressions of `results` against `baseline`."""
+    regressions = []
+    if results['failed'] > baseline['failed']:
+        regressions.append(f"failed topics: {results['failed']} (baseline {baseline['failed']})")
+    if results['scripts_per_minute'] < baseline['scripts_per_minute'] * (1 - tolerance):
+        regressions.append(f"throughput: {results['scripts_per_minute']} scripts/min "
+                           f"(baseline {baseline['scripts_per_minute']})")
+    for name, stats in results['latency'].items():
+        previous = baseline['latency'].get(name)
+        if previous and stats['p95'] > previous['p95'] * (1 + tolerance) \
+                and stats['p95'] - previous['p95'] > MIN_LATENCY_DELTA:
+            regressions.append(f"{name} p95: {stats['p95']:.3f}s (baseline {previous['p95']:.3f}s)")
+    if results['peak_rss_mb'] > baseline['peak_rss_mb'] * (1 + tolerance):
+        regressions.append(f"peak memory: {results['peak_rss_mb']} MB (baseline {baseline['peak_rss_mb']} MB)")
+    for kind in ('prompt', 'completion'):
+        current, previous = results['tokens_per_script'][kind], baseline['tokens_per_script'][kind]
+        if current > previous * (1 + token_tolerance):
+            regressions.append(f"{kind} tokens per script: {current} (baseline {previous})")
+    return regressions
+
+
+def print_results(results: dict) -> None:
+    print(f"\n{results['completed']} scripts ({results['failed']} failed) in {results['elapsed_seconds']:.2f}s: "
+          f"{results['scripts_per_minute']} scripts/min")
+    print(f"Peak memory: {results['peak_rss_mb']} MB")
+    if results['script_ttft']:
+        print(f"Script time to first token: p50 {results['script_ttft']['p50']:.3f}s, "
+              f"p95 {results['script_ttft']['p95']:.3f}s")
+    if results['degraded']:
+        print(f"Topics degraded to meet their time budget: {results['degraded']}")
+    tokens = results['tokens_per_script']
+    print(f"Tokens per script: {tokens['prompt']} prompt, {tokens['completion']} completion, "
+          f"{tokens['embedding']} embedding")
+    print(f"LLM: {results['llm']['requests']} requests, {results['llm']['retries']} retries "
+          f"({results['llm']['server_rate_limited']} rate limited, {results['llm']['server_errors']} errors)")
+    print(f"\n{'span':<20}{'p50 s':>10}{'p95 s':>10}")
+    for name, stats in results['latency'].items():
+        print(f"{name:<20}{stats['p50']:>10.3f}{stats['p95']:>10.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline end-to-end benchmark of the batch pipeline')
+    parser.add_argument('--content-dir', default=os.path.join('output', 'content'))
+    parser.add_argument('--synthetic', type=int, default=0, help='Number of synthetic articles to add')
+    parser.add_argument('--synthetic-paragraphs', type=int, default=40, help='Paragraphs per synthetic article')
+    parser.add_argument('--audiences', nargs='+', default=['Teenagers'], help='Audiences generated for every article')
+    parser.add_argument('--fan-out', action='store_true', help='Share one audience-neutral analysis per article')
+    parser.add_argument('--embeddings', choices=['hashing', 'model'], default='hashing',
+                        help="'model' uses the configured sentence transformer instead of feature hashing")
+    parser.add_argument('--vector-dtype', choices=['float16', 'int8'], default='float16')
+    parser.add_argument('--latency', type=float, default=0.05, help='Fake LLM seconds per response')
+    parser.add_argument('--latency-per-token', type=float, default=0.0005, help='Fake LLM seconds per output token')
+    parser.add_argument('--jitter', type=float, default=0.01, help='Fake LLM maximum random extra seconds')
+    parser.add_argument('--requests-per-minute', type=float, help='Fake LLM rate limit (429 above it)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Share of fake LLM requests failing with 529')
+    parser.add_argument('--llm-concurrency', type=int, default=8, help='Maximum in-flight LLM requests')
+    parser.add_argument('--stream', action='store_true', help='Stream scripts and report their time to first token')
+    parser.add_argument('--topic-budget', type=float, help='Seconds per topic before its stages are degraded')
+    parser.add_argument('--concurrency', nargs='*', metavar='STAGE=N', help='Worker count per stage')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='Allowed relative loss of throughput, latency and memory')
+    parser.add_argument('--token-tolerance', type=float, default=0.05, help='Allowed relative growth of tokens per script')
+    parser.add_argument('--update-baseline', action='store_true', help='Store this run as the new baseline')
+    parser.add_argument('--output', help='Also write the results to this JSON file')
+    parser.add_argument('--keep', action='store_true', help='Keep the scratch directory for inspection')
+    args = parser.parse_args()
+
+    results = run(args)
+    print_results(results)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+    if args.update_baseline:
+        os.makedirs(os.path.dirname(args.baseline) or '.', exist_ok=True)
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nBaseline written to {args.baseline}")
+        return
+    if not os.path.exists(args.baseline):
+        print(f"\nNo baseline at {args.baseline}; record one with --update-baseline")
+        return
+
+    with open(args.baseline, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    if baseline.get('settings') != results['settings']:
+        print("\nWARNING: the baseline was recorded with different settings; the comparison may not be meaningful")
+    regressions = compare(results, baseline, args.tolerance, args.token_tolerance)
+    if regressions:
+        print("\nREGRESSIONS against the baseline:")
+        for regression in regressions:
+            print(f"  {regression}")
+        sys.exit(1)
+    print("\nNo regressions against the baseline")
+
+
+if __name__ == '__main__':
+    main()
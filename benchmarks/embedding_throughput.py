@@ -0,0 +1,92 @@
+"""
+CPU embedding throughput benchmark.
+
+Embeds the paragraphs of the saved articles in output/content (repeated up to
+--texts) with plain `SentenceTransformer.encode` as the fp32 baseline, then with the
+EmbeddingModel configurations below, and reports sentences/sec together with the
+cosine drift (mean and worst-case 1 - cosine similarity) against the baseline.
+
+Usage:
+    python benchmarks/embedding_throughput.py [--texts 2000] [--batch-size 64] [--threads 8]
+        [--processes 4] [--backends torch int8 onnx]
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+from modules.embeddings import EmbeddingModel, _load_sentence_transformer
+
+
+def load_texts(content_dir: str, count: int):
+    paragraphs = []
+    for path in sorted(glob.glob(os.path.join(content_dir, '*.json'))):
+        with open(path, 'r', encoding='utf-8') as f:
+            article = json.load(f)
+        text = f"{article.get('summary', '')}\n\n{article.get('content', '')}"
+        paragraphs.extend(p.strip() for p in text.split('\n\n') if len(p.strip()) > 20)
+    if not paragraphs:
+        raise SystemExit(f"No article JSON files found in {content_dir}")
+    return [paragraphs[i % len(paragraphs)] for i in range(count)]
+
+
+def cosine_drift(vectors: np.ndarray, baseline: np.ndarray):
+    vectors = vectors.astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    similarity = np.sum(vectors * baseline, axis=1)
+    return float(np.mean(1 - similarity)), float(np.max(1 - similarity))
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark CPU embedding throughput and accuracy')
+    parser.add_argument('--content-dir', default=os.path.join('output', 'content'))
+    parser.add_argument('--model', default=config.HUGGINGFACE_MODEL_NAME)
+    parser.add_argument('--texts', type=int, default=2000, help='Number of texts to embed')
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--threads', type=int, help='Intra-op CPU threads')
+    parser.add_argument('--processes', type=int, default=0, help='Also benchmark a process pool of this size')
+    parser.add_argument('--backends', nargs='+', default=['torch', 'int8'], help='torch, int8 and/or onnx')
+    args = parser.parse_args()
+
+    texts = load_texts(args.content_dir, args.texts)
+    baseline_model, device = _load_sentence_transformer(args.model, 'torch', args.threads)
+    # Warm-up, so the first measured run does not pay for lazy initialization
+    baseline_model.encode(texts[:32], device=device)
+    baseline, seconds = timed(lambda: baseline_model.encode(texts, device=device, normalize_embeddings=True))
+    print(f"{len(texts)} texts, model {args.model}, device {device}")
+    print(f"{'configuration':<32}{'sentences/s':>12}{'mean drift':>14}{'max drift':>12}")
+    print(f"{'encode() fp32 baseline':<32}{len(texts) / seconds:>12.1f}{0:>14.2e}{0:>12.2e}")
+
+    configurations = []
+    for backend in args.backends:
+        configurations.append((f"{backend} bucketed", dict(backend=backend)))
+        configurations.append((f"{backend} bucketed float16", dict(backend=backend, dtype='float16')))
+    if args.processes > 1:
+        configurations.append((f"{args.backends[0]} x{args.processes} processes",
+                               dict(backend=args.backends[0], processes=args.processes, process_min_texts=1)))
+
+    for name, options in configurations:
+        model = EmbeddingModel(args.model, batch_size=args.batch_size, threads=args.threads, **options)
+        model.embed(texts[:32])
+        vectors, seconds = timed(lambda: model.embed(texts, normalize=True))
+        model.close()
+        assert vectors.flags['C_CONTIGUOUS']
+        mean_drift, max_drift = cosine_drift(vectors, baseline)
+        print(f"{name:<32}{len(texts) / seconds:>12.1f}{mean_drift:>14.2e}{max_drift:>12.2e}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,308 @@
+"""
+Local stand-in for the Anthropic `/v1/complete` endpoint.
+
+Answers every completion with a deterministic, well-formed response for the prompt
+it recognises (content analysis, TikTok script, single and batched engagement
+analysis), after a
+configurable latency. Requests with `"stream": true` are answered with server-sent
+`completion` events, a few words at a time, paced by the per-token latency. An optional
+requests-per-minute limit answers excess requests with HTTP 429 and a `retry-after`
+header, and a configurable share of requests fail with HTTP 529 (overloaded), so the
+gateway's retry paths are exercised as well.
+
+Used by benchmarks/e2e.py; it can also be run on its own and used by pointing
+config.LLM_BASE_URL at it.
+
+Usage:
+    python benchmarks/fake_llm_server.py [--port 8099] [--latency 0.2] [--latency-per-token 0.002]
+        [--jitter 0.05] [--requests-per-minute 120] [--error-rate 0.01]
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterator, Optional, Tuple
+
+# Roughly four characters per token, as for English text with cl100k_base
+CHARS_PER_TOKEN = 4
+# Words per streamed completion event
+STREAM_CHUNK_WORDS = 3
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // CHARS_PER_TOKEN)
+
+
+def _topic(prompt: str) -> str:
+    match = re.search(r"(?:content|analysis) (?:about|of) '([^']+)'", prompt)
+    return match.group(1) if match else 'this topic'
+
+
+def _sentences(prompt: str, count: int) -> list:
+    """Pick `count` sentences of the prompt's content so responses vary with the input."""
+    if 'Key Facts:' in prompt:
+        # Adapting an earlier analysis: reuse its facts
+        content = prompt.split('Key Facts:', 1)[1].split('\n', 1)[0]
+        sentences = [s.strip().lstrip('- ') for s in content.split(';') if s.strip()]
+    else:
+        content = prompt.split('Content:', 1)[-1]
+        sentences = [s.strip() for s in re.split(r'(?<=[.!?])\s+', content) if 40 <= len(s.strip()) <= 300]
+    if not sentences:
+        return ['It has a long and surprising history.'] * count
+    rng = random.Random(len(prompt))
+    return [rng.choice(sentences) for _ in range(count)]
+
+
+def fake_completion(prompt: str) -> str:
+    """A plausible completion in the format the generator's parsers expect."""
+    if 'Provide the following:' in prompt:
+        topic = _topic(prompt)
+        facts = _sentences(prompt, 5)
+        return "\n".join([
+            "1. Summary:",
+            f"{topic} is a subject with a rich history. {facts[0]}",
+            "2. Key facts:",
+            *(f"- {fact}" for fact in facts),
+            "3. Attention-grabbing hooks:",
+            f"- You won't believe what happened with {topic}.",
+            f"- Here is the one thing nobody tells you about {topic}.",
+            f"- {topic} in 60 seconds, go!",
+            "4. Simplified explanation:",
+            f"Think of {topic} as a story that played out over many years, one step at a time.",
+            "5. Relatable anecdote:",
+            f"Imagine explaining {topic} to a friend over lunch and watching their jaw drop.",
+        ])
+    if 'Create an engaging TikTok script' in prompt:
+        hooks = re.search(r'Hooks: (.*)', prompt)
+        hook = hooks.group(1).split(', ')[0] if hooks else "Stop scrolling!"
+        return "\n".join([
+            f"[HOOK] {hook}",
+            "[SCENE 1] Quick cut to an old map while the narrator leans into the camera.",
+            "NARRATOR: So here is the wild part, and it is completely true.",
+            "[SCENE 2] Text on screen highlights the key fact.",
+            "NARRATOR: Once you know this, you will never look at it the same way again.",
+            "[OUTRO] Follow for part two and tell me in the comments what surprised you most!",
+        ])
+    aspects = ['Hook Strength', 'Clarity and Simplicity', 'Audience Appropriateness', 'Information Value',
+               'Entertainment Factor', 'Call-to-Action Effectiveness']
+    batched = re.search(r'each of the following (\d+) TikTok scripts', prompt)
+    if batched:
+        rng = random.Random(len(prompt))
+        return "\n".join(f"### Script {n}\n" + "\n".join(
+            f"{i}. {aspect}: {rng.randint(5, 9)}/10 - Solid, with room to be punchier."
+            for i, aspect in enumerate(aspects, 1)) for n in range(1, int(batched.group(1)) + 1))
+    if 'engagement factors' in prompt:
+        rng = random.Random(len(prompt))
+        return "\n".join(f"{i}. {aspect}: {rng.randint(5, 9)}/10 - Solid, with room to be punchier."
+                         for i, aspect in enumerate(aspects, 1))
+    return "This is a fake completion."
+
+
+class FakeCompletionServer:
+    """
+    Threaded HTTP server answering `/v1/complete` requests with fake completions.
+
+    Args:
+        latency (float): Seconds every response takes before its first byte.
+        latency_per_token (float): Additional seconds per completion token.
+        jitter (float): Upper bound of uniformly random extra seconds per response.
+        requests_per_minute (float): Requests accepted per minute; excess requests get a
+            429 with a `retry-after` header. None disables the limit.
+        error_rate (float): Share of requests that fail with a 529 (overloaded) error.
+        seed (int): Seed of the jitter and error draws.
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, latency: float = 0.2,
+                 latency_per_token: float = 0.0, jitter: float = 0.0, requests_per_minute: Optional[float] = None,
+                 error_rate: float = 0.0, seed: int = 0):
+        self.latency = latency
+        self.latency_per_token = latency_per_token
+        self.jitter = jitter
+        self.requests_per_minute = requests_per_minute
+        self.error_rate = error_rate
+        self.stats = {'requests': 0, 'completed': 0, 'rate_limited': 0, 'errors': 0,
+                      'input_tokens': 0, 'output_tokens': 0}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._allowance = requests_per_minute or 0.0
+        self._refilled_at = time.monotonic()
+        self._thread = None
+        self._httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self._httpd.daemon_threads = True
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _admit(self) -> Tuple[bool, float]:
+        """Take one request from the rate limit; returns (admitted, seconds until the next slot)."""
+        with self._lock:
+            self.stats['requests'] += 1
+            if not self.requests_per_minute:
+                return True, 0.0
+            rate = self.requests_per_minute / 60.0
+            now = time.monotonic()
+            self._allowance = min(self.requests_per_minute, self._allowance + (now - self._refilled_at) * rate)
+            self._refilled_at = now
+            if self._allowance >= 1:
+                self._allowance -= 1
+                return True, 0.0
+            self.stats['rate_limited'] += 1
+            return False, (1 - self._allowance) / rate
+
+    def _draw(self) -> Tuple[float, bool]:
+        with self._lock:
+            return self._random.uniform(0, self.jitter), self._random.random() < self.error_rate
+
+    def respond(self, payload: Dict) -> Tuple[int, Dict, Dict]:
+        """
+        Build the (status, headers, body) answer to one completion request.
+
+        For a successful streaming request the body is an iterator of the events to send,
+        which sleeps between events instead of before the response.
+        """
+        admitted, retry_after = self._admit()
+        if not admitted:
+            return 429, {'retry-after': f"{retry_after:.3f}"}, {
+                'type': 'error', 'error': {'type': 'rate_limit_error', 'message': 'Rate limited'}}
+
+        jitter, fail = self._draw()
+        if fail:
+            time.sleep(self.latency + jitter)
+            with self._lock:
+                self.stats['errors'] += 1
+            return 529, {}, {'type': 'error', 'error': {'type': 'overloaded_error', 'message': 'Overloaded'}}
+
+        prompt = payload.get('prompt', '')
+        max_tokens = int(payload.get('max_tokens_to_sample', 256))
+        text = fake_completion(prompt)
+        stop_reason = 'stop_sequence'
+        if estimate_tokens(text) > max_tokens:
+            text = text[:max_tokens * CHARS_PER_TOKEN]
+            stop_reason = 'max_tokens'
+        input_tokens, output_tokens = estimate_tokens(prompt), estimate_tokens(text)
+        usage = {'input_tokens': input_tokens, 'output_tokens': output_tokens}
+        if payload.get('stream'):
+            return 200, {}, self._stream(' ' + text, payload.get('model'), stop_reason, usage, jitter)
+        time.sleep(self.latency + self.latency_per_token * output_tokens + jitter)
+        self._complete(usage)
+        return 200, {}, {
+            'type': 'completion',
+            'completion': ' ' + text,
+            'model': payload.get('model'),
+            'stop_reason': stop_reason,
+            'usage': usage,
+        }
+
+    def _complete(self, usage: Dict) -> None:
+        with self._lock:
+            self.stats['completed'] += 1
+            self.stats['input_tokens'] += usage['input_tokens']
+            self.stats['output_tokens'] += usage['output_tokens']
+
+    def _stream(self, text: str, model: str, stop_reason: str, usage: Dict, jitter: float) -> Iterator[Dict]:
+        time.sleep(self.latency + jitter)
+        words = re.split(r'(?=\s)', text)
+        for i in range(0, len(words), STREAM_CHUNK_WORDS):
+            chunk = ''.join(words[i:i + STREAM_CHUNK_WORDS])
+            time.sleep(self.latency_per_token * estimate_tokens(chunk))
+            yield {'type': 'completion', 'completion': chunk, 'model': model, 'stop_reason': None}
+        self._complete(usage)
+        yield {'type': 'completion', 'completion': '', 'model': model, 'stop_reason': stop_reason, 'usage': usage}
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                if self.path != '/v1/complete':
+                    status, headers, response = 404, {}, {'type': 'error', 'error': {'type': 'not_found_error'}}
+                else:
+                    try:
+                        status, headers, response = server.respond(json.loads(body or b'{}'))
+                    except ValueError as e:
+                        status, headers, response = 400, {}, {'type': 'error', 'error': {
+                            'type': 'invalid_request_error', 'message': str(e)}}
+                if isinstance(response, dict):
+                    self._send_json(status, headers, response)
+                else:
+                    self._send_events(response)
+
+            def _send_json(self, status, headers, response):
+                data = json.dumps(response).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _send_events(self, events):
+                # No Content-Length: the stream ends when the connection closes
+                self.close_connection = True
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Connection', 'close')
+                self.end_headers()
+                try:
+                    for event in events:
+                        self.wfile.write(f"event: completion\ndata: {json.dumps(event)}\n\n".encode('utf-8'))
+                        self.wfile.flush()
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client cancelled the request
+                    pass
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self) -> str:
+        """Serve on a background thread and return the base URL."""
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name='fake-llm-server', daemon=True)
+        self._thread.start()
+        return self.url
+
+    def serve_forever(self) -> None:
+        self._httpd.serve_forever()
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a fake Anthropic completion server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--latency', type=float, default=0.2, help='Seconds before every response')
+    parser.add_argument('--latency-per-token', type=float, default=0.0, help='Extra seconds per completion token')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Maximum random extra seconds per response')
+    parser.add_argument('--requests-per-minute', type=float, help='Answer requests above this rate with 429')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Share of requests failing with 529')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    server = FakeCompletionServer(args.host, args.port, args.latency, args.latency_per_token, args.jitter,
+                                  args.requests_per_minute, args.error_rate, args.seed)
+    print(f"Fake completion server listening on {server.url} (set config.LLM_BASE_URL to use it)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(json.dumps(server.stats))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""
+Ingestion and search benchmark against a running Qdrant instance.
+
+Loads synthetic normalized vectors (with title/url payloads) into a scratch collection,
+once with default REST settings and once with the tuned settings given on the command
+line, and reports points/sec ingested, the time until the HNSW index is built, and
+p50/p99 search latency with and without a title filter.
+
+Start Qdrant with `docker compose up -d qdrant` first.
+
+Usage:
+    python benchmarks/qdrant_ingest.py [--points 100000] [--grpc] [--batch-size 512] [--parallel 4]
+        [--quantization int8] [--on-disk] [--hnsw-m 16] [--hnsw-ef-construct 100] [--search-ef 64]
+"""
+import argparse
+import contextlib
+import os
+import sys
+import time
+import uuid
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modules.vector_backends import QdrantBackend
+
+
+def make_points(count: int, dim: int, titles: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((count, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    ids = [str(uuid.uuid5(uuid.NAMESPACE_URL, f"benchmark:{i}")) for i in range(count)]
+    payloads = [{'title': f"Topic {i % titles}", 'url': f"https://en.wikipedia.org/wiki/Topic_{i % titles}"}
+                for i in range(count)]
+    return ids, vectors, payloads
+
+
+def wait_for_index(backend: QdrantBackend, timeout: float = 600.0) -> float:
+    from qdrant_client.http import models as rest
+
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout:
+        if backend.client.get_collection(backend.collection_name).status == rest.CollectionStatus.GREEN:
+            break
+        time.sleep(0.2)
+    return time.perf_counter() - start
+
+
+def measure_search(backend: QdrantBackend, queries: np.ndarray, top_k: int, filters=None):
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        backend.search(query[np.newaxis, :], top_k, filters)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return float(np.percentile(latencies, 50)), float(np.percentile(latencies, 99))
+
+
+def run(name: str, backend: QdrantBackend, ids, vectors, payloads, queries, top_k: int, chunk: int, defer: bool):
+    backend.clear()
+    start = time.perf_counter()
+    with backend.bulk_load() if defer else contextlib.nullcontext():
+        for offset in range(0, len(ids), chunk):
+            backend.upsert(ids[offset:offset + chunk], vectors[offset:offset + chunk], payloads[offset:offset + chunk])
+    ingest_seconds = time.perf_counter() - start
+    index_seconds = wait_for_index(backend)
+    p50, p99 = measure_search(backend, queries, top_k)
+    filtered_p50, filtered_p99 = measure_search(backend, queries, top_k, {'title': payloads[0]['title']})
+    print(f"{name:<10}{len(ids) / ingest_seconds:>12.0f}{index_seconds:>10.1f}"
+          f"{p50:>9.2f}{p99:>9.2f}{filtered_p50:>11.2f}{filtered_p99:>11.2f}")
+    backend.clear()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark Qdrant ingestion throughput and search latency')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=6333)
+    parser.add_argument('--grpc-port', type=int, default=6334)
+    parser.add_argument('--points', type=int, default=100000, help='Points to ingest')
+    parser.add_argument('--dim', type=int, default=384, help='Vector dimension')
+    parser.add_argument('--titles', type=int, default=1000, help='Distinct title payload values')
+    parser.add_argument('--queries', type=int, default=200, help='Search queries to time')
+    parser.add_argument('--top-k', type=int, default=10)
+    parser.add_argument('--chunk', type=int, default=10000, help='Points handed to one upsert call')
+    parser.add_argument('--grpc', action='store_true', help='Use gRPC for the tuned run')
+    parser.add_argument('--batch-size', type=int, default=512, help='Upload batch size for the tuned run')
+    parser.add_argument('--parallel', type=int, default=4, help='Upload processes for the tuned run')
+    parser.add_argument('--quantization', choices=['int8'], help='Scalar quantization for the tuned run')
+    parser.add_argument('--on-disk', action='store_true', help='Keep vectors and HNSW graph on disk in the tuned run')
+    parser.add_argument('--hnsw-m', type=int)
+    parser.add_argument('--hnsw-ef-construct', type=int)
+    parser.add_argument('--search-ef', type=int)
+    args = parser.parse_args()
+
+    ids, vectors, payloads = make_points(args.points, args.dim, args.titles)
+    queries = make_points(args.queries, args.dim, args.titles, seed=1)[1]
+
+    baseline = QdrantBackend('benchmark_baseline', host=args.host, port=args.port, upsert_batch_size=64,
+                             payload_indexes=())
+    tuned = QdrantBackend(
+        'benchmark_tuned', host=args.host, port=args.port, grpc_port=args.grpc_port, prefer_grpc=args.grpc,
+        upsert_batch_size=args.batch_size, upsert_parallel=args.parallel, quantization=args.quantization,
+        on_disk=args.on_disk, hnsw_m=args.hnsw_m, hnsw_ef_construct=args.hnsw_ef_construct,
+        search_hnsw_ef=args.search_ef,
+    )
+
+    print(f"{args.points} points, dim {args.dim}, top {args.top_k}")
+    print(f"{'run':<10}{'points/s':>12}{'index s':>10}{'p50 ms':>9}{'p99 ms':>9}"
+          f"{'filt p50':>11}{'filt p99':>11}")
+    run('baseline', baseline, ids, vectors, payloads, queries, args.top_k, args.chunk, defer=False)
+    run('tuned', tuned, ids, vectors, payloads, queries, args.top_k, args.chunk, defer=True)
+
+
+if __name__ == '__main__':
+    main()
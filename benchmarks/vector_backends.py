@@ -0,0 +1,100 @@
+"""
+Recall-versus-latency benchmark of the vector backends.
+
+Indexes a synthetic, clustered collection of normalized vectors into each backend and
+runs the same queries against all of them. Recall@k is measured against exact float32
+search; Qdrant runs in local (in-process) mode, so no server is needed.
+
+Usage:
+    python benchmarks/vector_backends.py [--size 20000] [--dim 384] [--queries 200] [--top-k 10]
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+import uuid
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modules.vector_backends import EmbeddedBackend, QdrantBackend
+
+
+def make_vectors(size: int, dim: int, clusters: int, seed: int) -> np.ndarray:
+    # Points scattered around cluster centres, which is closer to text embeddings than uniform noise
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((clusters, dim)).astype(np.float32)
+    vectors = centres[rng.integers(clusters, size=size)] + 0.5 * rng.standard_normal((size, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def exact_top_k(data: np.ndarray, queries: np.ndarray, top_k: int) -> np.ndarray:
+    scores = queries @ data.T
+    return np.argsort(-scores, axis=1)[:, :top_k]
+
+
+def run_backend(backend, ids, data, queries, truth, top_k, batch_size):
+    start = time.perf_counter()
+    for offset in range(0, len(data), batch_size):
+        batch = slice(offset, offset + batch_size)
+        backend.upsert(ids[batch], data[batch], [{'row': i} for i in range(offset, min(offset + batch_size, len(data)))])
+    ingest_seconds = time.perf_counter() - start
+
+    latencies, hits = [], 0
+    for query, expected in zip(queries, truth):
+        start = time.perf_counter()
+        results = backend.search(query[np.newaxis, :], top_k)[0]
+        latencies.append((time.perf_counter() - start) * 1000)
+        hits += len({payload['row'] for _, _, payload in results} & set(expected.tolist()))
+    return {
+        'ingest_per_sec': len(data) / ingest_seconds,
+        'recall': hits / truth.size,
+        'p50_ms': float(np.percentile(latencies, 50)),
+        'p99_ms': float(np.percentile(latencies, 99)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare recall and latency of the vector backends')
+    parser.add_argument('--size', type=int, default=20000, help='Number of indexed vectors')
+    parser.add_argument('--dim', type=int, default=384, help='Vector dimension')
+    parser.add_argument('--queries', type=int, default=200, help='Number of queries')
+    parser.add_argument('--top-k', type=int, default=10, help='Results per query')
+    parser.add_argument('--clusters', type=int, default=100, help='Clusters in the synthetic data')
+    parser.add_argument('--nprobe', type=int, default=8, help='IVF lists probed per query')
+    parser.add_argument('--batch-size', type=int, default=1000, help='Vectors per upsert')
+    parser.add_argument('--skip-qdrant', action='store_true', help='Only benchmark the embedded backend')
+    args = parser.parse_args()
+
+    data = make_vectors(args.size, args.dim, args.clusters, seed=0)
+    queries = make_vectors(args.queries, args.dim, args.clusters, seed=0)[:args.queries]
+    queries = queries + 0.1 * np.random.default_rng(1).standard_normal(queries.shape).astype(np.float32)
+    truth = exact_top_k(data, queries, args.top_k)
+    ids = [str(uuid.uuid5(uuid.NAMESPACE_URL, str(i))) for i in range(args.size)]
+
+    workdir = tempfile.mkdtemp(prefix='vector_backends_')
+    backends = [
+        ('embedded float16 flat', lambda: EmbeddedBackend(os.path.join(workdir, 'f16'), 'float16', ivf_threshold=None)),
+        ('embedded int8 flat', lambda: EmbeddedBackend(os.path.join(workdir, 'i8'), 'int8', ivf_threshold=None)),
+        ('embedded float16 IVF', lambda: EmbeddedBackend(os.path.join(workdir, 'ivf'), 'float16', ivf_threshold=1,
+                                                         nprobe=args.nprobe)),
+    ]
+    if not args.skip_qdrant:
+        backends.append(('qdrant local', lambda: QdrantBackend('benchmark', location=':memory:')))
+
+    print(f"{args.size} vectors, dim {args.dim}, {args.queries} queries, recall@{args.top_k}")
+    print(f"{'backend':<24}{'ingest/s':>12}{'recall':>10}{'p50 ms':>10}{'p99 ms':>10}")
+    try:
+        for name, factory in backends:
+            result = run_backend(factory(), ids, data, queries, truth, args.top_k, args.batch_size)
+            print(f"{name:<24}{result['ingest_per_sec']:>12.0f}{result['recall']:>10.3f}"
+                  f"{result['p50_ms']:>10.2f}{result['p99_ms']:>10.2f}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
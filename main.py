@@ -1,27 +1,24 @@
 import os
 import sys
 import time
-import psutil
 import traceback
 
-from modules.wikipedia_fetcher import WikipediaFetcher
-from modules import content_indexer, content_analyzer, script_generator, cli, token_counter
-from modules.token_counter import TokenCounter, print_token_count
-from modules.embeddings import EmbeddingModel
-
-import requests
 import argparse
 import config
-from openai import OpenAI
-import anthropic
+from modules import batch, instrumentation, llm_gateway
+
+# Heavy dependencies (torch, sentence_transformers, llama_index, qdrant_client, anthropic)
+# are imported inside the functions that need them so that `--help`, the daemon client
+# and argument errors return immediately. tools/check_import_time.py guards this.
 
-# Check OpenAI API key
-if not config.OPENAI_API_KEY:
-    raise ValueError("OpenAI API key is missing. Please set the OPENAI_API_KEY environment variable.")
+def check_api_keys():
+    # Check OpenAI API key
+    if not config.OPENAI_API_KEY:
+        raise ValueError("OpenAI API key is missing. Please set the OPENAI_API_KEY environment variable.")
 
-# Check Anthropic API key
-if not config.ANTHROPIC_API_KEY:
-    raise ValueError("Anthropic API key is missing. Please set the ANTHROPIC_API_KEY environment variable.")
+    # Check Anthropic API key
+    if not config.ANTHROPIC_API_KEY:
+        raise ValueError("Anthropic API key is missing. Please set the ANTHROPIC_API_KEY environment variable.")
 
 def check_output_directory(output_dir):
     if not os.path.exists(output_dir):
@@ -32,12 +29,12 @@ def check_output_directory(output_dir):
     elif not os.access(output_dir, os.W_OK):
         raise PermissionError(f"Output directory is not writable: {output_dir}. Please check permissions.")
 
-def debug_get_user_input():
+def debug_get_user_input(ask_audience=True):
     print("Debug: Entering get_user_input function")
     try:
         topic = input("Enter a Wikipedia topic: ")
         print(f"Debug: Received topic: {topic}")
-        audience = input("Enter target audience: ")
+        audience = input("Enter target audience: ") if ask_audience else None
         print(f"Debug: Received audience: {audience}")
         output_dir = input("Enter output directory (default: output): ") or "output"
         print(f"Debug: Received output_dir: {output_dir}")
@@ -50,83 +47,138 @@ def debug_get_user_input():
         print(f"Debug: Exception in get_user_input: {str(e)}")
         raise
 
-def main():
+def print_degradations(job):
+    for degradation in job.get('degradations', []):
+        print(f"Degraded to meet the time budget: {degradation['stage']} {degradation['action']} "
+              f"({degradation['reason']})")
+
+def concurrency_setting(value):
+    """argparse type of --concurrency: one `stage=N` value as a (stage, workers) pair."""
+    try:
+        return next(iter(batch.parse_concurrency([value]).items()))
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+def print_engagement(job):
+    if job['engagement'] is None:
+        print("Engagement analysis was deferred to the next run to stay within the time budget.")
+    else:
+        print(job['engagement']['engagement_analysis'])
+
+def main(compact=False, token_budget=None, top_k=None, offline=False, resume=True, audiences=None,
+         topic_budget=None, stream=True):
+    import requests
+
     start_time = time.time()
-    max_execution_time = 300  # 5 minutes
+    # Generation runs against this budget: late stages are degraded or cancelled rather than overrun it
+    max_execution_time = topic_budget or getattr(config, 'MAX_EXECUTION_TIME', 300)
 
     try:
         print('Starting Wikipedia TikTok Generator')
+        check_api_keys()
         print("Preparing to get user input...")
         try:
-            user_input = debug_get_user_input()
+            user_input = debug_get_user_input(ask_audience=not audiences)
             print("User input received successfully.")
         except Exception as e:
             print(f"Error in get_user_input: {str(e)}")
             raise
 
         topic = user_input['topic']
-        audience = user_input['audience']
+        audiences = audiences or [user_input['audience']]
         output_dir = user_input['output_dir']
 
-        print(f"Received user input - Topic: {topic}, Audience: {audience}")
+        print(f"Received user input - Topic: {topic}, Audience: {', '.join(audiences)}")
 
         print("Checking output directory...")
         check_output_directory(output_dir)
         print("Output directory check completed.")
 
-        # Create necessary directories
-        content_dir = os.path.join(output_dir, 'content')
-        os.makedirs(content_dir, exist_ok=True)
-        script_dir = os.path.join(output_dir, 'scripts')
-        os.makedirs(script_dir, exist_ok=True)
-
-        # Initialize token counter and embedding model
+        # Initialize token counter
+        from modules.token_counter import TokenCounter, print_token_count
         token_counter = TokenCounter()
-        embedding_model = EmbeddingModel()
+
+        # The stages run as a checkpointed pipeline: outputs of stages that already
+        # completed for the same inputs are reused from the artifact store
+        from modules.wikipedia_fetcher import WikipediaFetcher
+        from modules import content_indexer
+        from modules.artifacts import get_artifact_store
+        from modules.deadlines import DeadlineScheduler
+        from modules.stages import GenerationPipeline
+        pipeline = GenerationPipeline(
+            token_counter,
+            output_dir,
+            wikipedia_fetcher=WikipediaFetcher(offline=offline or None),
+            indexer=content_indexer.load_index(token_counter),
+            artifact_store=get_artifact_store(output_dir),
+            compact=compact,
+            token_budget=token_budget,
+            top_k=top_k,
+            reuse=resume,
+            fan_out=len(audiences) > 1,
+            scheduler=DeadlineScheduler(topic_budget=max_execution_time),
+            stream=stream,
+            # Scripts of several audiences are generated concurrently and would interleave
+            echo=stream and len(audiences) == 1,
+        )
+
+        if len(audiences) > 1:
+            # One audience-neutral analysis, then cheap per-audience adaptation and scripts
+            print(f"Generating scripts for {len(audiences)} audiences: {', '.join(audiences)}")
+            jobs = pipeline.run_fan_out(topic, audiences)
+            for job in jobs:
+                print(f"\n=== {job['audience']} ===")
+                print(f"Script file: {job['files']['script']}")
+                if job.get('reused_stages'):
+                    print(f"Reused from an earlier run: {', '.join(job['reused_stages'])}")
+                print_degradations(job)
+                print("Engagement Analysis:")
+                print_engagement(job)
+            print("\nToken Usage and Cost:")
+            print_token_count(token_counter, config.EMBEDDING_MODEL, config.LLM_MODEL)
+            print('Wikipedia TikTok Generator completed successfully')
+            return
+
+        job = {'topic': topic, 'audience': audiences[0]}
 
         # Fetch Wikipedia content
         print(f'Fetching Wikipedia content for topic: {topic}')
-        wikipedia_fetcher = WikipediaFetcher()
-        topic_content = wikipedia_fetcher.fetch_wikipedia_content(topic)
-        topic_filename = os.path.join(content_dir, f"{topic.replace(' ', '_')}.json")
-        wikipedia_fetcher.save_content(topic_content, topic_filename)
-        print(f'Wikipedia content saved to: {topic_filename}')
+        pipeline.run_stage(job, 'fetch')
+        print(f"Wikipedia content saved to: {job['content_file']}")
 
         # Create or load index
         print("Creating or loading content index...")
-        index = content_indexer.load_index(token_counter)
-        index.add_document_to_index(topic_content)
+        pipeline.run_stage(job, 'index')
         print('Content indexing completed')
 
         # Analyze content
         print('Analyzing content')
-        analysis = content_analyzer.analyze_content(topic_content['content'], topic, audience, token_counter)
-        print('Content analysis completed')
+        reused = pipeline.run_stage(job, 'analyze')
+        if job['compaction'] and not reused:
+            compaction = job['compaction']
+            print(f"Compacted content from {compaction['original_tokens']} to {compaction['compacted_tokens']} "
+                  f"tokens (compression ratio {compaction['compression_ratio']}x)")
+        print('Content analysis reused from an earlier run' if reused else 'Content analysis completed')
 
         # Generate TikTok script
         print('Generating TikTok script')
-        script = script_generator.generate_tiktok_script(analysis, audience, token_counter)
-        print('TikTok script generated')
-
-        # Save script
-        print("Saving script...")
-        script_filename = os.path.join(script_dir, f"{topic.replace(' ', '_')}_script.txt")
-        try:
-            with open(script_filename, 'w', encoding='utf-8') as f:
-                f.write(script)
-            print(f'Script saved to {script_filename}')
-        except Exception as e:
-            print(f"Error saving script: {str(e)}")
+        reused = pipeline.run_stage(job, 'script')
+        print('TikTok script reused from an earlier run' if reused else 'TikTok script generated')
+        if job.get('script_ttft') is not None:
+            print(f"Time to first token: {job['script_ttft']:.2f} seconds")
+        script_filename = job['files']['script']
+        print(f'Script saved to {script_filename}')
 
         # Analyze script engagement
         print("Analyzing script engagement...")
-        engagement_analysis = script_generator.analyze_script_engagement(script, token_counter)
+        pipeline.run_stage(job, 'engagement')
 
         print(f"\nScript generated successfully!")
         print(f"Output directory: {output_dir}")
         print(f"Script file: {script_filename}")
+        print_degradations(job)
         print("\nEngagement Analysis:")
-        print(engagement_analysis['engagement_analysis'])
+        print_engagement(job)
 
         # Print token count and cost
         print("\nToken Usage and Cost:")
@@ -136,6 +188,8 @@ def main():
 
     except requests.exceptions.RequestException as e:
         print(f"A network error occurred. Please check your internet connection and try again.")
+    except llm_gateway.DeadlineExceeded as e:
+        print(f"Generation was stopped after exceeding its time budget of {max_execution_time} seconds: {str(e)}")
     except ValueError as e:
         print(f"Error: {str(e)}")
     except PermissionError as e:
@@ -154,5 +208,113 @@ def main():
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Wikipedia TikTok Generator')
     parser.add_argument('--debug', action='store_true', help='Enable debug mode')
+    parser.add_argument('--batch', metavar='SOURCE',
+                        help='Run non-interactively for every topic in SOURCE: a file of "topic<TAB>audience" lines '
+                             'or a directory of saved content JSON files')
+    parser.add_argument('--topic', help='Single topic to submit to a running daemon (with --remote)')
+    parser.add_argument('--audience', help='Default target audience for batch topics without one')
+    parser.add_argument('--audiences', nargs='+', metavar='AUDIENCE',
+                        help='Generate scripts for several audiences from one shared analysis of the topic')
+    parser.add_argument('--fan-out', action='store_true',
+                        help='In batch runs, analyze each topic once, adapt the analysis per audience and '
+                             'score the scripts of a topic in one engagement request')
+    parser.add_argument('--output-dir', default='output', help='Output directory for batch and daemon runs')
+    parser.add_argument('--concurrency', action='append', type=concurrency_setting, metavar='STAGE=N',
+                        help=f'Workers per batch stage (stages: {", ".join(batch.STAGES)}); may be repeated')
+    parser.add_argument('--manifest', help='Path of the per-topic batch status manifest')
+    parser.add_argument('--compact', action='store_true',
+                        help='Analyze the lead summary plus the most relevant indexed chunks instead of the full article')
+    parser.add_argument('--token-budget', type=int, help='Token budget for compacted analysis content')
+    parser.add_argument('--top-k', type=int, help='Number of chunks retrieved for compacted analysis content')
+    parser.add_argument('--bulk-fetch', action='store_true',
+                        help='Fetch all batch pages up front with the concurrent bulk Wikipedia fetcher')
+    parser.add_argument('--prefetch-links', type=int, default=0, metavar='N',
+                        help='With --bulk-fetch, also cache the N most-mentioned linked pages of each topic')
+    parser.add_argument('--offline', action='store_true', help='Serve Wikipedia pages from the local page cache only')
+    parser.add_argument('--no-resume', action='store_true',
+                        help='Run every stage again instead of reusing stage outputs stored by earlier runs')
+    parser.add_argument('--topic-budget', type=float, metavar='SECONDS',
+                        help='Time budget per topic; stages that would overrun it are degraded or cancelled '
+                             '(default: config.MAX_EXECUTION_TIME or 300 for single topics; for batches '
+                             'config.TOPIC_TIME_BUDGET, else 300 with --batch-window and none without it)')
+    parser.add_argument('--batch-window', type=float, metavar='SECONDS',
+                        help='Time from the start of a batch by which every topic must finish')
+    parser.add_argument('--no-stream', action='store_true',
+                        help='Wait for complete scripts instead of streaming them to the script file and stdout')
+    cache_group = parser.add_mutually_exclusive_group()
+    cache_group.add_argument('--no-cache', action='store_true', help='Bypass the LLM completion cache')
+    cache_group.add_argument('--refresh-cache', action='store_true',
+                             help='Ignore cached LLM completions and store fresh ones')
+    daemon_group = parser.add_mutually_exclusive_group()
+    daemon_group.add_argument('--serve', action='store_true',
+                              help='Run as a warm daemon that accepts generation jobs over HTTP')
+    daemon_group.add_argument('--remote', action='store_true',
+                              help='Submit --batch or --topic jobs to a running daemon instead of running locally')
+    parser.add_argument('--host', help='Daemon host (default: config.DAEMON_HOST or 127.0.0.1)')
+    parser.add_argument('--port', type=int, help='Daemon port (default: config.DAEMON_PORT or 8765)')
+    parser.add_argument('--trace', nargs='?', const='', metavar='PATH',
+                        help='Write a JSON-lines trace of stage, LLM, embedding and I/O spans with RSS/CPU samples '
+                             '(default path: output/traces/trace_<timestamp>.jsonl)')
+    parser.add_argument('--profile', choices=instrumentation.PROFILERS,
+                        help='Profile the run (main thread) with cProfile or pyinstrument; reports go to output/profiles')
     args = parser.parse_args()
-    main()
\ No newline at end of file
+    if args.trace is not None:
+        tracer = instrumentation.start_tracing(args.trace or None)
+        print(f"Writing trace to {tracer.path}")
+    if args.no_cache:
+        llm_gateway.set_cache_mode('bypass')
+    elif args.refresh_cache:
+        llm_gateway.set_cache_mode('refresh')
+
+    # Fresh LLM output was asked for, so stored stage outputs are not reused either
+    resume = not (args.no_resume or args.no_cache or args.refresh_cache)
+
+    if args.serve or args.remote:
+        from modules import daemon
+        host = args.host or daemon.DEFAULT_HOST
+        port = args.port or daemon.DEFAULT_PORT
+
+    profile_path = os.path.join('output', 'profiles', f"profile_{time.strftime('%Y%m%d_%H%M%S')}")
+    try:
+        with instrumentation.profiling(args.profile, profile_path):
+            if args.serve:
+                check_api_keys()
+                check_output_directory(args.output_dir)
+                daemon.serve(host, port, args.output_dir, offline=args.offline)
+            elif args.remote:
+                if args.no_cache or args.refresh_cache:
+                    # The daemon shares one completion cache between all clients
+                    parser.error('--no-cache and --refresh-cache apply to the whole daemon; '
+                                 'pass them to --serve instead of --remote')
+                if args.batch:
+                    jobs = batch.load_jobs(args.batch, args.audience)
+                elif args.topic and args.audience:
+                    jobs = [{'topic': args.topic, 'audience': args.audience}]
+                else:
+                    parser.error('--remote needs --batch, or --topic together with --audience')
+                result = daemon.submit_jobs(jobs, host, port,
+                                            concurrency=dict(args.concurrency or ()) or None,
+                                            compact=args.compact, token_budget=args.token_budget, top_k=args.top_k,
+                                            resume=resume, fan_out=args.fan_out, topic_budget=args.topic_budget,
+                                            window=args.batch_window, stream=not args.no_stream)
+                for entry in result['topics']:
+                    print(f"{entry['topic']} ({entry['audience']}): {entry['status']}"
+                          + (f" - {entry['error']}" if entry['error'] else f" - {entry['files'].get('script')}"))
+                print(f"Manifest written to {result['manifest_file']}")
+            elif args.batch:
+                check_api_keys()
+                check_output_directory(args.output_dir)
+                batch.run_batch(args.batch, args.output_dir, args.audience,
+                                dict(args.concurrency or ()), args.manifest,
+                                compact=args.compact, token_budget=args.token_budget, top_k=args.top_k,
+                                offline=args.offline, bulk_fetch=args.bulk_fetch, prefetch_links=args.prefetch_links,
+                                resume=resume, fan_out=args.fan_out, topic_budget=args.topic_budget,
+                                window=args.batch_window, stream=not args.no_stream)
+            else:
+                main(compact=args.compact, token_budget=args.token_budget, top_k=args.top_k, offline=args.offline,
+                     resume=resume, audiences=args.audiences, topic_budget=args.topic_budget,
+                     stream=not args.no_stream)
+    finally:
+        if args.trace is not None:
+            print("\nSpan timings:")
+            instrumentation.print_span_summary(instrumentation.stop_tracing())
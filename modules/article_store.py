@@ -0,0 +1,342 @@
+import bz2
+import hashlib
+import html
+import json
+import logging
+import mmap
+import multiprocessing
+import os
+import re
+import sqlite3
+import struct
+import time
+import zlib
+from array import array
+from typing import Dict, Iterator, Optional, Tuple
+from urllib.parse import quote
+from xml.etree import ElementTree
+
+from modules.page_cache import normalize_title
+from modules.wikipedia_fetcher import format_extract_sections
+
+logger = logging.getLogger(__name__)
+
+INDEX_MAGIC = b'WTAS0002'
+INDEX_HEADER = struct.Struct('<8sQQ')  # magic, slot count, article count
+# Title hash, data offset, data length (0 = empty slot), offset and length of the normalized title in titles.bin
+INDEX_SLOT = struct.Struct('<QQIQH')
+MAX_REDIRECT_HOPS = 5
+
+# Namespaces that are links to media or categories rather than article text
+_NON_TEXT_LINK_PREFIXES = ('file:', 'image:', 'category:', 'media:')
+
+_COMMENT_RE = re.compile(r'<!--.*?-->', re.DOTALL)
+_REF_RE = re.compile(r'<ref[^>/]*/>|<ref[^>]*>.*?</ref>', re.DOTALL | re.IGNORECASE)
+_TEMPLATE_RE = re.compile(r'\{\{[^{}]*\}\}')
+_TABLE_RE = re.compile(r'\{\|(?:(?!\{\|).)*?\|\}', re.DOTALL)
+_LINK_RE = re.compile(r'\[\[([^\[\]]*)\]\]')
+_EXTERNAL_LINK_RE = re.compile(r'\[(?:https?:)?//[^\s\]]+(?: ([^\]]*))?\]')
+_HEADING_RE = re.compile(r'^(={2,6})\s*(.+?)\s*\1\s*$', re.MULTILINE)
+_TAG_RE = re.compile(r'<[^>]+>')
+_EMPHASIS_RE = re.compile(r"'{2,}")
+_MAGIC_WORD_RE = re.compile(r'__[A-Z]+__')
+_LIST_PREFIX_RE = re.compile(r'^[*#:;]+\s*', re.MULTILINE)
+_BLANK_LINES_RE = re.compile(r'\n{3,}')
+
+
+def _title_hash(title: str) -> int:
+    digest = hashlib.blake2b(normalize_title(title).encode('utf-8'), digest_size=8).digest()
+    # 0 marks an empty slot
+    return int.from_bytes(digest, 'little') or 1
+
+
+def _replace_link(match: re.Match) -> str:
+    target, _, label = match.group(1).partition('|')
+    if target.strip().lower().startswith(_NON_TEXT_LINK_PREFIXES):
+        return ''
+    # [[File:...|...]] captions may contain '|' separated options; keep the last part for normal links
+    return (label.rsplit('|', 1)[-1] if label else target).strip()
+
+
+def _remove_nested(pattern: re.Pattern, text: str, replacement='') -> str:
+    # Remove innermost matches first until nothing is left, so nesting is handled
+    while True:
+        text, count = pattern.subn(replacement, text)
+        if not count:
+            return text
+
+
+def strip_wikitext(wikitext: str) -> str:
+    """
+    Convert article wikitext to plain text in the layout of a Wikipedia plain-text extract:
+    the lead, followed by sections introduced by `== Heading ==` lines.
+    """
+    text = _COMMENT_RE.sub('', wikitext)
+    text = _REF_RE.sub('', text)
+    text = _remove_nested(_TEMPLATE_RE, text)
+    text = _remove_nested(_TABLE_RE, text)
+    text = _remove_nested(_LINK_RE, text, _replace_link)
+    text = _EXTERNAL_LINK_RE.sub(lambda m: m.group(1) or '', text)
+    text = _TAG_RE.sub('', text)
+    text = _EMPHASIS_RE.sub('', text)
+    text = _MAGIC_WORD_RE.sub('', text)
+    text = html.unescape(text)
+
+    lines = []
+    for line in text.split('\n'):
+        stripped = line.strip()
+        # Leftovers of unbalanced tables and templates
+        if stripped.startswith(('|', '!', '{|', '|}', '}}')):
+            continue
+        lines.append(line.rstrip())
+    text = _LIST_PREFIX_RE.sub('', '\n'.join(lines))
+    text = _HEADING_RE.sub(lambda m: f"\n\n{m.group(1)} {m.group(2)} {m.group(1)}\n", text)
+    return _BLANK_LINES_RE.sub('\n\n', text).strip()
+
+
+def build_article(title: str, wikitext: str, revision_id: Optional[int] = None,
+                  timestamp: Optional[str] = None) -> Dict:
+    """Build the page dict produced by `WikipediaFetcher.fetch_wikipedia_content` from wikitext."""
+    summary, content = format_extract_sections(strip_wikitext(wikitext))
+    return {
+        'title': title,
+        'summary': summary,
+        'content': content,
+        'url': f"https://en.wikipedia.org/wiki/{quote(title.replace(' ', '_'))}",
+        'retrieval_date': timestamp.replace('T', ' ').rstrip('Z') if timestamp else None,
+        'revision_id': revision_id,
+    }
+
+
+def iter_dump_pages(dump_path: str) -> Iterator[Tuple[str, Optional[str], str, Optional[int], Optional[str]]]:
+    """
+    Stream the main-namespace pages of a pages-articles XML dump (optionally .bz2 compressed).
+
+    Yields:
+        Tuple: (title, redirect target or None, wikitext, revision ID, revision timestamp)
+    """
+    opener = bz2.open if dump_path.endswith('.bz2') else open
+    with opener(dump_path, 'rb') as f:
+        context = ElementTree.iterparse(f, events=('start', 'end'))
+        _, root = next(context)
+        for event, elem in context:
+            if event != 'end' or not elem.tag.endswith('}page'):
+                continue
+            namespace = elem.tag[:-len('page')]
+            if elem.findtext(f'{namespace}ns') == '0':
+                redirect = elem.find(f'{namespace}redirect')
+                revision = elem.find(f'{namespace}revision')
+                if revision is None:
+                    revision = ElementTree.Element('revision')
+                revision_id = revision.findtext(f'{namespace}id')
+                yield (
+                    elem.findtext(f'{namespace}title'),
+                    redirect.get('title') if redirect is not None else None,
+                    revision.findtext(f'{namespace}text') or '',
+                    int(revision_id) if revision_id else None,
+                    revision.findtext(f'{namespace}timestamp'),
+                )
+            # Drop parsed pages so memory stays flat over the whole dump
+            root.clear()
+
+
+def _process_page(page: Tuple) -> Tuple[str, Optional[str], Optional[bytes]]:
+    title, redirect, wikitext, revision_id, timestamp = page
+    if redirect:
+        return title, redirect, None
+    record = json.dumps(build_article(title, wikitext, revision_id, timestamp), ensure_ascii=False)
+    return title, None, zlib.compress(record.encode('utf-8'), 6)
+
+
+class ArticleStoreWriter:
+    """
+    Appends compressed articles to `articles.bin` and writes the title index on close.
+
+    Normalized titles are appended to `titles.bin` as articles arrive, and the title to
+    article mapping and the redirects needed to resolve redirect chains are spilled to
+    a temporary SQLite database, so memory use does not grow with the titles of the
+    dump. Only fixed-size arrays of index entries are kept in memory.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self._data = open(os.path.join(path, 'articles.bin'), 'wb')
+        self._titles = open(os.path.join(path, 'titles.bin'), 'wb')
+        self._offset = 0
+        self._title_offset = 0
+        self._articles = 0
+        self._hashes = array('Q')
+        self._offsets = array('Q')
+        self._lengths = array('I')
+        self._title_offsets = array('Q')
+        self._title_lengths = array('H')
+        self._spill_path = os.path.join(path, 'titles.tmp.sqlite3')
+        if os.path.exists(self._spill_path):
+            os.remove(self._spill_path)
+        self._spill = sqlite3.connect(self._spill_path)
+        self._spill.execute("PRAGMA journal_mode=OFF")
+        self._spill.execute("PRAGMA synchronous=OFF")
+        self._spill.execute("CREATE TABLE articles (title TEXT PRIMARY KEY, position INTEGER NOT NULL)")
+        self._spill.execute("CREATE TABLE redirects (title TEXT PRIMARY KEY, target TEXT NOT NULL)")
+
+    def _add_entry(self, title: str, offset: int, length: int) -> int:
+        key = title.encode('utf-8')[:0xFFFF]
+        self._titles.write(key)
+        self._hashes.append(_title_hash(title))
+        self._offsets.append(offset)
+        self._lengths.append(length)
+        self._title_offsets.append(self._title_offset)
+        self._title_lengths.append(len(key))
+        self._title_offset += len(key)
+        return len(self._hashes) - 1
+
+    def add(self, title: str, compressed_record: bytes) -> None:
+        self._data.write(compressed_record)
+        title = normalize_title(title)
+        position = self._add_entry(title, self._offset, len(compressed_record))
+        # The first article of a title wins, as in the index
+        self._spill.execute("INSERT OR IGNORE INTO articles (title, position) VALUES (?, ?)", (title, position))
+        self._offset += len(compressed_record)
+        self._articles += 1
+
+    def add_redirect(self, title: str, target: str) -> None:
+        self._spill.execute("INSERT OR REPLACE INTO redirects (title, target) VALUES (?, ?)",
+                            (normalize_title(title), normalize_title(target.split('#', 1)[0])))
+
+    def _resolve_redirects(self) -> int:
+        def position_of(title):
+            row = self._spill.execute("SELECT position FROM articles WHERE title = ?", (title,)).fetchone()
+            return row[0] if row else None
+
+        def redirect_of(title):
+            row = self._spill.execute("SELECT target FROM redirects WHERE title = ?", (title,)).fetchone()
+            return row[0] if row else None
+
+        resolved = 0
+        redirects = self._spill.execute(
+            "SELECT title, target FROM redirects WHERE title NOT IN (SELECT title FROM articles)")
+        for title, target in redirects:
+            for _ in range(MAX_REDIRECT_HOPS):
+                position = position_of(target)
+                next_target = redirect_of(target) if position is None else None
+                if next_target is None:
+                    break
+                target = next_target
+            position = position_of(target)
+            if position is not None:
+                self._add_entry(title, self._offsets[position], self._lengths[position])
+                resolved += 1
+        return resolved
+
+    def close(self) -> Dict:
+        self._data.close()
+        self._spill.commit()
+        resolved_redirects = self._resolve_redirects()
+        self._spill.close()
+        os.remove(self._spill_path)
+        self._titles.close()
+
+        entry_count = len(self._hashes)
+        slot_count = 1
+        while slot_count < 2 * max(entry_count, 1):
+            slot_count *= 2
+        index_path = os.path.join(self.path, 'index.bin.tmp')
+        with open(index_path, 'w+b') as f:
+            # Build the table in the mapped file rather than in memory
+            f.truncate(INDEX_HEADER.size + slot_count * INDEX_SLOT.size)
+            with mmap.mmap(f.fileno(), 0) as table, open(os.path.join(self.path, 'titles.bin'), 'rb') as titles_file:
+                titles = mmap.mmap(titles_file.fileno(), 0, access=mmap.ACCESS_READ) if self._title_offset else b''
+                INDEX_HEADER.pack_into(table, 0, INDEX_MAGIC, slot_count, self._articles)
+                for i in range(entry_count):
+                    title_hash, title_offset, title_length = self._hashes[i], self._title_offsets[i], self._title_lengths[i]
+                    slot = title_hash & (slot_count - 1)
+                    while True:
+                        position = INDEX_HEADER.size + slot * INDEX_SLOT.size
+                        existing_hash, _, existing_length, existing_title_offset, existing_title_length = \
+                            INDEX_SLOT.unpack_from(table, position)
+                        if existing_length == 0:
+                            INDEX_SLOT.pack_into(table, position, title_hash, self._offsets[i], self._lengths[i],
+                                                 title_offset, title_length)
+                            break
+                        if existing_hash == title_hash and \
+                                titles[existing_title_offset:existing_title_offset + existing_title_length] == \
+                                titles[title_offset:title_offset + title_length]:
+                            break  # Duplicate title: keep the first entry
+                        slot = (slot + 1) & (slot_count - 1)
+                if isinstance(titles, mmap.mmap):
+                    titles.close()
+        os.replace(index_path, os.path.join(self.path, 'index.bin'))
+
+        stats = {'articles': self._articles, 'redirects': resolved_redirects, 'bytes': self._offset}
+        with open(os.path.join(self.path, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump(stats, f, indent=2)
+        return stats
+
+
+class ArticleStore:
+    """
+    Read-only, memory-mapped store of formatted Wikipedia articles.
+
+    Lookups hash the normalized title into an open-addressing table in `index.bin`,
+    compare the title stored for the slot in `titles.bin` and decompress a single record
+    from `articles.bin`, so they take constant time and the operating system's page
+    cache does the rest. Redirect titles point at the record of their target article.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, 'index.bin'), 'rb') as f:
+            self._index = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self._slot_count, self.article_count = INDEX_HEADER.unpack_from(self._index, 0)
+        if magic != INDEX_MAGIC:
+            raise ValueError(f"{path} is not an article store of this version; ingest the dump again")
+        self._data = self._map(os.path.join(path, 'articles.bin'))
+        self._titles = self._map(os.path.join(path, 'titles.bin'))
+
+    @staticmethod
+    def _map(path: str):
+        with open(path, 'rb') as f:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(f.fileno()).st_size else b''
+
+    def get(self, title: str) -> Optional[Dict]:
+        key = normalize_title(title).encode('utf-8')[:0xFFFF]
+        title_hash = _title_hash(title)
+        slot = title_hash & (self._slot_count - 1)
+        while True:
+            slot_hash, offset, length, title_offset, title_length = INDEX_SLOT.unpack_from(
+                self._index, INDEX_HEADER.size + slot * INDEX_SLOT.size)
+            if length == 0:
+                return None
+            # Equal hashes of different titles fall through to the next slot
+            if slot_hash == title_hash and self._titles[title_offset:title_offset + title_length] == key:
+                return json.loads(zlib.decompress(self._data[offset:offset + length]))
+            slot = (slot + 1) & (self._slot_count - 1)
+
+    def __contains__(self, title: str) -> bool:
+        return self.get(title) is not None
+
+
+def ingest_dump(dump_path: str, store_path: str, workers: Optional[int] = None, chunksize: int = 32) -> Dict:
+    """
+    Convert a pages-articles dump into an ArticleStore.
+
+    The dump is streamed by the parent process while a pool of worker processes strips
+    and compresses the wikitext of each article.
+    """
+    workers = workers or os.cpu_count() or 1
+    writer = ArticleStoreWriter(store_path)
+    start = time.time()
+    processed = 0
+    with multiprocessing.Pool(workers) as pool:
+        for title, redirect, record in pool.imap(_process_page, iter_dump_pages(dump_path), chunksize):
+            if redirect:
+                writer.add_redirect(title, redirect)
+            else:
+                writer.add(title, record)
+            processed += 1
+            if processed % 10000 == 0:
+                logger.info(f"Processed {processed} pages ({processed / (time.time() - start):.0f} pages/s)")
+    stats = writer.close()
+    stats['seconds'] = round(time.time() - start, 2)
+    return stats
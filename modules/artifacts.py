@@ -0,0 +1,108 @@
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+from typing import Any, Dict, Optional
+
+import config
+
+logger = logging.getLogger(__name__)
+
+
+def _canonical_json(value: Any) -> bytes:
+    return json.dumps(value, ensure_ascii=False, sort_keys=True, separators=(',', ':')).encode('utf-8')
+
+
+def content_digest(value: Any) -> str:
+    """SHA-256 of the canonical JSON form of `value`."""
+    return hashlib.sha256(_canonical_json(value)).hexdigest()
+
+
+def artifact_key(stage: str, inputs: Dict) -> str:
+    """Key of a stage's output: a digest of the stage name and everything its output depends on."""
+    return content_digest({'stage': stage, 'inputs': inputs})
+
+
+def _write_atomic(path: str, data: bytes) -> None:
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    # A temporary file of its own per write: threads store the same ref and object concurrently
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f"{os.path.basename(path)}.", suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(tmp_path)
+        raise
+
+
+class ArtifactStore:
+    """
+    Content-addressed on-disk store of stage outputs.
+
+    Outputs are stored once under the digest of their content in `objects/`, and a
+    small ref file in `refs/` maps each stage key (see `artifact_key`) to its object.
+    Both are written to a temporary file first and renamed into place, so a crash
+    never leaves a partially written artifact behind: a stage either has a complete
+    output or none. Several processes can share one store.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _object_path(self, digest: str) -> str:
+        return os.path.join(self.root, 'objects', digest[:2], f"{digest}.json")
+
+    def _ref_path(self, key: str) -> str:
+        return os.path.join(self.root, 'refs', key[:2], f"{key}.json")
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return the stored output for `key`, or None if the stage has not completed for these inputs."""
+        try:
+            with open(self._ref_path(key), 'r', encoding='utf-8') as f:
+                ref = json.load(f)
+            with open(self._object_path(ref['object']), 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Ignoring unreadable artifact {key}: {e}")
+            return None
+        if hashlib.sha256(data).hexdigest() != ref['object']:
+            logger.warning(f"Ignoring corrupt artifact {key} ({ref['stage']})")
+            return None
+        return json.loads(data)
+
+    def put(self, key: str, stage: str, value: Any) -> str:
+        """
+        Store the output of `stage` under `key`.
+
+        Returns:
+            str: The content digest of the stored output.
+        """
+        data = _canonical_json(value)
+        digest = hashlib.sha256(data).hexdigest()
+        object_path = self._object_path(digest)
+        if not os.path.exists(object_path):
+            _write_atomic(object_path, data)
+        ref = {'stage': stage, 'key': key, 'object': digest, 'created_at': time.time()}
+        _write_atomic(self._ref_path(key), json.dumps(ref).encode('utf-8'))
+        return digest
+
+
+def get_artifact_store(output_dir: str) -> Optional[ArtifactStore]:
+    """
+    Return the artifact store for runs writing to `output_dir`.
+
+    The store lives in config.ARTIFACT_STORE_DIR, or `<output_dir>/artifacts` when that
+    is not set. Returns None when config.ARTIFACT_STORE_ENABLED is False.
+    """
+    if not getattr(config, 'ARTIFACT_STORE_ENABLED', True):
+        return None
+    return ArtifactStore(getattr(config, 'ARTIFACT_STORE_DIR', None) or os.path.join(output_dir, 'artifacts'))
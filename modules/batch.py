@@ -0,0 +1,382 @@
+import glob
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import config
+from modules.artifacts import ArtifactStore, get_artifact_store
+from modules.deadlines import DeadlineScheduler
+from modules.instrumentation import span
+from modules.stages import STAGE_NAMES, GenerationPipeline, job_basename
+from modules.token_counter import TokenCounter, print_token_count
+
+logger = logging.getLogger(__name__)
+
+STAGES = STAGE_NAMES
+ENGAGEMENT_INDEX = STAGES.index('engagement')
+
+DEFAULT_CONCURRENCY = {
+    'fetch': 4,
+    'index': 1,
+    'analyze': 4,
+    'script': 4,
+    'engagement': 4,
+}
+
+
+def load_jobs(source: str, default_audience: Optional[str] = None) -> List[Dict]:
+    """
+    Build the job list for a batch run.
+
+    Args:
+        source (str): Either a directory of saved `<topic>.json` content files, or a text
+            file with one `topic<TAB>audience` (or `topic | audience`) pair per line.
+            Blank lines and lines starting with '#' are ignored.
+        default_audience (str): Audience used when a line or content file has none.
+
+    Returns:
+        List[Dict]: One job dict per topic/audience pair.
+    """
+    jobs = []
+    if os.path.isdir(source):
+        for filename in sorted(glob.glob(os.path.join(source, '*.json'))):
+            with open(filename, 'r', encoding='utf-8') as f:
+                topic_content = json.load(f)
+            if not default_audience:
+                raise ValueError("An audience is required when running a batch from a content directory.")
+            jobs.append({
+                'topic': topic_content['title'],
+                'audience': default_audience,
+                'topic_content': topic_content,
+                'content_file': filename,
+            })
+        return jobs
+
+    with open(source, 'r', encoding='utf-8') as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            separator = '\t' if '\t' in line else '|'
+            topic, _, audience = (part.strip() for part in line.partition(separator))
+            audience = audience or default_audience
+            if not audience:
+                raise ValueError(f"Missing audience for topic '{topic}' on line {line_number} of {source}.")
+            jobs.append({'topic': topic, 'audience': audience})
+    return jobs
+
+
+class BatchRunner:
+    """
+    Runs many topics through the generation stages as a pipelined job set.
+
+    Every stage has its own worker pool, so a topic moves on to the next stage as soon
+    as its previous stage finishes while other topics are still being fetched or analyzed.
+    All stages share one token counter, one Wikipedia fetcher and one content index.
+    Stage outputs are checkpointed in the artifact store, so running an interrupted
+    batch again skips the stages each topic already completed. With `fan_out`, the
+    audiences of a topic share one audience-neutral analysis of its page, and their
+    scripts are scored together in one engagement request once all of them are written.
+
+    With a `topic_budget` (or config.TOPIC_TIME_BUDGET) or a `window`, every topic runs
+    against a deadline and degrades its work rather than overrun it; see
+    `DeadlineScheduler`. The manifest lists the degradations of each topic.
+    """
+
+    def __init__(self, output_dir: str, token_counter: TokenCounter, wikipedia_fetcher=None, indexer=None,
+                 concurrency: Optional[Dict[str, int]] = None, manifest_path: Optional[str] = None,
+                 compact: bool = False, token_budget: Optional[int] = None, top_k: Optional[int] = None,
+                 artifact_store: Optional[ArtifactStore] = None, resume: bool = True, fan_out: bool = False,
+                 topic_budget: Optional[float] = None, window: Optional[float] = None, stream: bool = False):
+        """
+        Args:
+            topic_budget (float): Seconds each topic may take from its fetch to its last stage.
+            window (float): Seconds from the start of the run by which every topic must finish.
+            stream (bool): Stream scripts into their files as they are generated.
+        """
+        self.output_dir = output_dir
+        self.token_counter = token_counter
+        self.window = window
+        scheduler = None
+        if topic_budget or window or getattr(config, 'TOPIC_TIME_BUDGET', None):
+            scheduler = DeadlineScheduler(topic_budget)
+        self.pipeline = GenerationPipeline(
+            token_counter,
+            output_dir,
+            wikipedia_fetcher=wikipedia_fetcher,
+            indexer=indexer,
+            artifact_store=artifact_store if artifact_store is not None else get_artifact_store(output_dir),
+            compact=compact,
+            token_budget=token_budget,
+            top_k=top_k,
+            reuse=resume,
+            fan_out=fan_out,
+            scheduler=scheduler,
+            stream=stream,
+        )
+        self.concurrency = dict(DEFAULT_CONCURRENCY)
+        self.concurrency.update(concurrency or {})
+        self.manifest_path = manifest_path or os.path.join(
+            output_dir, f"batch_manifest_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+
+        self._lock = threading.Lock()
+        self._manifest_lock = threading.Lock()
+        self._executors = {}
+        self._jobs = []
+        self._engagement_groups = {}
+        self._remaining = 0
+        self._done = threading.Event()
+        self._started_at = None
+
+    def run(self, jobs: List[Dict]) -> List[Dict]:
+        self._jobs = jobs
+        self._assign_basenames(jobs)
+        for job in jobs:
+            job.update({'status': 'pending', 'stage': None, 'error': None, 'timings': {}, 'files': {},
+                        'reused_stages': []})
+
+        self._started_at = time.time()
+        if self.window and self.pipeline.scheduler is not None:
+            self.pipeline.scheduler.window_end = time.monotonic() + self.window
+        self._remaining = len(jobs)
+        self._engagement_groups = self._group_engagement(jobs)
+        if not jobs:
+            self._write_manifest()
+            return jobs
+
+        self._executors = {
+            stage: ThreadPoolExecutor(max_workers=max(1, self.concurrency[stage]), thread_name_prefix=f'batch-{stage}')
+            for stage in STAGES
+        }
+        try:
+            for job in jobs:
+                self._submit(job, 0)
+            self._done.wait()
+        finally:
+            for executor in self._executors.values():
+                executor.shutdown(wait=True)
+            self._write_manifest()
+        return jobs
+
+    def _assign_basenames(self, jobs: List[Dict]) -> None:
+        topic_counts = {}
+        for job in jobs:
+            topic_counts[job['topic']] = topic_counts.get(job['topic'], 0) + 1
+        for job in jobs:
+            # Same topic for several audiences: keep the script files apart
+            job['basename'] = job_basename(job['topic'], job['audience'], topic_counts[job['topic']] > 1)
+
+    def _group_engagement(self, jobs: List[Dict]) -> Dict[str, Dict]:
+        if not self.pipeline.fan_out:
+            return {}
+        groups = {}
+        for job in jobs:
+            groups.setdefault(job['topic'], {'pending': 0, 'jobs': []})['pending'] += 1
+        return {topic: group for topic, group in groups.items() if group['pending'] > 1}
+
+    def _submit(self, job: Dict, stage_index: int) -> None:
+        stage = STAGES[stage_index]
+        future = self._executors[stage].submit(self._run_stage, job, stage)
+        future.add_done_callback(lambda f: self._advance(job, stage_index, f))
+
+    def _advance(self, job: Dict, stage_index: int, future) -> None:
+        error = future.exception()
+        batched = job['topic'] in self._engagement_groups and stage_index < ENGAGEMENT_INDEX
+        if error is not None:
+            logger.error(f"Topic '{job['topic']}' failed in stage {STAGES[stage_index]}: {error}")
+            job['status'] = 'failed'
+            job['error'] = f"{type(error).__name__}: {error}"
+            if batched:
+                self._join_engagement_batch(job, ready=False)
+        elif batched and stage_index + 1 == ENGAGEMENT_INDEX:
+            self._join_engagement_batch(job, ready=True)
+            return
+        elif stage_index + 1 < len(STAGES):
+            self._submit(job, stage_index + 1)
+            return
+        else:
+            job['status'] = 'completed'
+            job['stage'] = None
+
+        self._write_manifest()
+        with self._lock:
+            self._remaining -= 1
+            if self._remaining == 0:
+                self._done.set()
+
+    def _join_engagement_batch(self, job: Dict, ready: bool) -> None:
+        # Called once per job of a fanned-out topic, when its script is written or it failed earlier
+        with self._lock:
+            group = self._engagement_groups[job['topic']]
+            group['pending'] -= 1
+            if ready:
+                group['jobs'].append(job)
+            if group['pending'] or not group['jobs']:
+                return
+            jobs = group['jobs']
+        future = self._executors['engagement'].submit(self._run_engagement_batch, jobs)
+        future.add_done_callback(lambda f: self._finish_engagement_batch(jobs, f))
+
+    def _finish_engagement_batch(self, jobs: List[Dict], future) -> None:
+        for job in jobs:
+            self._advance(job, ENGAGEMENT_INDEX, future)
+
+    def _run_engagement_batch(self, jobs: List[Dict]) -> None:
+        for job in jobs:
+            job['status'] = 'running'
+            job['stage'] = 'engagement'
+        start = time.time()
+        try:
+            self.pipeline.run_engagement_batch(jobs)
+        finally:
+            for job in jobs:
+                job['timings']['engagement'] = round(time.time() - start, 3)
+
+    def _run_stage(self, job: Dict, stage: str) -> None:
+        job['status'] = 'running'
+        job['stage'] = stage
+        start = time.time()
+        try:
+            self.pipeline.run_stage(job, stage)
+        finally:
+            job['timings'][stage] = round(time.time() - start, 3)
+
+    def summary(self) -> Dict:
+        elapsed = time.time() - self._started_at if self._started_at else 0.0
+        completed = sum(1 for job in self._jobs if job.get('status') == 'completed')
+        failed = sum(1 for job in self._jobs if job.get('status') == 'failed')
+        return {
+            'total': len(self._jobs),
+            'completed': completed,
+            'failed': failed,
+            'elapsed_seconds': round(elapsed, 3),
+            'topics_per_hour': round(completed * 3600 / elapsed, 2) if elapsed > 0 else 0.0,
+            'reused_stages': sum(len(job.get('reused_stages', [])) for job in self._jobs),
+            'degraded': sum(1 for job in self._jobs if job.get('degradations')),
+            'concurrency': self.concurrency,
+        }
+
+    def manifest(self) -> Dict:
+        usage_by_topic = self.token_counter.breakdown('topic')
+        return {
+            'summary': self.summary(),
+            'usage_by_stage': {stage: usage for stage, usage in self.token_counter.breakdown('stage').items() if stage},
+            'topics': [
+                {
+                    'topic': job['topic'],
+                    'audience': job['audience'],
+                    'status': job.get('status'),
+                    'stage': job.get('stage'),
+                    'error': job.get('error'),
+                    'timings': dict(job.get('timings', {})),
+                    'reused_stages': list(job.get('reused_stages', [])),
+                    'degradations': list(job.get('degradations', [])),
+                    'script_ttft': job.get('script_ttft'),
+                    'content_file': job.get('content_file'),
+                    'files': dict(job.get('files', {})),
+                    'compaction': job.get('compaction'),
+                    'usage': usage_by_topic.get(job['topic']),
+                }
+                for job in self._jobs
+            ],
+        }
+
+    def _write_manifest(self) -> None:
+        with self._manifest_lock, span('write', path=self.manifest_path):
+            manifest = self.manifest()
+            tmp_path = f"{self.manifest_path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(manifest, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.manifest_path)
+
+
+def parse_concurrency(values: Optional[List[str]]) -> Dict[str, int]:
+    """Parse `stage=N` command line values into a concurrency mapping."""
+    concurrency = {}
+    for value in values or []:
+        stage, _, count = value.partition('=')
+        if stage not in STAGES or not count.isdigit():
+            raise ValueError(f"Invalid concurrency setting '{value}'. Expected <stage>=<workers> with stage in {STAGES}.")
+        concurrency[stage] = int(count)
+    return concurrency
+
+
+def prefetch_pages(jobs: List[Dict], cache=None, prefetch_links: int = 0) -> None:
+    """
+    Download the pages of all jobs up front with the concurrent bulk fetcher.
+
+    Topics the bulk fetcher could not get are left to the fetch stage, which retries
+    them one by one and records the error in the manifest.
+    """
+    from modules.bulk_fetcher import fetch_many
+
+    topics = [job['topic'] for job in jobs if 'topic_content' not in job]
+    if not topics:
+        return
+    start = time.time()
+    try:
+        results = fetch_many(topics, prefetch_links, cache=cache)
+    except Exception as e:
+        logger.error(f"Bulk fetch failed, fetching pages one by one instead: {e}")
+        return
+    fetched = 0
+    for job in jobs:
+        page = results.get(job['topic'])
+        if 'topic_content' not in job and isinstance(page, dict):
+            job['topic_content'] = page
+            fetched += 1
+    print(f"Bulk fetched {fetched}/{len(topics)} pages in {time.time() - start:.2f} seconds")
+
+
+def run_batch(source: str, output_dir: str = 'output', audience: Optional[str] = None,
+              concurrency: Optional[Dict[str, int]] = None, manifest_path: Optional[str] = None,
+              compact: bool = False, token_budget: Optional[int] = None, top_k: Optional[int] = None,
+              offline: bool = False, bulk_fetch: bool = False, prefetch_links: int = 0, resume: bool = True,
+              fan_out: bool = False, topic_budget: Optional[float] = None, window: Optional[float] = None,
+              stream: bool = True) -> Dict:
+    from modules.wikipedia_fetcher import WikipediaFetcher
+    from modules import content_indexer
+
+    jobs = load_jobs(source, audience)
+    print(f"Loaded {len(jobs)} topics from {source}")
+
+    wikipedia_fetcher = WikipediaFetcher(offline=offline or None)
+    if bulk_fetch and not wikipedia_fetcher.offline:
+        prefetch_pages(jobs, wikipedia_fetcher.cache, prefetch_links)
+
+    token_counter = TokenCounter()
+    runner = BatchRunner(
+        output_dir,
+        token_counter,
+        wikipedia_fetcher=wikipedia_fetcher,
+        indexer=content_indexer.load_index(token_counter),
+        concurrency=concurrency,
+        manifest_path=manifest_path,
+        compact=compact,
+        token_budget=token_budget,
+        top_k=top_k,
+        resume=resume,
+        fan_out=fan_out,
+        topic_budget=topic_budget,
+        window=window,
+        stream=stream,
+    )
+    runner.run(jobs)
+
+    summary = runner.summary()
+    print(f"Batch finished: {summary['completed']} completed, {summary['failed']} failed "
+          f"in {summary['elapsed_seconds']:.2f} seconds ({summary['topics_per_hour']} topics/hour)")
+    if summary['reused_stages']:
+        print(f"Reused {summary['reused_stages']} completed stage outputs from earlier runs")
+    if summary['degraded']:
+        print(f"{summary['degraded']} topics were degraded to meet their deadline (see the manifest)")
+    print(f"Manifest written to {runner.manifest_path}")
+
+    print("\nToken Usage and Cost:")
+    print_token_count(token_counter, config.EMBEDDING_MODEL, config.LLM_MODEL)
+    return summary
@@ -0,0 +1,281 @@
+import asyncio
+import logging
+import random
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+import config
+from modules.page_cache import PageCache, normalize_title
+from modules.wikipedia_fetcher import API_URL, USER_AGENT, format_extract_sections
+
+logger = logging.getLogger(__name__)
+
+# The MediaWiki API accepts up to 50 titles per query for anonymous clients
+MAX_TITLES_PER_QUERY = 50
+
+
+class HTTPStatusError(Exception):
+    def __init__(self, status: int, message: str = '', retry_after: Optional[float] = None):
+        super().__init__(f"HTTP {status}: {message}")
+        self.status = status
+        self.retry_after = retry_after
+
+
+class AiohttpClient:
+    """
+    Pooled aiohttp session used by the bulk fetcher.
+
+    Any object with the same `get_json(url, params)` / `close()` coroutines can be passed
+    to `BulkWikipediaFetcher` instead, e.g. one pointing at a local stub server. Clients
+    raise HTTPStatusError for error responses and ConnectionError or asyncio.TimeoutError
+    for failed requests; the fetcher retries all of them.
+    """
+
+    def __init__(self, user_agent: str = USER_AGENT, pool_size: int = 10, timeout: float = 30.0):
+        self.user_agent = user_agent
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self._session = None
+
+    async def get_json(self, url: str, params: Dict) -> Dict:
+        import aiohttp
+
+        if self._session is None:
+            self._session = aiohttp.ClientSession(
+                headers={'User-Agent': self.user_agent},
+                connector=aiohttp.TCPConnector(limit=self.pool_size),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+        try:
+            async with self._session.get(url, params={k: str(v) for k, v in params.items()}) as response:
+                if response.status >= 400:
+                    retry_after = response.headers.get('Retry-After')
+                    raise HTTPStatusError(response.status, await response.text(),
+                                          float(retry_after) if retry_after and retry_after.isdigit() else None)
+                return await response.json()
+        except aiohttp.ClientError as e:
+            raise ConnectionError(f"{type(e).__name__}: {e}") from e
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+class _RateLimiter:
+    """Spaces request starts at least `1 / requests_per_second` apart."""
+
+    def __init__(self, requests_per_second: float):
+        self.interval = 1.0 / requests_per_second if requests_per_second else 0.0
+        self._next_start = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self) -> None:
+        if not self.interval:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next_start - now
+            self._next_start = max(now, self._next_start) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class BulkWikipediaFetcher:
+    """
+    Fetches many Wikipedia pages concurrently with a polite request rate.
+
+    Titles are resolved (redirects, canonical title, revision, URL) with multi-title
+    queries, pages whose cached revision is current are served from the page cache, and
+    the remaining pages are downloaded as plain-text extracts in parallel. The result for
+    each topic has the same shape as `WikipediaFetcher.fetch_wikipedia_content`.
+    """
+
+    def __init__(self, http_client=None, api_url: str = API_URL, cache: Optional[PageCache] = None,
+                 concurrency: Optional[int] = None, requests_per_second: Optional[float] = None,
+                 max_retries: int = 3):
+        self.http_client = http_client or AiohttpClient()
+        self.api_url = api_url
+        self.cache = cache
+        self.concurrency = concurrency or getattr(config, 'WIKIPEDIA_CONCURRENCY', 4)
+        self.requests_per_second = requests_per_second or getattr(config, 'WIKIPEDIA_REQUESTS_PER_SECOND', 10)
+        self.max_retries = max_retries
+        self._semaphore = None
+        self._rate_limiter = None
+
+    async def _query(self, params: Dict) -> Dict:
+        params = dict(params, action='query', format='json', formatversion=2, maxlag=5)
+        attempt = 0
+        while True:
+            await self._rate_limiter.wait()
+            try:
+                async with self._semaphore:
+                    data = await self.http_client.get_json(self.api_url, params)
+            except HTTPStatusError as e:
+                if e.status not in (429, 500, 502, 503, 504) or attempt >= self.max_retries:
+                    raise
+                delay = e.retry_after if e.retry_after is not None else random.uniform(0, 2 ** attempt)
+                reason = f"HTTP {e.status}"
+            except (ConnectionError, asyncio.TimeoutError) as e:
+                if attempt >= self.max_retries:
+                    raise
+                delay = random.uniform(0, 2 ** attempt)
+                reason = str(e) or type(e).__name__
+            else:
+                if data.get('error', {}).get('code') != 'maxlag':
+                    return data
+                if attempt >= self.max_retries:
+                    raise HTTPStatusError(503, 'Wikipedia replication lag too high')
+                delay = 5.0
+                reason = 'replication lag'
+            logger.warning(f"Wikipedia request failed ({reason}), retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def _resolve_titles(self, topics: List[str]) -> Dict[str, object]:
+        """
+        Map every topic to its canonical title, revision ID and URL: None when the page is
+        missing, or the exception that prevented resolving it.
+        """
+        resolved = {}
+        for start in range(0, len(topics), MAX_TITLES_PER_QUERY):
+            batch = topics[start:start + MAX_TITLES_PER_QUERY]
+            try:
+                data = await self._query({
+                    'titles': '|'.join(batch),
+                    'redirects': 1,
+                    'prop': 'revisions|info',
+                    'rvprop': 'ids',
+                    'inprop': 'url',
+                })
+            except Exception as e:
+                logger.warning(f"Could not resolve {len(batch)} Wikipedia titles: {e}")
+                resolved.update((topic, e) for topic in batch)
+                continue
+            query = data.get('query', {})
+            renames = {item['from']: item['to'] for item in query.get('normalized', [])}
+            redirects = {item['from']: item['to'] for item in query.get('redirects', [])}
+            pages = {page['title']: page for page in query.get('pages', [])}
+            for topic in batch:
+                title = renames.get(topic, topic)
+                title = redirects.get(title, title)
+                page = pages.get(title)
+                if page is None or page.get('missing') or page.get('invalid'):
+                    resolved[topic] = None
+                else:
+                    resolved[topic] = {
+                        'title': page['title'],
+                        'revision_id': page['revisions'][0]['revid'] if page.get('revisions') else None,
+                        'url': page.get('fullurl'),
+                    }
+        return resolved
+
+    async def _fetch_page(self, info: Dict) -> Dict:
+        data = await self._query({
+            'titles': info['title'],
+            'prop': 'extracts',
+            'explaintext': 1,
+            'exsectionformat': 'wiki',
+        })
+        pages = data.get('query', {}).get('pages', [])
+        if not pages or 'extract' not in pages[0]:
+            raise ValueError(f"No Wikipedia page found for '{info['title']}'.")
+        summary, content = format_extract_sections(pages[0]['extract'])
+        return {
+            'title': info['title'],
+            'summary': summary,
+            'content': content,
+            'url': info['url'],
+            'retrieval_date': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'revision_id': info['revision_id'],
+        }
+
+    async def _linked_titles(self, title: str) -> List[str]:
+        links = []
+        params = {'titles': title, 'prop': 'links', 'plnamespace': 0, 'pllimit': 'max'}
+        while True:
+            data = await self._query(params)
+            for page in data.get('query', {}).get('pages', []):
+                links.extend(link['title'] for link in page.get('links', []))
+            if 'continue' not in data or len(links) >= 2000:
+                return links
+            params = dict(params, **data['continue'])
+
+    def _rank_links(self, content: Dict, links: Iterable[str], top_n: int) -> List[str]:
+        # Rank linked pages by how often the article mentions them
+        text = f"{content['summary']}\n{content['content']}".casefold()
+        counts = Counter({link: text.count(link.casefold()) for link in links if link != content['title']})
+        return [link for link, count in counts.most_common(top_n) if count > 0]
+
+    async def _fetch(self, topics: List[str]) -> Dict[str, object]:
+        results = {}
+        resolved = await self._resolve_titles(topics)
+        to_download = {}
+        for topic in topics:
+            info = resolved[topic]
+            if info is None:
+                results[topic] = ValueError(f"No Wikipedia page found for '{topic}'.")
+                continue
+            if isinstance(info, BaseException):
+                results[topic] = info
+                continue
+            cached = self.cache.get(info['title']) if self.cache else None
+            if cached and cached['revision_id'] == info['revision_id'] and cached['title'] == info['title']:
+                self.cache.mark_validated(info['title'], aliases=[topic])
+                results[topic] = cached['content']
+            else:
+                to_download.setdefault(info['title'], (info, []))[1].append(topic)
+
+        pages = await asyncio.gather(*(self._fetch_page(info) for info, _ in to_download.values()),
+                                     return_exceptions=True)
+        for (info, page_topics), page in zip(to_download.values(), pages):
+            if self.cache and not isinstance(page, BaseException):
+                self.cache.put(info['title'], info['revision_id'], page, aliases=page_topics)
+            for topic in page_topics:
+                results[topic] = page
+        return results
+
+    async def fetch_many(self, topics: Iterable[str], prefetch_links: int = 0) -> Dict[str, object]:
+        """
+        Fetch many topics.
+
+        Args:
+            topics (Iterable[str]): Topics or titles to fetch.
+            prefetch_links (int): Number of most-mentioned linked pages of each topic to
+                fetch into the page cache for follow-up videos.
+
+        Returns:
+            Dict: Maps every topic to its page dict, or to the exception that prevented fetching it.
+        """
+        topics = list(dict.fromkeys(topics))
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._rate_limiter = _RateLimiter(self.requests_per_second)
+        try:
+            results = await self._fetch(topics)
+            if prefetch_links and self.cache:
+                fetched = [page for page in results.values() if isinstance(page, dict)]
+                link_lists = await asyncio.gather(*(self._linked_titles(page['title']) for page in fetched),
+                                                  return_exceptions=True)
+                linked = []
+                for page, links in zip(fetched, link_lists):
+                    if not isinstance(links, BaseException):
+                        linked.extend(self._rank_links(page, links, prefetch_links))
+                linked = [title for title in dict.fromkeys(linked)
+                          if normalize_title(title) not in {normalize_title(topic) for topic in topics}]
+                if linked:
+                    logger.info(f"Prefetching {len(linked)} linked pages into the page cache")
+                    try:
+                        await self._fetch(linked)
+                    except Exception as e:
+                        # Linked pages are only a warm-up for follow-up videos
+                        logger.warning(f"Prefetching linked pages failed: {e}")
+            return results
+        finally:
+            await self.http_client.close()
+
+
+def fetch_many(topics: Iterable[str], prefetch_links: int = 0, **kwargs) -> Dict[str, object]:
+    """Synchronous wrapper around `BulkWikipediaFetcher.fetch_many`."""
+    return asyncio.run(BulkWikipediaFetcher(**kwargs).fetch_many(topics, prefetch_links))
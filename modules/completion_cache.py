@@ -0,0 +1,121 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Cache modes: 'use' reads and writes, 'refresh' skips reads but stores fresh results,
+# 'bypass' neither reads nor writes.
+CACHE_MODES = ('use', 'refresh', 'bypass')
+
+
+def completion_cache_key(model: str, prompt: str, max_tokens: int, stop_sequences, temperature) -> str:
+    payload = json.dumps([model, prompt, max_tokens, list(stop_sequences or ()), temperature],
+                         ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class CompletionCache:
+    """
+    Content-addressed on-disk cache of LLM completions.
+
+    Entries live in a SQLite database in WAL mode so several worker processes can share
+    one cache file. Each entry has an optional expiry time, and the least recently used
+    entries are evicted once the stored completions exceed `max_bytes`.
+    """
+
+    def __init__(self, path: str, max_bytes: int = 512 * 1024 * 1024, default_ttl: Optional[float] = None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with self._connection() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS completions (
+                    key TEXT PRIMARY KEY,
+                    model TEXT NOT NULL,
+                    completion TEXT NOT NULL,
+                    stop_reason TEXT,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL,
+                    expires_at REAL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS completions_last_access ON completions (last_access)")
+            # Usage columns were added later; caches created before then get them here
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(completions)")}
+            for column in ('prompt_tokens', 'completion_tokens'):
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE completions ADD COLUMN {column} INTEGER")
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite3 connections must not be shared between threads
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[dict]:
+        now = time.time()
+        conn = self._connection()
+        with conn:
+            row = conn.execute(
+                "SELECT model, completion, stop_reason, prompt_tokens, completion_tokens FROM completions "
+                "WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+                (key, now),
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE completions SET last_access = ? WHERE key = ?", (now, key))
+        return {'model': row[0], 'completion': row[1], 'stop_reason': row[2],
+                'prompt_tokens': row[3], 'completion_tokens': row[4]}
+
+    def put(self, key: str, model: str, completion: str, stop_reason: Optional[str] = None,
+            ttl: Optional[float] = None, prompt_tokens: Optional[int] = None,
+            completion_tokens: Optional[int] = None) -> None:
+        now = time.time()
+        ttl = ttl if ttl is not None else self.default_ttl
+        expires_at = now + ttl if ttl else None
+        size = len(completion.encode('utf-8'))
+        conn = self._connection()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO completions "
+                "(key, model, completion, stop_reason, size, created_at, last_access, expires_at, "
+                "prompt_tokens, completion_tokens) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, model, completion, stop_reason, size, now, now, expires_at, prompt_tokens, completion_tokens),
+            )
+        self.evict()
+
+    def evict(self) -> int:
+        """Drop expired entries, then least recently used ones until the cache fits in `max_bytes`."""
+        conn = self._connection()
+        with conn:
+            removed = conn.execute("DELETE FROM completions WHERE expires_at IS NOT NULL AND expires_at <= ?",
+                                   (time.time(),)).rowcount
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM completions").fetchone()[0]
+            if total <= self.max_bytes:
+                return removed
+            for key, size in conn.execute("SELECT key, size FROM completions ORDER BY last_access").fetchall():
+                if total <= self.max_bytes:
+                    break
+                conn.execute("DELETE FROM completions WHERE key = ?", (key,))
+                total -= size
+                removed += 1
+        logger.info(f"Evicted {removed} completion cache entries")
+        return removed
+
+    def clear(self) -> None:
+        conn = self._connection()
+        with conn:
+            conn.execute("DELETE FROM completions")
@@ -1,14 +1,39 @@
-from typing import Dict, List
-import anthropic
-from anthropic import HUMAN_PROMPT, AI_PROMPT
+import logging
+from typing import Dict, List, Optional, Tuple
 import config
 from modules.token_counter import TokenCounter
-from modules.embeddings import EmbeddingModel
+from modules import llm_gateway
+from modules.llm_gateway import HUMAN_PROMPT, AI_PROMPT
+from modules.embeddings import get_embedding_model
 
-client = anthropic.Anthropic(api_key=config.ANTHROPIC_API_KEY)
-embedding_model = EmbeddingModel()
+logger = logging.getLogger(__name__)
+
+def analyze_content(content: str, query: str, audience: str, token_counter: TokenCounter,
+                    cache_context: Optional[Dict] = None, use_semantic_cache: bool = True) -> Dict:
+    """
+    Analyze `content` for a TikTok video about `query` aimed at `audience`.
+
+    Args:
+        cache_context (Dict): What `content` was built from (page digest, compaction
+            settings), so near-duplicate topics and audiences only reuse an analysis of the
+            same page built the same way. Defaults to a digest of `content` itself.
+        use_semantic_cache (bool): False neither reads nor stores the semantic cache, e.g.
+            for an analysis degraded to meet a deadline.
+    """
+    from modules.artifacts import content_digest
+    from modules.semantic_cache import get_semantic_cache
+
+    # Near-duplicate topics and audiences reuse an earlier analysis instead of calling the LLM
+    cache_context = cache_context if cache_context is not None else {'content': content_digest(content)}
+    cache_mode = llm_gateway.get_gateway().cache_mode
+    semantic_cache = None
+    if use_semantic_cache and cache_mode != 'bypass':
+        semantic_cache = get_semantic_cache(get_embedding_model())
+    if semantic_cache and cache_mode == 'use':
+        cached_analysis = semantic_cache.lookup(query, audience, cache_context)
+        if cached_analysis is not None:
+            return cached_analysis
 
-def analyze_content(content: str, query: str, audience: str, token_counter: TokenCounter) -> Dict:
     prompt = f"""{HUMAN_PROMPT} Analyze the following content about '{query}' for a TikTok video targeted at {audience}:
 
     Content: {content}
@@ -22,22 +47,29 @@ def analyze_content(content: str, query: str, audience: str, token_counter: Toke
 
     """
 
-    token_counter.add_prompt_tokens(len(prompt.split()))  # Simple word count as a token estimate
-
     try:
-        response = client.completions.create(
+        response = llm_gateway.get_gateway().complete(
+            prompt,
+            max_tokens=500,
             model="claude-2.1",
-            prompt=prompt,
-            max_tokens_to_sample=500,
             stop_sequences=[HUMAN_PROMPT],
+            token_counter=token_counter,
         )
-        analysis = response.completion
+        analysis = response.text
+    except llm_gateway.DeadlineExceeded:
+        raise
     except Exception as e:
         raise Exception(f"Error in content analysis: {str(e)}")
 
-    token_counter.add_completion_tokens(len(analysis.split()))  # Simple word count as a token estimate
+    parsed_analysis = parse_analysis(analysis)
+
+    if semantic_cache:
+        semantic_cache.store(query, audience, parsed_analysis, cache_context)
 
-    # Parse the analysis into structured data
+    return parsed_analysis
+
+def parse_analysis(analysis: str) -> Dict:
+    """Parse a numbered five-part analysis (summary, key facts, hooks, simplified content, anecdote) into a dict."""
     lines = analysis.split('\n')
     parsed_analysis = {
         'summary': '',
@@ -65,10 +97,133 @@ def analyze_content(content: str, query: str, audience: str, token_counter: Toke
                 parsed_analysis[current_section] += line + ' '
             else:
                 parsed_analysis[current_section].append(line)
-
     return parsed_analysis
 
+def analyze_content_neutral(content: str, query: str, token_counter: TokenCounter) -> Dict:
+    """
+    Analyze an article once for any audience.
+
+    The result has the same fields as `analyze_content` but more key facts and hooks, so
+    `adapt_analysis` can pick and reword them per audience without the article text.
+    Identical requests are answered from the completion cache.
+    """
+    prompt = f"""{HUMAN_PROMPT} Analyze the following content about '{query}' as source material for short TikTok videos. Several videos for different audiences will be made from your analysis, so keep it audience-neutral:
+
+    Content: {content}
+
+    Provide the following:
+    1. A brief summary (2-3 sentences)
+    2. 8 key facts
+    3. 5 candidate attention-grabbing hooks
+    4. A simplified explanation of any complex concepts
+    5. A short, relatable anecdote or example{AI_PROMPT} Here's my analysis:
+
+    """
+
+    try:
+        response = llm_gateway.get_gateway().complete(
+            prompt,
+            max_tokens=700,
+            model="claude-2.1",
+            stop_sequences=[HUMAN_PROMPT],
+            token_counter=token_counter,
+        )
+    except llm_gateway.DeadlineExceeded:
+        raise
+    except Exception as e:
+        raise Exception(f"Error in neutral content analysis: {str(e)}")
+    return parse_analysis(response.text)
+
+def adapt_analysis(analysis: Dict, query: str, audience: str, token_counter: TokenCounter) -> Dict:
+    """
+    Tailor a neutral analysis from `analyze_content_neutral` to one audience.
+
+    The prompt carries only the analysis, not the article, so each extra audience costs
+    a small fraction of a full analysis.
+    """
+    prompt = f"""{HUMAN_PROMPT} Here is an analysis of '{query}' written for a general audience:
+
+    Summary: {analysis['summary']}
+    Key Facts: {'; '.join(analysis['key_facts'])}
+    Hooks: {'; '.join(analysis['hooks'])}
+    Simplified Content: {analysis['simplified_content']}
+    Anecdote: {analysis['anecdote']}
+
+    Adapt it for a TikTok video targeted at {audience}. Provide the following:
+    1. A brief summary (2-3 sentences)
+    2. The 5 key facts that matter most to this audience
+    3. 3 attention-grabbing hooks in this audience's language
+    4. A simplified explanation of any complex concepts
+    5. A short, relatable anecdote or example for this audience{AI_PROMPT} Here's the adapted analysis:
+
+    """
+
+    try:
+        response = llm_gateway.get_gateway().complete(
+            prompt,
+            max_tokens=500,
+            model="claude-2.1",
+            stop_sequences=[HUMAN_PROMPT],
+            token_counter=token_counter,
+        )
+    except llm_gateway.DeadlineExceeded:
+        raise
+    except Exception as e:
+        raise Exception(f"Error in analysis adaptation: {str(e)}")
+    return parse_analysis(response.text)
+
 def query_index(indexer, query: str, token_counter: TokenCounter) -> List[Dict]:
-    query_embedding = embedding_model.embed([query])[0]
-    token_counter.add_embedding_tokens(len(query.split()))  # Simple word count as a token estimate
-    return indexer.search_index(query_embedding)
\ No newline at end of file
+    token_counter.add_embedding_tokens(token_counter.count_tokens(query))
+    return indexer.search_index(query)
+
+def compact_content(indexer, topic_content: Dict, query: str, audience: str, token_counter: TokenCounter,
+                    token_budget: Optional[int] = None, top_k: Optional[int] = None) -> Tuple[str, Dict]:
+    """
+    Build a compact stand-in for the full article from the lead summary and the chunks
+    of the indexed article that are most relevant to the topic and audience.
+
+    Args:
+        indexer: The ContentIndexer the article has been added to.
+        topic_content (Dict): The fetched article (title, summary, content, ...).
+        query (str): The topic the video is about.
+        audience (str): The target audience.
+        token_counter (TokenCounter): Used for tiktoken-based token counts.
+        token_budget (int): Maximum number of tokens of compacted content.
+        top_k (int): Number of chunks to retrieve from the index.
+
+    Returns:
+        Tuple[str, Dict]: The compacted content and statistics including the compression ratio.
+    """
+    token_budget = token_budget or getattr(config, 'ANALYSIS_TOKEN_BUDGET', 3000)
+    top_k = top_k or getattr(config, 'ANALYSIS_TOP_K', 8)
+
+    retrieval_query = f"{query}: key facts, surprising details and stories for {audience}"
+    token_counter.add_embedding_tokens(token_counter.count_tokens(retrieval_query))
+    chunks = indexer.retrieve_chunks(retrieval_query, top_k, title=topic_content['title'])
+
+    lead = token_counter.truncate_to_tokens(topic_content.get('summary', ''), token_budget)
+    used_tokens = token_counter.count_tokens(lead)
+    selected = []
+    chunk_token_counts = token_counter.count_tokens_batch([chunk['text'] for chunk in chunks])
+    for chunk, chunk_tokens in zip(chunks, chunk_token_counts):  # Highest scoring first
+        if used_tokens + chunk_tokens > token_budget:
+            continue
+        selected.append(chunk)
+        used_tokens += chunk_tokens
+
+    # Keep the selected chunks in article order so the compacted text still reads coherently
+    selected.sort(key=lambda chunk: chunk['start_char_idx'] if chunk['start_char_idx'] is not None else 0)
+    compacted = "\n\n".join([lead] + [chunk['text'] for chunk in selected])
+
+    original_tokens = token_counter.count_tokens(topic_content['content'])
+    compacted_tokens = token_counter.count_tokens(compacted)
+    stats = {
+        'original_tokens': original_tokens,
+        'compacted_tokens': compacted_tokens,
+        'chunks_retrieved': len(chunks),
+        'chunks_used': len(selected),
+        'compression_ratio': round(original_tokens / compacted_tokens, 2) if compacted_tokens else 0.0,
+    }
+    logger.info(f"Compacted '{query}' from {original_tokens} to {compacted_tokens} tokens "
+                f"({stats['compression_ratio']}x, {len(selected)}/{len(chunks)} chunks)")
+    return compacted, stats
\ No newline at end of file
@@ -1,8 +1,10 @@
 import logging
-from typing import List, Dict
+import threading
+from typing import List, Dict, Optional, Union
 from llama_index.core import Document
 from modules.vector_store import VectorStore
 from modules.token_counter import TokenCounter
+from modules.page_cache import normalize_title
 
 logger = logging.getLogger(__name__)
 
@@ -10,26 +12,47 @@ class ContentIndexer:
     def __init__(self, token_counter: TokenCounter):
         self.vector_store = VectorStore()
         self.token_counter = token_counter
+        # The ingestion pipeline is not safe for concurrent runs
+        self._lock = threading.Lock()
 
-    def create_index(self, documents: List[Dict]) -> None:
+    @staticmethod
+    def _to_llama_document(document: Dict) -> Document:
+        # A stable ID per article lets the vector store recognise re-indexed and updated articles
+        return Document(id_=normalize_title(document['title']), text=document['content'],
+                        metadata={'title': document['title'], 'url': document['url']})
+
+    def _add_documents(self, documents: List[Dict]) -> Dict:
+        with self._lock:
+            stats = self.vector_store.add_documents([self._to_llama_document(doc) for doc in documents])
+        if stats['embedded_texts']:
+            self.token_counter.add_embedding_tokens(sum(self.token_counter.count_tokens_batch(stats['embedded_texts'])))
+        return stats
+
+    def create_index(self, documents: List[Dict]) -> Dict:
         logger.info(f'Creating index from {len(documents)} documents')
-        llama_docs = [Document(text=doc['content'], metadata={'title': doc['title'], 'url': doc['url']}) for doc in documents]
-        self.vector_store.add_documents(llama_docs)
-        for doc in documents:
-            self.token_counter.add_embedding_tokens(self.token_counter.count_tokens(doc['content']))
+        return self._add_documents(documents)
 
-    def add_document_to_index(self, document: Dict) -> None:
+    def add_document_to_index(self, document: Dict) -> Dict:
         logger.info('Adding single document to index')
-        llama_doc = Document(text=document['content'], metadata={'title': document['title'], 'url': document['url']})
-        self.vector_store.add_documents([llama_doc])
-        self.token_counter.add_embedding_tokens(self.token_counter.count_tokens(document['content']))
+        return self._add_documents([document])
+
+    def search_index(self, queries: Union[str, List[str]], top_k: int = 5, filters: Optional[Dict] = None,
+                     mode: Optional[str] = None):
+        return self.vector_store.search(queries, top_k, filters, mode)
+
+    def synthesize_answer(self, query: str, top_k: int = 5, filters: Optional[Dict] = None):
+        return self.vector_store.synthesize(query, top_k, filters)
 
-    def search_index(self, query: str, top_k: int = 5):
-        return self.vector_store.search(query, top_k)
+    def retrieve_chunks(self, query: str, top_k: int = 5, title: Optional[str] = None) -> List[Dict]:
+        chunks = self.vector_store.search(query, top_k, {'title': title} if title else None)
+        for chunk in chunks:
+            chunk['section'] = chunk['metadata'].get('section')
+        return chunks
 
     def clear_index(self) -> None:
         logger.info('Clearing index')
-        self.vector_store.clear()
+        with self._lock:
+            self.vector_store.clear()
 
 def create_index(documents: List[Dict], token_counter: TokenCounter) -> ContentIndexer:
     indexer = ContentIndexer(token_counter)
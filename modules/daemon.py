@@ -0,0 +1,188 @@
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib import error as urllib_error
+from urllib import request as urllib_request
+
+import config
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HOST = getattr(config, 'DAEMON_HOST', '127.0.0.1')
+DEFAULT_PORT = getattr(config, 'DAEMON_PORT', 8765)
+
+
+class GeneratorDaemon:
+    """
+    Long-lived generator process that keeps models, the Qdrant connection and caches warm.
+
+    Jobs are run through a BatchRunner that shares this daemon's fetcher, index and token
+    counter, so a request only pays for its own network round-trips.
+    """
+
+    def __init__(self, output_dir: str = 'output', offline: bool = False):
+        from modules.token_counter import TokenCounter
+        from modules.wikipedia_fetcher import WikipediaFetcher
+        from modules import content_indexer
+
+        self.output_dir = output_dir
+        self.manifest_dir = os.path.join(output_dir, 'daemon')
+        os.makedirs(self.manifest_dir, exist_ok=True)
+        self.token_counter = TokenCounter()
+        self.wikipedia_fetcher = WikipediaFetcher(offline=offline or None)
+        self.indexer = content_indexer.load_index(self.token_counter)
+        self.started_at = time.time()
+        self.jobs_completed = 0
+        self._lock = threading.Lock()
+
+    def warm_up(self) -> None:
+        from modules import content_analyzer, script_generator, llm_gateway
+        from modules.embeddings import get_embedding_model
+
+        start = time.time()
+        get_embedding_model().model
+        llm_gateway.get_gateway()
+        print(f"Daemon warm-up completed in {time.time() - start:.2f} seconds")
+
+    def run_jobs(self, jobs: List[Dict], concurrency: Optional[Dict[str, int]] = None, compact: bool = False,
+                 token_budget: Optional[int] = None, top_k: Optional[int] = None, resume: bool = True,
+                 fan_out: bool = False, topic_budget: Optional[float] = None, window: Optional[float] = None,
+                 stream: bool = True) -> Dict:
+        """Run jobs with the same options as a local batch run (see `batch.run_batch`)."""
+        from modules.batch import BatchRunner
+
+        manifest_path = os.path.join(
+            self.manifest_dir, f"manifest_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}.json")
+        runner = BatchRunner(
+            self.output_dir,
+            self.token_counter,
+            wikipedia_fetcher=self.wikipedia_fetcher,
+            indexer=self.indexer,
+            concurrency=concurrency,
+            manifest_path=manifest_path,
+            compact=compact,
+            token_budget=token_budget,
+            top_k=top_k,
+            resume=resume,
+            fan_out=fan_out,
+            topic_budget=topic_budget,
+            window=window,
+            stream=stream,
+        )
+        runner.run(jobs)
+        with self._lock:
+            self.jobs_completed += len(jobs)
+        manifest = runner.manifest()
+        manifest['manifest_file'] = manifest_path
+        return manifest
+
+    def stats(self) -> Dict:
+        from modules import llm_gateway
+
+        return {
+            'uptime_seconds': round(time.time() - self.started_at, 3),
+            'jobs_completed': self.jobs_completed,
+            'embedding_tokens': self.token_counter.total_embedding_token_count,
+            'prompt_tokens': self.token_counter.prompt_llm_token_count,
+            'completion_tokens': self.token_counter.completion_llm_token_count,
+            'cache_hits': self.token_counter.cache_hits,
+            'cache_misses': self.token_counter.cache_misses,
+            'cost': self.token_counter.costs(),
+            'usage_by_stage': {stage: usage for stage, usage in self.token_counter.breakdown('stage').items() if stage},
+            'gateway': dict(llm_gateway.get_gateway().stats),
+        }
+
+
+class _DaemonRequestHandler(BaseHTTPRequestHandler):
+    generator = None
+
+    def _send_json(self, status: int, body: Dict) -> None:
+        payload = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        if self.path == '/health':
+            self._send_json(200, {'status': 'ok'})
+        elif self.path == '/stats':
+            self._send_json(200, self.generator.stats())
+        else:
+            self._send_json(404, {'error': f'Unknown path {self.path}'})
+
+    def do_POST(self):
+        if self.path != '/jobs':
+            self._send_json(404, {'error': f'Unknown path {self.path}'})
+            return
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            jobs = body['jobs']
+            if not jobs or not all(job.get('topic') and job.get('audience') for job in jobs):
+                raise ValueError("Every job needs a topic and an audience.")
+        except (ValueError, KeyError) as e:
+            self._send_json(400, {'error': f'Invalid job request: {e}'})
+            return
+        try:
+            manifest = self.generator.run_jobs(
+                jobs,
+                concurrency=body.get('concurrency'),
+                compact=body.get('compact', False),
+                token_budget=body.get('token_budget'),
+                top_k=body.get('top_k'),
+                resume=body.get('resume', True),
+                fan_out=body.get('fan_out', False),
+                topic_budget=body.get('topic_budget'),
+                window=body.get('window'),
+                stream=body.get('stream', True),
+            )
+        except Exception as e:
+            logger.exception('Daemon job failed')
+            self._send_json(500, {'error': str(e)})
+            return
+        self._send_json(200, manifest)
+
+    def log_message(self, format, *args):
+        logger.info("%s - %s", self.address_string(), format % args)
+
+
+def serve(host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, output_dir: str = 'output',
+          offline: bool = False) -> None:
+    daemon = GeneratorDaemon(output_dir, offline=offline)
+    daemon.warm_up()
+    handler = type('DaemonRequestHandler', (_DaemonRequestHandler,), {'generator': daemon})
+    server = ThreadingHTTPServer((host, port), handler)
+    print(f"Wikipedia TikTok Generator daemon listening on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("Shutting down daemon")
+    finally:
+        server.server_close()
+
+
+def submit_jobs(jobs: List[Dict], host: str = DEFAULT_HOST, port: int = DEFAULT_PORT,
+                timeout: Optional[float] = None, **options) -> Dict:
+    """
+    Send jobs to a running daemon and wait for the resulting manifest.
+
+    Only the standard library is used here so the client starts instantly.
+    """
+    body = dict(options, jobs=jobs)
+    req = urllib_request.Request(
+        f"http://{host}:{port}/jobs",
+        data=json.dumps(body, ensure_ascii=False).encode('utf-8'),
+        headers={'Content-Type': 'application/json'},
+        method='POST',
+    )
+    try:
+        with urllib_request.urlopen(req, timeout=timeout) as response:
+            return json.loads(response.read())
+    except urllib_error.HTTPError as e:
+        raise RuntimeError(f"Daemon rejected the jobs: {e.read().decode('utf-8', 'replace')}") from e
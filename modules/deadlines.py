@@ -0,0 +1,108 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+import config
+
+logger = logging.getLogger(__name__)
+
+# Seconds each stage may take for one topic. LLM calls of a stage are cancelled when
+# its budget or the topic's deadline runs out; fetch and index are not interruptible
+# and only count against the topic deadline.
+DEFAULT_STAGE_BUDGETS = {
+    'fetch': 30.0,
+    'index': 60.0,
+    'analyze': 120.0,
+    'script': 60.0,
+    'engagement': 60.0,
+}
+
+# Stages that may be skipped when time runs short. A skipped stage has no stored output,
+# so it runs the next time the topic is resumed.
+DEFERRABLE_STAGES = ('engagement',)
+
+_local = threading.local()
+
+
+def current_deadline() -> Optional[float]:
+    """The `time.monotonic()` deadline of the work running on this thread, or None."""
+    return getattr(_local, 'deadline', None)
+
+
+@contextmanager
+def deadline_scope(deadline: Optional[float]):
+    """Run the block with `deadline` (a `time.monotonic()` value), keeping any earlier, tighter deadline."""
+    previous = current_deadline()
+    if deadline is not None and previous is not None:
+        deadline = min(deadline, previous)
+    _local.deadline = deadline if deadline is not None else previous
+    try:
+        yield
+    finally:
+        _local.deadline = previous
+
+
+class DeadlineScheduler:
+    """
+    Gives every topic a time budget and its stages a share of it.
+
+    A topic's clock starts at its first stage. Each stage runs with a deadline of its
+    own budget or the topic's remaining time, whichever ends first. When the time left
+    is short the scheduler degrades work instead of letting the topic overrun: the
+    analysis gets a smaller content token budget, and deferrable stages (engagement)
+    are skipped. Every degradation is recorded on the job.
+    """
+
+    def __init__(self, topic_budget: Optional[float] = None, stage_budgets: Optional[Dict[str, float]] = None,
+                 window_end: Optional[float] = None, min_analysis_tokens: int = 500):
+        """
+        Args:
+            topic_budget (float): Seconds per topic (config.TOPIC_TIME_BUDGET, default 300).
+            stage_budgets (Dict[str, float]): Seconds per stage, merged over DEFAULT_STAGE_BUDGETS
+                and config.STAGE_TIME_BUDGETS.
+            window_end (float): `time.monotonic()` time by which every topic must finish,
+                e.g. the end of a batch window.
+            min_analysis_tokens (int): Smallest content token budget a shrunk analysis gets.
+        """
+        self.topic_budget = topic_budget or getattr(config, 'TOPIC_TIME_BUDGET', 300.0)
+        self.stage_budgets = dict(DEFAULT_STAGE_BUDGETS)
+        self.stage_budgets.update(getattr(config, 'STAGE_TIME_BUDGETS', {}))
+        self.stage_budgets.update(stage_budgets or {})
+        self.window_end = window_end
+        self.min_analysis_tokens = min_analysis_tokens
+
+    def topic_deadline(self, job: Dict) -> float:
+        if 'deadline' not in job:
+            deadline = time.monotonic() + self.topic_budget
+            job['deadline'] = min(deadline, self.window_end) if self.window_end is not None else deadline
+        return job['deadline']
+
+    def remaining(self, job: Dict) -> float:
+        return self.topic_deadline(job) - time.monotonic()
+
+    def stage_deadline(self, job: Dict, stage: str) -> float:
+        return min(self.topic_deadline(job), time.monotonic() + self.stage_budgets.get(stage, self.topic_budget))
+
+    def should_defer(self, job: Dict, stage: str) -> bool:
+        """Whether a deferrable stage should be skipped because its budget no longer fits."""
+        return stage in DEFERRABLE_STAGES and self.remaining(job) < self.stage_budgets.get(stage, 0.0)
+
+    def analysis_token_budget(self, job: Dict, default_budget: int) -> Optional[int]:
+        """
+        A reduced content token budget for the analysis when the time left does not
+        cover the analysis, script and engagement budgets, or None when no reduction
+        is needed. The budget shrinks in proportion to the time left.
+        """
+        needed = sum(self.stage_budgets.get(stage, 0.0) for stage in ('analyze', 'script', 'engagement'))
+        remaining = self.remaining(job)
+        if remaining >= needed:
+            return None
+        return max(self.min_analysis_tokens, int(default_budget * max(remaining, 0.0) / needed))
+
+    def record(self, job: Dict, stage: str, action: str, reason: str, **details) -> None:
+        """Record a degradation on the job, e.g. ('engagement', 'deferred', 'budget exhausted')."""
+        degradation = {'stage': stage, 'action': action, 'reason': reason, **details}
+        job.setdefault('degradations', []).append(degradation)
+        logger.warning(f"'{job['topic']}' ({job['audience']}): {stage} {action} ({reason})")
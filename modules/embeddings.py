@@ -1,12 +1,207 @@
-from sentence_transformers import SentenceTransformer
-import torch
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import List, Optional
 import config
 
+INFERENCE_BACKENDS = ('torch', 'int8', 'onnx')
+
+
+def _load_sentence_transformer(model_name: str, backend: str = 'torch', threads: Optional[int] = None):
+    """
+    Load a SentenceTransformer for inference.
+
+    Args:
+        model_name (str): Hugging Face model name.
+        backend (str): 'torch' (fp32, GPU when available), 'int8' (dynamically quantized
+            Linear layers, CPU) or 'onnx' (ONNX Runtime export, CPU).
+        threads (int): Intra-op CPU threads; None keeps the library default.
+
+    Returns:
+        Tuple: (model, device)
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    if backend not in INFERENCE_BACKENDS:
+        raise ValueError(f"Unknown embedding backend '{backend}'. Expected one of {', '.join(INFERENCE_BACKENDS)}.")
+    if threads:
+        torch.set_num_threads(threads)
+    if backend == 'onnx':
+        return SentenceTransformer(model_name, device='cpu', backend='onnx'), torch.device('cpu')
+    if backend == 'int8':
+        model = SentenceTransformer(model_name, device='cpu')
+        return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8), torch.device('cpu')
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    return SentenceTransformer(model_name).to(device), device
+
+
+def _length_buckets(texts: List[str], batch_size: int) -> List[List[int]]:
+    """Group text indices into batches of similar length, so little of each batch is padding."""
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+    return [order[start:start + batch_size] for start in range(0, len(order), batch_size)]
+
+
+def _encode_bucketed(model, device, texts: List[str], batch_size: int, normalize: bool, dtype: str):
+    import numpy as np
+
+    output = None
+    for batch in _length_buckets(texts, batch_size):
+        vectors = model.encode([texts[i] for i in batch], batch_size=len(batch), device=device,
+                               normalize_embeddings=normalize, convert_to_numpy=True)
+        if output is None:
+            output = np.empty((len(texts), vectors.shape[1]), dtype=dtype)
+        output[batch] = vectors
+    return output
+
+
+# State of embedding worker processes
+_worker_model = None
+_worker_device = None
+
+
+def _init_worker(model_name: str, backend: str, threads: Optional[int]) -> None:
+    global _worker_model, _worker_device
+    _worker_model, _worker_device = _load_sentence_transformer(model_name, backend, threads)
+
+
+def _encode_in_worker(texts: List[str], batch_size: int, normalize: bool, dtype: str):
+    return _encode_bucketed(_worker_model, _worker_device, texts, batch_size, normalize, dtype)
+
+
 class EmbeddingModel:
-    def __init__(self):
-        self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-        self.model = SentenceTransformer(config.HUGGINGFACE_MODEL_NAME).to(self.device)
-        print(f"Using device: {self.device}")
+    """
+    Sentence-transformer wrapper that loads its weights on first use.
+
+    Use `get_embedding_model()` instead of constructing this directly so the whole
+    process shares one copy of the weights.
+
+    Inputs are sorted by length and encoded in buckets of `batch_size` similar-length
+    texts, and results are returned as one contiguous float32 (or float16) NumPy array.
+    Large inputs (at least `process_min_texts` texts) are split into length-sorted
+    shards and encoded by a pool of `processes` worker processes, each with its own copy
+    of the model and `threads // processes` threads.
+    """
+
+    def __init__(self, model_name: Optional[str] = None, backend: Optional[str] = None,
+                 batch_size: Optional[int] = None, threads: Optional[int] = None, dtype: Optional[str] = None,
+                 processes: Optional[int] = None, process_min_texts: Optional[int] = None):
+        self.model_name = model_name or config.HUGGINGFACE_MODEL_NAME
+        self.backend = backend or getattr(config, 'EMBEDDING_BACKEND', 'torch')
+        self.batch_size = batch_size or getattr(config, 'EMBEDDING_BATCH_SIZE', 64)
+        self.threads = threads or getattr(config, 'EMBEDDING_THREADS', None)
+        self.dtype = dtype or getattr(config, 'EMBEDDING_DTYPE', 'float32')
+        self.processes = processes if processes is not None else getattr(config, 'EMBEDDING_PROCESSES', 0)
+        self.process_min_texts = process_min_texts or getattr(config, 'EMBEDDING_PROCESS_MIN_TEXTS', 2000)
+        if self.dtype not in ('float32', 'float16'):
+            raise ValueError(f"Unsupported embedding dtype '{self.dtype}'. Expected 'float32' or 'float16'.")
+        self.device = None
+        self._model = None
+        self._llama_embedding = None
+        self._executor = None
+        self._process_pool = None
+        self._load_lock = threading.Lock()
+        self._encode_lock = threading.Lock()
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._load_lock:
+                if self._model is None:
+                    self._model, self.device = _load_sentence_transformer(self.model_name, self.backend, self.threads)
+                    print(f"Using device: {self.device} ({self.backend})")
+        return self._model
+
+    def _get_process_pool(self):
+        with self._load_lock:
+            if self._process_pool is None:
+                import multiprocessing
+                from concurrent.futures import ProcessPoolExecutor
+
+                threads = max(1, (self.threads or multiprocessing.cpu_count()) // self.processes)
+                self._process_pool = ProcessPoolExecutor(
+                    max_workers=self.processes,
+                    # Forked children would inherit torch's thread pools in an unusable state
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init_worker,
+                    initargs=(self.model_name, self.backend, threads),
+                )
+        return self._process_pool
+
+    def _embed_sharded(self, texts: List[str], normalize: bool):
+        import numpy as np
+
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        shard_size = -(-len(order) // (self.processes * 4))
+        shards = [order[start:start + shard_size] for start in range(0, len(order), shard_size)]
+        pool = self._get_process_pool()
+        futures = [pool.submit(_encode_in_worker, [texts[i] for i in shard], self.batch_size, normalize, self.dtype)
+                   for shard in shards]
+        output = None
+        for shard, future in zip(shards, futures):
+            vectors = future.result()
+            if output is None:
+                output = np.empty((len(texts), vectors.shape[1]), dtype=self.dtype)
+            output[shard] = vectors
+        return output
+
+    def embed(self, texts, normalize: bool = False):
+        """
+        Embed texts.
+
+        Args:
+            texts (List[str]): Texts to embed.
+            normalize (bool): L2-normalize the embeddings.
+
+        Returns:
+            numpy.ndarray: C-contiguous array of shape (len(texts), dim) in the configured dtype.
+        """
+        texts = list(texts)
+        if self.processes > 1 and len(texts) >= self.process_min_texts:
+            return self._embed_sharded(texts, normalize)
+        model = self.model
+        with self._encode_lock:
+            if not texts:
+                import numpy as np
+                return np.empty((0, model.get_sentence_embedding_dimension()), dtype=self.dtype)
+            return _encode_bucketed(model, self.device, texts, self.batch_size, normalize, self.dtype)
+
+    def embed_async(self, texts, normalize: bool = False) -> Future:
+        """Run `embed` on a background thread and return a future for the result."""
+        with self._load_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='embedding')
+        return self._executor.submit(self.embed, texts, normalize)
+
+    def as_llama_embedding(self):
+        """Return a llama-index embed model backed by this instance's weights."""
+        if self._llama_embedding is None:
+            from modules.llama_embedding import SharedEmbedding
+            self._llama_embedding = SharedEmbedding(self)
+        return self._llama_embedding
+
+    def close(self) -> None:
+        """Shut down the embedding worker processes, if any were started."""
+        with self._load_lock:
+            if self._process_pool is not None:
+                self._process_pool.shutdown()
+                self._process_pool = None
+
+
+_models = {}
+_models_lock = threading.Lock()
+
+
+def get_embedding_model(model_name: Optional[str] = None) -> EmbeddingModel:
+    """Return the process-wide EmbeddingModel for `model_name` (default: config.HUGGINGFACE_MODEL_NAME)."""
+    model_name = model_name or config.HUGGINGFACE_MODEL_NAME
+    with _models_lock:
+        if model_name not in _models:
+            _models[model_name] = EmbeddingModel(model_name)
+        return _models[model_name]
+
 
-    def embed(self, texts):
-        return self.model.encode(texts, device=self.device).tolist()
\ No newline at end of file
+def set_embedding_model(model, model_name: Optional[str] = None) -> None:
+    """Register `model` as the process-wide embedding model for `model_name`, e.g. a lightweight stand-in in benchmarks."""
+    model_name = model_name or config.HUGGINGFACE_MODEL_NAME
+    with _models_lock:
+        _models[model_name] = model
@@ -0,0 +1,293 @@
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+PROFILERS = ('cprofile', 'pyinstrument')
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Linearly interpolated percentile (q in 0..100) of a list of numbers."""
+    if not values:
+        return 0.0
+    values = sorted(values)
+    position = (len(values) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+class Span:
+    """A timed operation. Attributes set while it is open are written with it when it ends."""
+
+    __slots__ = ('id', 'parent_id', 'name', 'attributes', 'start', '_started')
+
+    def __init__(self, name: str, parent: Optional['Span'], attributes: Dict):
+        self.id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.id if parent else None
+        self.name = name
+        # topic and stage are inherited, so spans deep inside a stage can be grouped by them
+        self.attributes = {key: parent.attributes[key] for key in ('topic', 'stage')
+                           if parent and key in parent.attributes}
+        self.attributes.update(attributes)
+        self.start = time.time()
+        self._started = time.perf_counter()
+
+    def set(self, **attributes) -> None:
+        self.attributes.update(attributes)
+
+    def add(self, **amounts) -> None:
+        """Add to numeric attributes, e.g. tokens or cache hits accumulated inside the span."""
+        for key, amount in amounts.items():
+            self.attributes[key] = self.attributes.get(key, 0) + amount
+
+
+class _NullSpan:
+    def set(self, **attributes) -> None:
+        pass
+
+    def add(self, **amounts) -> None:
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Tracer:
+    """
+    Writes timing spans and resource samples of a run as JSON lines.
+
+    Spans nest per thread, so each record carries its parent's ID. When psutil is
+    installed, a background thread samples the process RSS and CPU usage every
+    `sample_interval` seconds; the latest sample is also attached to every span.
+    """
+
+    def __init__(self, path: str, sample_interval: Optional[float] = 1.0, run_id: Optional[str] = None):
+        self.path = path
+        self.run_id = run_id or uuid.uuid4().hex[:12]
+        self.sample_interval = sample_interval
+        self.peak_rss = 0
+        self._durations = {}
+        self._last_sample = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._file = open(path, 'a', encoding='utf-8', buffering=1)
+        self._stop = threading.Event()
+        self._sampler = None
+        if sample_interval:
+            self._start_sampler()
+
+    def _write(self, record: Dict) -> None:
+        line = json.dumps(record, ensure_ascii=False, default=str)
+        with self._lock:
+            if not self._file.closed:
+                self._file.write(line + '\n')
+
+    def _start_sampler(self) -> None:
+        try:
+            import psutil
+        except ImportError:
+            logger.warning("psutil is not installed; tracing without resource samples")
+            return
+        process = psutil.Process()
+        process.cpu_percent()  # The first call only sets the baseline
+
+        def sample():
+            while not self._stop.wait(self.sample_interval):
+                memory = process.memory_info()
+                self._last_sample = {'rss_mb': round(memory.rss / 1048576, 1), 'cpu_percent': process.cpu_percent()}
+                self.peak_rss = max(self.peak_rss, memory.rss)
+                self._write({'type': 'sample', 'run_id': self.run_id, 'ts': time.time(),
+                             'threads': process.num_threads(), **self._last_sample})
+
+        self._sampler = threading.Thread(target=sample, name='trace-sampler', daemon=True)
+        self._sampler.start()
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        current = Span(name, stack[-1] if stack else None, attributes)
+        stack.append(current)
+        error = None
+        try:
+            yield current
+        except BaseException as e:
+            error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            stack.pop()
+            duration = time.perf_counter() - current._started
+            with self._lock:
+                self._durations.setdefault(name, []).append(duration)
+            record = {'type': 'span', 'run_id': self.run_id, 'id': current.id, 'parent_id': current.parent_id,
+                      'name': name, 'start': current.start, 'duration': round(duration, 6),
+                      'thread': threading.current_thread().name, **current.attributes, **self._last_sample}
+            if error:
+                record['error'] = error
+            self._write(record)
+
+    def event(self, name: str, **attributes) -> None:
+        """Write a point-in-time record, e.g. a run summary."""
+        self._write({'type': 'event', 'run_id': self.run_id, 'name': name, 'ts': time.time(), **attributes})
+
+    def summary(self) -> Dict[str, Dict]:
+        """Count, total, p50, p95 and max seconds per span name for this run."""
+        with self._lock:
+            durations = {name: list(values) for name, values in self._durations.items()}
+        return {name: _summarize(values) for name, values in durations.items()}
+
+    def close(self) -> None:
+        self._stop.set()
+        if self._sampler is not None:
+            self._sampler.join()
+        self.event('run_summary', spans=self.summary(), peak_rss_mb=round(self.peak_rss / 1048576, 1))
+        with self._lock:
+            self._file.close()
+
+
+class NullTracer:
+    """Tracer used when tracing is off; spans cost one context manager and nothing is written."""
+
+    path = None
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        yield _NULL_SPAN
+
+    def event(self, name: str, **attributes) -> None:
+        pass
+
+    def summary(self) -> Dict[str, Dict]:
+        return {}
+
+    def close(self) -> None:
+        pass
+
+
+def _summarize(durations: List[float]) -> Dict:
+    return {
+        'count': len(durations),
+        'total': round(sum(durations), 3),
+        'p50': round(percentile(durations, 50), 4),
+        'p95': round(percentile(durations, 95), 4),
+        'max': round(max(durations), 4),
+    }
+
+
+_tracer = NullTracer()
+_tracer_lock = threading.Lock()
+
+
+def get_tracer():
+    return _tracer
+
+
+def span(name: str, **attributes):
+    """Open a span on the process-wide tracer (a no-op unless tracing was started)."""
+    return _tracer.span(name, **attributes)
+
+
+def start_tracing(path: Optional[str] = None, sample_interval: Optional[float] = None) -> Tracer:
+    """
+    Start writing a JSON-lines trace for this run.
+
+    Args:
+        path (str): Trace file. Defaults to a timestamped file in config.TRACE_DIR (output/traces).
+        sample_interval (float): Seconds between RSS/CPU samples (config.TRACE_SAMPLE_INTERVAL, default 1).
+    """
+    global _tracer
+    import config
+
+    if not path:
+        trace_dir = getattr(config, 'TRACE_DIR', os.path.join('output', 'traces'))
+        path = os.path.join(trace_dir, f"trace_{time.strftime('%Y%m%d_%H%M%S')}.jsonl")
+    if sample_interval is None:
+        sample_interval = getattr(config, 'TRACE_SAMPLE_INTERVAL', 1.0)
+    with _tracer_lock:
+        _tracer.close()
+        _tracer = Tracer(path, sample_interval)
+    return _tracer
+
+
+def stop_tracing() -> Dict[str, Dict]:
+    """Close the trace file and return the per-span summary of the run."""
+    global _tracer
+    with _tracer_lock:
+        summary = _tracer.summary()
+        _tracer.close()
+        _tracer = NullTracer()
+    return summary
+
+
+def aggregate_traces(paths: Iterable[str], group_by: str = 'name') -> Dict[str, Dict]:
+    """
+    Aggregate span durations of one or more trace files.
+
+    Args:
+        paths (Iterable[str]): JSON-lines trace files.
+        group_by (str): Span field to group by, e.g. 'name', 'stage' or 'topic'.
+
+    Returns:
+        Dict: Count, total, p50, p95 and max seconds per group.
+    """
+    durations = {}
+    for path in paths:
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                record = json.loads(line)
+                if record.get('type') == 'span':
+                    durations.setdefault(str(record.get(group_by)), []).append(record['duration'])
+    return {group: _summarize(values) for group, values in durations.items()}
+
+
+def print_span_summary(summary: Dict[str, Dict]) -> None:
+    print(f"{'span':<24}{'count':>8}{'total s':>10}{'p50 s':>10}{'p95 s':>10}{'max s':>10}")
+    for name, stats in sorted(summary.items(), key=lambda item: item[1]['total'], reverse=True):
+        print(f"{name:<24}{stats['count']:>8}{stats['total']:>10.2f}{stats['p50']:>10.3f}"
+              f"{stats['p95']:>10.3f}{stats['max']:>10.3f}")
+
+
+@contextmanager
+def profiling(profiler: Optional[str], output_path: str):
+    """
+    Profile the enclosed block with cProfile or pyinstrument.
+
+    cProfile statistics are written to `output_path` + '.prof' (open with pstats or
+    snakeviz); pyinstrument writes an HTML report to `output_path` + '.html'.
+    """
+    if not profiler:
+        yield
+        return
+    if profiler not in PROFILERS:
+        raise ValueError(f"Unknown profiler '{profiler}'. Expected one of {', '.join(PROFILERS)}.")
+    os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+    if profiler == 'cprofile':
+        import cProfile
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            profile.dump_stats(f"{output_path}.prof")
+            print(f"Profile written to {output_path}.prof")
+    else:
+        from pyinstrument import Profiler
+        profile = Profiler()
+        profile.start()
+        try:
+            yield
+        finally:
+            profile.stop()
+            with open(f"{output_path}.html", 'w', encoding='utf-8') as f:
+                f.write(profile.output_html())
+            print(f"Profile written to {output_path}.html")
@@ -0,0 +1,180 @@
+import json
+import logging
+import math
+import re
+import sqlite3
+import threading
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+# Very common English words carry no ranking signal and make up most postings
+STOPWORDS = frozenset((
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'has', 'he', 'in', 'is', 'it', 'its',
+    'of', 'on', 'or', 'that', 'the', 'to', 'was', 'were', 'which', 'with',
+))
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased word tokens without stopwords. Numbers such as years are kept as tokens."""
+    return [token for token in TOKEN_RE.findall(text.casefold()) if token not in STOPWORDS]
+
+
+def reciprocal_rank_fusion(rankings: Iterable[Sequence[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """
+    Fuse several rankings of IDs with reciprocal-rank fusion.
+
+    Every ranking contributes 1 / (k + rank) for each ID it contains, so IDs ranked
+    highly by several retrievers come first without having to calibrate their scores.
+
+    Returns:
+        List[Tuple[str, float]]: (ID, fused score) pairs, best first.
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, item_id in enumerate(ranking, start=1):
+            scores[item_id] = scores.get(item_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+class LexicalIndex:
+    """
+    Incrementally updated BM25 index over chunk texts, stored in SQLite.
+
+    Terms are interned to integer IDs and postings are kept as (term, chunk, term
+    frequency) rows in a WITHOUT ROWID table clustered by term, so a query reads only
+    the postings of its terms. Document frequencies, the chunk count and the total
+    chunk length are updated as chunks are added and deleted, so no rebuild is needed.
+    """
+
+    def __init__(self, path: str, k1: float = 1.2, b: float = 0.75):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript("""
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS terms (id INTEGER PRIMARY KEY, term TEXT NOT NULL UNIQUE, df INTEGER NOT NULL);
+            CREATE TABLE IF NOT EXISTS chunks (id INTEGER PRIMARY KEY, chunk_id TEXT NOT NULL UNIQUE,
+                                               length INTEGER NOT NULL, metadata TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS postings (term_id INTEGER NOT NULL, chunk INTEGER NOT NULL, tf INTEGER NOT NULL,
+                                                 PRIMARY KEY (term_id, chunk)) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS postings_chunk ON postings (chunk);
+            CREATE TABLE IF NOT EXISTS stats (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+            INSERT OR IGNORE INTO stats (key, value) VALUES ('chunks', 0), ('total_length', 0);
+        """)
+        self._db.commit()
+
+    def _term_ids(self, terms: Iterable[str]) -> Dict[str, int]:
+        terms = list(terms)
+        self._db.executemany("INSERT OR IGNORE INTO terms (term, df) VALUES (?, 0)", [(term,) for term in terms])
+        ids = {}
+        for start in range(0, len(terms), 500):
+            batch = terms[start:start + 500]
+            ids.update(self._db.execute(
+                f"SELECT term, id FROM terms WHERE term IN ({','.join('?' * len(batch))})", batch))
+        return ids
+
+    def add(self, chunks: Iterable[Tuple[str, str, Dict]]) -> None:
+        """
+        Index chunks given as (chunk ID, text, metadata) tuples. Chunks that are already
+        indexed are replaced.
+        """
+        chunks = list(chunks)
+        if not chunks:
+            return
+        with self._lock, self._db:
+            self._delete([chunk_id for chunk_id, _, _ in chunks])
+            added_length = 0
+            for chunk_id, text, metadata in chunks:
+                counts = Counter(tokenize(text))
+                added_length += sum(counts.values())
+                cursor = self._db.execute(
+                    "INSERT INTO chunks (chunk_id, length, metadata) VALUES (?, ?, ?)",
+                    (chunk_id, sum(counts.values()), json.dumps(metadata, ensure_ascii=False)),
+                )
+                term_ids = self._term_ids(counts)
+                self._db.executemany("INSERT INTO postings (term_id, chunk, tf) VALUES (?, ?, ?)",
+                                     [(term_ids[term], cursor.lastrowid, tf) for term, tf in counts.items()])
+                self._db.executemany("UPDATE terms SET df = df + 1 WHERE id = ?",
+                                     [(term_ids[term],) for term in counts])
+            self._update_stats(len(chunks), added_length)
+
+    def delete(self, chunk_ids: Sequence[str]) -> None:
+        with self._lock, self._db:
+            self._delete(chunk_ids)
+
+    def _delete(self, chunk_ids: Sequence[str]) -> None:
+        removed, removed_length = 0, 0
+        for start in range(0, len(chunk_ids), 500):
+            batch = list(chunk_ids[start:start + 500])
+            rows = self._db.execute(
+                f"SELECT id, length FROM chunks WHERE chunk_id IN ({','.join('?' * len(batch))})", batch).fetchall()
+            for row_id, length in rows:
+                self._db.execute("UPDATE terms SET df = df - 1 WHERE id IN (SELECT term_id FROM postings WHERE chunk = ?)",
+                                 (row_id,))
+                self._db.execute("DELETE FROM postings WHERE chunk = ?", (row_id,))
+                self._db.execute("DELETE FROM chunks WHERE id = ?", (row_id,))
+                removed += 1
+                removed_length += length
+        if removed:
+            self._db.execute("DELETE FROM terms WHERE df <= 0")
+            self._update_stats(-removed, -removed_length)
+
+    def _update_stats(self, chunks: int, length: int) -> None:
+        self._db.execute("UPDATE stats SET value = value + ? WHERE key = 'chunks'", (chunks,))
+        self._db.execute("UPDATE stats SET value = value + ? WHERE key = 'total_length'", (length,))
+
+    def count(self) -> int:
+        return self._db.execute("SELECT value FROM stats WHERE key = 'chunks'").fetchone()[0]
+
+    def search(self, query: str, top_k: int = 10, filters: Optional[Dict] = None) -> List[Tuple[str, float]]:
+        """
+        Rank chunks for `query` with BM25.
+
+        Args:
+            query (str): Free-text query.
+            top_k (int): Number of chunks to return.
+            filters (Dict): Exact-match metadata filters, e.g. {'title': 'Boston'}.
+
+        Returns:
+            List[Tuple[str, float]]: (chunk ID, BM25 score) pairs, best first.
+        """
+        terms = set(tokenize(query))
+        if not terms:
+            return []
+        with self._lock:
+            stats = dict(self._db.execute("SELECT key, value FROM stats"))
+            if not stats['chunks']:
+                return []
+            term_rows = self._db.execute(
+                f"SELECT id, df FROM terms WHERE term IN ({','.join('?' * len(terms))})", list(terms)).fetchall()
+            if not term_rows:
+                return []
+            conditions, params = '', [term_id for term_id, _ in term_rows]
+            for key, value in (filters or {}).items():
+                conditions += " AND json_extract(c.metadata, ?) = ?"
+                params.extend([f'$."{key}"', value])
+            postings = self._db.execute(
+                f"SELECT p.term_id, c.chunk_id, p.tf, c.length FROM postings p JOIN chunks c ON c.id = p.chunk "
+                f"WHERE p.term_id IN ({','.join('?' * len(term_rows))}){conditions}", params).fetchall()
+
+        total = stats['chunks']
+        average_length = stats['total_length'] / total or 1.0
+        idf = {term_id: math.log(1 + (total - df + 0.5) / (df + 0.5)) for term_id, df in term_rows}
+        scores = {}
+        for term_id, chunk_id, tf, length in postings:
+            norm = tf + self.k1 * (1 - self.b + self.b * length / average_length)
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + idf[term_id] * tf * (self.k1 + 1) / norm
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+
+    def clear(self) -> None:
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM postings")
+            self._db.execute("DELETE FROM chunks")
+            self._db.execute("DELETE FROM terms")
+            self._db.execute("UPDATE stats SET value = 0")
@@ -0,0 +1,38 @@
+import asyncio
+from typing import List
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.bridge.pydantic import PrivateAttr
+
+class SharedEmbedding(BaseEmbedding):
+    """
+    llama-index embed model that delegates to a shared EmbeddingModel instead of loading its own weights.
+
+    llama-index expects lists of floats, so the NumPy arrays are converted here at the boundary.
+    """
+
+    _embedding_model = PrivateAttr()
+
+    def __init__(self, embedding_model, **kwargs):
+        super().__init__(model_name=embedding_model.model_name, **kwargs)
+        self._embedding_model = embedding_model
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "SharedEmbedding"
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self._embedding_model.embed([query], normalize=True)[0].tolist()
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._embedding_model.embed([text], normalize=True)[0].tolist()
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return self._embedding_model.embed(texts, normalize=True).tolist()
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        embeddings = await asyncio.wrap_future(self._embedding_model.embed_async([query], normalize=True))
+        return embeddings[0].tolist()
+
+    async def _aget_text_embedding(self, text: str) -> List[float]:
+        embeddings = await asyncio.wrap_future(self._embedding_model.embed_async([text], normalize=True))
+        return embeddings[0].tolist()
@@ -0,0 +1,512 @@
+import json
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from dataclasses import dataclass
+from typing import Callable, Optional, Tuple
+
+import config
+from modules.completion_cache import CACHE_MODES, CompletionCache, completion_cache_key
+from modules.deadlines import current_deadline
+from modules.instrumentation import span
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL = "claude-2.1"
+
+# Same values as anthropic.HUMAN_PROMPT / anthropic.AI_PROMPT, defined here so building a
+# prompt does not require importing the SDK.
+HUMAN_PROMPT = "\n\nHuman:"
+AI_PROMPT = "\n\nAssistant:"
+
+# HTTP statuses worth retrying: rate limiting, timeouts/conflicts and server-side errors
+# (529 is Anthropic's "overloaded").
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504, 529}
+
+
+class TransportError(Exception):
+    def __init__(self, message: str, status_code: Optional[int] = None, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+    @property
+    def retryable(self) -> bool:
+        # No status code means the request never got an answer (connection error, timeout)
+        return self.status_code is None or self.status_code in RETRYABLE_STATUS_CODES
+
+
+class LLMError(Exception):
+    pass
+
+
+class DeadlineExceeded(LLMError):
+    """The deadline of the calling stage (see modules.deadlines) passed before the completion finished."""
+
+
+@dataclass(frozen=True)
+class CompletionRequest:
+    prompt: str
+    max_tokens: int
+    model: str = DEFAULT_MODEL
+    stop_sequences: Tuple[str, ...] = ()
+    temperature: Optional[float] = None
+
+
+@dataclass
+class CompletionResult:
+    text: str
+    model: str
+    stop_reason: Optional[str] = None
+    cached: bool = False
+    # Billed usage as reported by the API; None when the response has no usage
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
+    # Seconds from sending a streamed request to its first text
+    time_to_first_token: Optional[float] = None
+
+
+def _parse_retry_after(value) -> Optional[float]:
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+class AnthropicTransport:
+    """Sends completion requests through the official Anthropic SDK."""
+
+    def __init__(self, api_key: Optional[str] = None, timeout: float = 600.0):
+        self.api_key = api_key
+        self.timeout = timeout
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        with self._lock:
+            if self._client is None:
+                import anthropic
+                # Retries are handled by the gateway so they are visible to its rate limiting
+                self._client = anthropic.Anthropic(api_key=self.api_key or config.ANTHROPIC_API_KEY,
+                                                   max_retries=0, timeout=self.timeout)
+            return self._client
+
+    def complete(self, request: CompletionRequest, on_text: Optional[Callable[[str], None]] = None,
+                 timeout: Optional[float] = None) -> CompletionResult:
+        """
+        Args:
+            on_text (Callable): Stream the completion, calling this with every piece of text.
+            timeout (float): Seconds this request may take, if less than the client timeout.
+        """
+        import anthropic
+
+        client = self.client.with_options(timeout=min(timeout, self.timeout)) if timeout else self.client
+        kwargs = {
+            'model': request.model,
+            'prompt': request.prompt,
+            'max_tokens_to_sample': request.max_tokens,
+            'stop_sequences': list(request.stop_sequences),
+        }
+        if request.temperature is not None:
+            kwargs['temperature'] = request.temperature
+        try:
+            if on_text is not None:
+                return self._stream(client, kwargs, on_text)
+            response = client.completions.create(**kwargs)
+        except anthropic.APIStatusError as e:
+            raise TransportError(str(e), status_code=e.status_code,
+                                 retry_after=_parse_retry_after(e.response.headers.get('retry-after'))) from e
+        except anthropic.APIConnectionError as e:
+            raise TransportError(str(e)) from e
+        usage = getattr(response, 'usage', None)
+        return CompletionResult(text=response.completion, model=response.model, stop_reason=response.stop_reason,
+                                prompt_tokens=getattr(usage, 'input_tokens', None),
+                                completion_tokens=getattr(usage, 'output_tokens', None))
+
+    @staticmethod
+    def _stream(client, kwargs, on_text: Callable[[str], None]) -> CompletionResult:
+        # Streamed completions report no usage; the gateway counts the tokens locally
+        parts, model, stop_reason = [], kwargs['model'], None
+        with client.completions.create(stream=True, **kwargs) as stream:
+            for event in stream:
+                if event.completion:
+                    parts.append(event.completion)
+                    on_text(event.completion)
+                model = event.model or model
+                stop_reason = event.stop_reason or stop_reason
+        return CompletionResult(text=''.join(parts), model=model, stop_reason=stop_reason)
+
+
+class HTTPTransport:
+    """
+    Sends completion requests as plain JSON to an Anthropic-compatible `/v1/complete` endpoint.
+
+    Used to point the gateway at a local fake completion server in tests and benchmarks.
+    """
+
+    def __init__(self, base_url: str, api_key: str = 'test', timeout: float = 600.0):
+        import requests
+
+        self.base_url = base_url.rstrip('/')
+        self.api_key = api_key
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def complete(self, request: CompletionRequest, on_text: Optional[Callable[[str], None]] = None,
+                 timeout: Optional[float] = None) -> CompletionResult:
+        """
+        Args:
+            on_text (Callable): Stream the completion as server-sent events, calling this
+                with every piece of text.
+            timeout (float): Seconds this request may wait for the server, if less than the
+                transport timeout.
+        """
+        import requests
+
+        payload = {
+            'model': request.model,
+            'prompt': request.prompt,
+            'max_tokens_to_sample': request.max_tokens,
+            'stop_sequences': list(request.stop_sequences),
+        }
+        if request.temperature is not None:
+            payload['temperature'] = request.temperature
+        if on_text is not None:
+            payload['stream'] = True
+        try:
+            response = self.session.post(f"{self.base_url}/v1/complete", json=payload,
+                                         timeout=min(timeout, self.timeout) if timeout else self.timeout,
+                                         headers={'x-api-key': self.api_key}, stream=on_text is not None)
+        except requests.exceptions.RequestException as e:
+            raise TransportError(str(e)) from e
+        if response.status_code >= 400:
+            raise TransportError(f"HTTP {response.status_code}: {response.text[:200]}",
+                                 status_code=response.status_code,
+                                 retry_after=_parse_retry_after(response.headers.get('retry-after')))
+        if on_text is not None:
+            try:
+                return self._read_stream(request, response, on_text)
+            except requests.exceptions.RequestException as e:
+                raise TransportError(str(e)) from e
+            finally:
+                response.close()
+        body = response.json()
+        usage = body.get('usage') or {}
+        return CompletionResult(text=body['completion'], model=body.get('model', request.model),
+                                stop_reason=body.get('stop_reason'), prompt_tokens=usage.get('input_tokens'),
+                                completion_tokens=usage.get('output_tokens'))
+
+    @staticmethod
+    def _read_stream(request: CompletionRequest, response, on_text: Callable[[str], None]) -> CompletionResult:
+        parts, model, stop_reason, usage = [], request.model, None, {}
+        event = None
+        for line in response.iter_lines(decode_unicode=True):
+            if line.startswith('event:'):
+                event = line[len('event:'):].strip()
+                continue
+            if not line.startswith('data:'):
+                continue
+            data = json.loads(line[len('data:'):])
+            if event == 'error' or data.get('type') == 'error':
+                error = data.get('error') or {}
+                # An error after the response started is reported in the stream; overloaded is retryable
+                raise TransportError(f"Stream error: {error.get('message', error)}",
+                                     status_code=529 if error.get('type') == 'overloaded_error' else 500)
+            if data.get('type') == 'completion':
+                if data.get('completion'):
+                    parts.append(data['completion'])
+                    on_text(data['completion'])
+                model = data.get('model') or model
+                stop_reason = data.get('stop_reason') or stop_reason
+                usage = data.get('usage') or usage
+        return CompletionResult(text=''.join(parts), model=model, stop_reason=stop_reason,
+                                prompt_tokens=usage.get('input_tokens'), completion_tokens=usage.get('output_tokens'))
+
+
+class TokenBucket:
+    """Blocking token bucket refilled continuously at `rate_per_minute`."""
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, amount: float = 1, deadline: Optional[float] = None) -> float:
+        """
+        Take `amount` tokens, sleeping until they are available. Returns the time spent waiting.
+
+        Raises DeadlineExceeded instead of sleeping past `deadline` (a `time.monotonic()` value);
+        no tokens are taken in that case.
+        """
+        amount = min(amount, self.capacity)
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return waited
+                delay = (amount - self.tokens) / self.rate
+            if deadline is not None and now + delay > deadline:
+                raise DeadlineExceeded(f"Deadline passed while waiting {delay:.1f}s for the rate limit")
+            time.sleep(delay)
+            waited += delay
+
+
+class LLMGateway:
+    """
+    Shared entry point for every LLM completion made by the generator.
+
+    Bounds the number of in-flight requests, applies request- and token-per-minute
+    limits, retries rate-limited and server errors with jittered exponential backoff,
+    and coalesces identical requests that are in flight at the same time. Finished
+    completions are stored in an optional on-disk cache.
+    """
+
+    def __init__(self, transport=None, max_concurrency: int = 4, requests_per_minute: Optional[float] = 50,
+                 tokens_per_minute: Optional[float] = 100000, max_retries: int = 5,
+                 backoff_base: float = 1.0, backoff_max: float = 60.0,
+                 cache: Optional[CompletionCache] = None, cache_mode: str = 'use'):
+        if cache_mode not in CACHE_MODES:
+            raise ValueError(f"Invalid cache mode '{cache_mode}'. Expected one of {CACHE_MODES}.")
+        self.transport = transport or AnthropicTransport()
+        self.cache = cache
+        self.cache_mode = cache_mode
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._semaphore = threading.BoundedSemaphore(max_concurrency)
+        self._request_bucket = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self._token_bucket = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.stats = {'requests': 0, 'retries': 0, 'coalesced': 0, 'failures': 0, 'rate_limit_wait': 0.0}
+
+    def complete(self, prompt: str, max_tokens: int, model: str = DEFAULT_MODEL, stop_sequences=None,
+                 temperature: Optional[float] = None, token_counter=None,
+                 cache_ttl: Optional[float] = None, on_text: Optional[Callable[[str], None]] = None) -> CompletionResult:
+        """
+        Complete `prompt`, from the cache when possible.
+
+        With `on_text`, the completion is streamed and `on_text` is called with every
+        piece of text as it arrives (once with the whole text for cached completions).
+        Requests made inside `modules.deadlines.deadline_scope` are cancelled with
+        DeadlineExceeded when the deadline passes.
+        """
+        with span('llm', model=model, max_tokens=max_tokens, stream=on_text is not None) as current:
+            result = self._complete(prompt, max_tokens, model, stop_sequences, temperature, token_counter, cache_ttl,
+                                    current, on_text)
+            current.set(cached=result.cached, prompt_tokens=result.prompt_tokens,
+                        completion_tokens=result.completion_tokens)
+            if result.time_to_first_token is not None:
+                current.set(time_to_first_token=round(result.time_to_first_token, 4))
+            return result
+
+    def _complete(self, prompt, max_tokens, model, stop_sequences, temperature, token_counter, cache_ttl,
+                  current_span, on_text=None) -> CompletionResult:
+        request = CompletionRequest(prompt=prompt, max_tokens=max_tokens, model=model,
+                                    stop_sequences=tuple(stop_sequences or ()), temperature=temperature)
+        use_cache = self.cache is not None and self.cache_mode != 'bypass'
+        cache_key = completion_cache_key(model, prompt, max_tokens, request.stop_sequences, temperature) if use_cache else None
+
+        if use_cache and self.cache_mode == 'use':
+            entry = self.cache.get(cache_key)
+            if entry is not None:
+                result = CompletionResult(text=entry['completion'], model=entry['model'],
+                                          stop_reason=entry['stop_reason'], cached=True,
+                                          prompt_tokens=entry.get('prompt_tokens'),
+                                          completion_tokens=entry.get('completion_tokens'))
+                result.prompt_tokens, result.completion_tokens = self._usage(request, result)
+                if token_counter is not None:
+                    token_counter.add_cache_hit(result.prompt_tokens, result.completion_tokens, model=model)
+                if on_text is not None:
+                    on_text(result.text)
+                return result
+
+        deadline = current_deadline()
+        while True:
+            with self._lock:
+                future = self._inflight.get(request)
+                owner = future is None
+                if owner:
+                    future = Future()
+                    self._inflight[request] = future
+                else:
+                    self.stats['coalesced'] += 1
+            if owner:
+                break
+            current_span.set(coalesced=True)
+            try:
+                result = future.result(timeout=max(deadline - time.monotonic(), 0) if deadline is not None else None)
+            except FutureTimeoutError:
+                raise DeadlineExceeded("Deadline passed while waiting for an identical in-flight request") from None
+            except DeadlineExceeded:
+                # The request that was joined ran out of its own time; this caller may still have some
+                if deadline is not None and time.monotonic() >= deadline:
+                    raise
+                continue
+            if on_text is not None:
+                on_text(result.text)
+            return result
+
+        try:
+            if token_counter is not None and use_cache:
+                token_counter.add_cache_miss(model=model)
+            result = self._execute(request, current_span, on_text)
+            prompt_tokens, completion_tokens = self._usage(request, result)
+            result.prompt_tokens, result.completion_tokens = prompt_tokens, completion_tokens
+            if token_counter is not None:
+                token_counter.add_llm_usage(prompt_tokens, completion_tokens, model=model)
+            if use_cache:
+                self.cache.put(cache_key, result.model, result.text, result.stop_reason, ttl=cache_ttl,
+                               prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._inflight.pop(request, None)
+
+    @staticmethod
+    def _usage(request: CompletionRequest, result: CompletionResult) -> Tuple[int, int]:
+        """Billed (prompt, completion) tokens, counted locally when the API did not report them."""
+        from modules.token_counter import get_encoder
+
+        prompt_tokens, completion_tokens = result.prompt_tokens, result.completion_tokens
+        if prompt_tokens is None:
+            prompt_tokens = len(get_encoder(request.model).encode_ordinary(request.prompt))
+        if completion_tokens is None:
+            completion_tokens = len(get_encoder(request.model).encode_ordinary(result.text))
+        return prompt_tokens, completion_tokens
+
+    def _estimate_tokens(self, request: CompletionRequest) -> int:
+        # Rough upper bound (~4 characters per token) used only for rate limiting
+        return len(request.prompt) // 4 + request.max_tokens
+
+    def _backoff(self, attempt: int, error: TransportError) -> float:
+        if error.retry_after is not None:
+            return error.retry_after
+        # Full jitter keeps concurrent workers from retrying in lockstep
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    @contextmanager
+    def _request_slot(self, deadline: Optional[float], attempt: int):
+        """Hold one of the `max_concurrency` request slots, yielding the time left until `deadline`."""
+        if not self._semaphore.acquire(timeout=None if deadline is None else max(deadline - time.monotonic(), 0)):
+            raise DeadlineExceeded(f"Deadline passed while waiting for a free request slot (attempt {attempt + 1})")
+        try:
+            # Measured once the slot is held, so queueing for it counts against the deadline
+            timeout = None
+            if deadline is not None:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    raise DeadlineExceeded(f"Deadline passed before the request could be sent (attempt {attempt + 1})")
+            yield timeout
+        finally:
+            self._semaphore.release()
+
+    def _execute(self, request: CompletionRequest, current_span=None, on_text=None) -> CompletionResult:
+        deadline = current_deadline()
+        attempt = 0
+        while True:
+            waited = 0.0
+            if self._request_bucket:
+                waited += self._request_bucket.acquire(1, deadline)
+            if self._token_bucket:
+                waited += self._token_bucket.acquire(self._estimate_tokens(request), deadline)
+            with self._lock:
+                self.stats['requests'] += 1
+                self.stats['rate_limit_wait'] += waited
+            if current_span is not None and waited:
+                current_span.add(rate_limit_wait=waited)
+
+            started = time.perf_counter()
+            first_token_at = None
+            streamed = on_text
+
+            if on_text is not None:
+                def streamed(text):
+                    nonlocal first_token_at
+                    if first_token_at is None:
+                        first_token_at = time.perf_counter()
+                    on_text(text)
+                    if deadline is not None and time.monotonic() > deadline:
+                        raise DeadlineExceeded("Deadline passed while streaming the completion")
+
+            try:
+                with self._request_slot(deadline, attempt) as timeout:
+                    result = self.transport.complete(request, on_text=streamed, timeout=timeout)
+                if first_token_at is not None:
+                    result.time_to_first_token = first_token_at - started
+                return result
+            except TransportError as e:
+                # Text that was already passed on cannot be taken back, so a broken stream is not retried
+                partial = first_token_at is not None
+                if not e.retryable or attempt >= self.max_retries or partial:
+                    with self._lock:
+                        self.stats['failures'] += 1
+                    raise LLMError(f"LLM request failed after {attempt + 1} attempt(s)"
+                                   f"{' mid-stream' if partial else ''}: {e}") from e
+                delay = self._backoff(attempt, e)
+                if deadline is not None and time.monotonic() + delay > deadline:
+                    raise DeadlineExceeded(f"Deadline passed before the request could be retried: {e}") from e
+                logger.warning(f"LLM request failed ({e.status_code or 'connection error'}), "
+                               f"retrying in {delay:.1f}s (attempt {attempt + 1}/{self.max_retries})")
+                with self._lock:
+                    self.stats['retries'] += 1
+                if current_span is not None:
+                    current_span.add(retries=1, backoff_seconds=delay)
+                time.sleep(delay)
+                attempt += 1
+
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+
+def get_gateway() -> LLMGateway:
+    """Return the process-wide gateway, creating it from config on first use."""
+    global _gateway
+    with _gateway_lock:
+        if _gateway is None:
+            base_url = getattr(config, 'LLM_BASE_URL', None)
+            _gateway = LLMGateway(
+                transport=HTTPTransport(base_url) if base_url else AnthropicTransport(),
+                max_concurrency=getattr(config, 'LLM_MAX_CONCURRENCY', 4),
+                requests_per_minute=getattr(config, 'LLM_REQUESTS_PER_MINUTE', 50),
+                tokens_per_minute=getattr(config, 'LLM_TOKENS_PER_MINUTE', 100000),
+                max_retries=getattr(config, 'LLM_MAX_RETRIES', 5),
+                cache=CompletionCache(
+                    getattr(config, 'COMPLETION_CACHE_PATH', os.path.join('output', 'cache', 'completions.sqlite3')),
+                    max_bytes=getattr(config, 'COMPLETION_CACHE_MAX_BYTES', 512 * 1024 * 1024),
+                    default_ttl=getattr(config, 'COMPLETION_CACHE_TTL', 30 * 24 * 3600),
+                ),
+            )
+        return _gateway
+
+
+def set_gateway(gateway: Optional[LLMGateway]) -> None:
+    """Replace the process-wide gateway, e.g. with one using a fake transport."""
+    global _gateway
+    with _gateway_lock:
+        _gateway = gateway
+
+
+def set_cache_mode(mode: str) -> None:
+    """Switch the process-wide gateway between using, refreshing and bypassing the completion cache."""
+    if mode not in CACHE_MODES:
+        raise ValueError(f"Invalid cache mode '{mode}'. Expected one of {CACHE_MODES}.")
+    get_gateway().cache_mode = mode
@@ -0,0 +1,107 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_title(title: str) -> str:
+    """Normalize a page title the way MediaWiki does: underscores to spaces, single spaces, first letter upper case."""
+    title = " ".join(title.replace('_', ' ').split())
+    return title[:1].upper() + title[1:]
+
+
+class PageCache:
+    """
+    Persistent cache of formatted Wikipedia pages keyed by canonical title.
+
+    Every page is stored with the revision ID it was built from, so a cheap revision
+    lookup is enough to decide whether the cached copy is still current. Redirects and
+    alternative spellings are stored as aliases that point at the canonical title.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with self._connection() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS pages (
+                    title TEXT PRIMARY KEY,
+                    revision_id INTEGER,
+                    content TEXT NOT NULL,
+                    fetched_at REAL NOT NULL,
+                    validated_at REAL NOT NULL
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS aliases (
+                    alias TEXT PRIMARY KEY,
+                    title TEXT NOT NULL
+                )
+            """)
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def canonical_title(self, title: str) -> str:
+        alias = normalize_title(title)
+        row = self._connection().execute("SELECT title FROM aliases WHERE alias = ?", (alias,)).fetchone()
+        return row[0] if row else alias
+
+    def get(self, title: str) -> Optional[Dict]:
+        """
+        Look up a page by any known title or alias.
+
+        Returns:
+            Dict: The cached entry with 'title', 'revision_id', 'content' (the fetcher's
+                page dict), 'fetched_at' and 'validated_at', or None.
+        """
+        canonical = self.canonical_title(title)
+        row = self._connection().execute(
+            "SELECT title, revision_id, content, fetched_at, validated_at FROM pages WHERE title = ?",
+            (canonical,),
+        ).fetchone()
+        if row is None:
+            return None
+        return {
+            'title': row[0],
+            'revision_id': row[1],
+            'content': json.loads(row[2]),
+            'fetched_at': row[3],
+            'validated_at': row[4],
+        }
+
+    def put(self, title: str, revision_id: Optional[int], content: Dict, aliases: Iterable[str] = ()) -> None:
+        now = time.time()
+        canonical = normalize_title(title)
+        conn = self._connection()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO pages (title, revision_id, content, fetched_at, validated_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (canonical, revision_id, json.dumps(content, ensure_ascii=False), now, now),
+            )
+            self._add_aliases(conn, canonical, aliases)
+
+    def mark_validated(self, title: str, aliases: Iterable[str] = ()) -> None:
+        canonical = normalize_title(title)
+        conn = self._connection()
+        with conn:
+            conn.execute("UPDATE pages SET validated_at = ? WHERE title = ?", (time.time(), canonical))
+            self._add_aliases(conn, canonical, aliases)
+
+    def _add_aliases(self, conn: sqlite3.Connection, canonical: str, aliases: Iterable[str]) -> None:
+        for alias in set(aliases) | {canonical}:
+            conn.execute("INSERT OR REPLACE INTO aliases (alias, title) VALUES (?, ?)",
+                         (normalize_title(alias), canonical))
@@ -1,13 +1,14 @@
-import anthropic
-from anthropic import HUMAN_PROMPT, AI_PROMPT
 import config
 from modules.token_counter import TokenCounter
+from modules import llm_gateway
+from modules.llm_gateway import HUMAN_PROMPT, AI_PROMPT
 import json
 import os
+import re
+from typing import List, Optional
 
-client = anthropic.Anthropic(api_key=config.ANTHROPIC_API_KEY)
 
-def generate_tiktok_script(content: dict, target_audience: str, token_counter: TokenCounter) -> str:
+def generate_tiktok_script(content: dict, target_audience: str, token_counter: TokenCounter, on_text=None) -> str:
     prompt = f"""{HUMAN_PROMPT} Create an engaging TikTok script based on the following content and guidelines:
     
     Content Summary: {content['summary']}
@@ -27,21 +28,21 @@ def generate_tiktok_script(content: dict, target_audience: str, token_counter: T
 
     """
 
-    token_counter.add_prompt_tokens(len(prompt.split()))  # Simple word count as a token estimate
-
     try:
-        response = client.completions.create(
+        response = llm_gateway.get_gateway().complete(
+            prompt,
+            max_tokens=300,
             model="claude-2.1",
-            prompt=prompt,
-            max_tokens_to_sample=300,
             stop_sequences=[HUMAN_PROMPT],
+            token_counter=token_counter,
+            on_text=on_text,
         )
-        script = response.completion
+        script = response.text
+    except llm_gateway.DeadlineExceeded:
+        raise
     except Exception as e:
         raise Exception(f"Error in script generation: {str(e)}")
 
-    token_counter.add_completion_tokens(len(script.split()))  # Simple word count as a token estimate
-
     return script
 
 def analyze_script_engagement(script: str, token_counter: TokenCounter) -> dict:
@@ -59,23 +60,87 @@ def analyze_script_engagement(script: str, token_counter: TokenCounter) -> dict:
 
     """
 
-    token_counter.add_prompt_tokens(len(prompt.split()))  # Simple word count as a token estimate
-
     try:
-        response = client.completions.create(
+        response = llm_gateway.get_gateway().complete(
+            prompt,
+            max_tokens=500,
             model="claude-2.1",
-            prompt=prompt,
-            max_tokens_to_sample=500,
             stop_sequences=[HUMAN_PROMPT],
+            token_counter=token_counter,
         )
-        analysis = response.completion
+        analysis = response.text
+    except llm_gateway.DeadlineExceeded:
+        raise
     except Exception as e:
         raise Exception(f"Error in script engagement analysis: {str(e)}")
 
-    token_counter.add_completion_tokens(len(analysis.split()))  # Simple word count as a token estimate
-
     return {"engagement_analysis": analysis}
 
+# The section headings the batched prompt asks for, on lines of their own
+SCRIPT_HEADING_RE = re.compile(r'^[ \t]*#+[ \t]*Script[ \t]+(\d+)[ \t]*:?[ \t]*$', re.IGNORECASE | re.MULTILINE)
+
+def analyze_scripts_engagement(scripts: List[str], token_counter: TokenCounter,
+                               audiences: Optional[List[str]] = None) -> List[dict]:
+    """
+    Score several scripts, e.g. the audience variants of one topic, in one request.
+
+    The scripts are numbered in the prompt and the response is split on its
+    "### Script N" heading lines. Unless the response has exactly one section per
+    script, in order, every script is scored on its own with `analyze_script_engagement`
+    rather than risk assigning a section to the wrong script.
+
+    Args:
+        scripts (List[str]): Scripts to score.
+        token_counter (TokenCounter): Records the token usage.
+        audiences (List[str]): Target audience of each script, if known.
+
+    Returns:
+        List[dict]: One {"engagement_analysis": ...} dict per script, in order.
+    """
+    if len(scripts) == 1:
+        return [analyze_script_engagement(scripts[0], token_counter)]
+
+    audiences = audiences or [None] * len(scripts)
+    script_blocks = "\n\n    ".join(
+        f"Script {i}" + (f" (target audience: {audience})" if audience else "") + f":\n    {script}"
+        for i, (script, audience) in enumerate(zip(scripts, audiences), 1))
+    prompt = f"""{HUMAN_PROMPT} Analyze each of the following {len(scripts)} TikTok scripts for potential engagement factors:
+    
+    {script_blocks}
+    
+    For each script, start a section with a line containing only the heading "### Script <number>" and provide ratings (1-10) and brief explanations for the following aspects:
+    1. Hook Strength
+    2. Clarity and Simplicity
+    3. Audience Appropriateness
+    4. Information Value
+    5. Entertainment Factor
+    6. Call-to-Action Effectiveness{AI_PROMPT} Here's my analysis of each TikTok script's engagement factors:
+
+    """
+
+    try:
+        response = llm_gateway.get_gateway().complete(
+            prompt,
+            max_tokens=350 * len(scripts),
+            model="claude-2.1",
+            stop_sequences=[HUMAN_PROMPT],
+            token_counter=token_counter,
+        )
+    except llm_gateway.DeadlineExceeded:
+        raise
+    except Exception as e:
+        raise Exception(f"Error in batched script engagement analysis: {str(e)}")
+
+    headings = list(SCRIPT_HEADING_RE.finditer(response.text))
+    if [int(heading.group(1)) for heading in headings] != list(range(1, len(scripts) + 1)):
+        return [analyze_script_engagement(script, token_counter) for script in scripts]
+
+    results = []
+    for script, heading, next_heading in zip(scripts, headings, headings[1:] + [None]):
+        text = response.text[heading.end():next_heading.start() if next_heading else len(response.text)].strip()
+        results.append({"engagement_analysis": text} if text else analyze_script_engagement(script, token_counter))
+    return results
+
 def save_script(script: str, metadata: dict, filename: str):
     output = {
         "script": script,
@@ -0,0 +1,203 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+
+import numpy as np
+
+import config
+from modules.artifacts import content_digest
+
+logger = logging.getLogger(__name__)
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _context_key(context: Optional[Dict]) -> str:
+    return content_digest(context or {})
+
+
+class SemanticCache:
+    """
+    Reuses content analyses for near-duplicate (topic, audience) pairs.
+
+    Topic titles and audiences are embedded separately and kept in two small in-process
+    matrices. A lookup is a hit when both the topic and the audience of the best entry
+    are at least `threshold` cosine-similar to the query, so "teens 13-17" can match
+    "teenagers (13-17)" without "Boston" matching "Paris" for the same audience.
+    Only entries stored with the same `context` are considered: the context names what
+    the analysis was built from besides topic and audience (the page content, whether it
+    was compacted and with which budget), so a changed page or a differently built
+    prompt never reuses an old analysis.
+    Entries are appended to a SQLite database (`<path>.sqlite3`, WAL mode), so a store
+    costs one insert and several processes can share the cache; each process picks up
+    the entries others added on its next lookup. Every lookup is appended to
+    `<path>.lookups.jsonl` for threshold tuning.
+    """
+
+    def __init__(self, path: str, embedding_model, threshold: float = 0.9):
+        self.path = path
+        self.embedding_model = embedding_model
+        self.threshold = threshold
+        self.entries = []
+        self.context_keys = np.array([], dtype=object)
+        self.topic_vectors = None
+        self.audience_vectors = None
+        self.stats = {'lookups': 0, 'hits': 0}
+        self._last_id = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with self._connection() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS analyses (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    topic TEXT NOT NULL,
+                    audience TEXT NOT NULL,
+                    context TEXT NOT NULL DEFAULT '',
+                    analysis TEXT NOT NULL,
+                    topic_vector BLOB NOT NULL,
+                    audience_vector BLOB NOT NULL,
+                    created_at REAL NOT NULL
+                )
+            """)
+            # Databases created before entries had a context get the column here; their
+            # entries have an empty context and no longer match any lookup
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(analyses)")}
+            if 'context' not in columns:
+                conn.execute("ALTER TABLE analyses ADD COLUMN context TEXT NOT NULL DEFAULT ''")
+
+    @property
+    def hit_rate(self) -> float:
+        return self.stats['hits'] / self.stats['lookups'] if self.stats['lookups'] else 0.0
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite3 connections must not be shared between threads
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(f"{self.path}.sqlite3", timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _refresh(self) -> None:
+        """Load the entries added since the last refresh, by this or any other process. Call with the lock held."""
+        rows = self._connection().execute(
+            "SELECT id, topic, audience, context, analysis, topic_vector, audience_vector, created_at "
+            "FROM analyses WHERE id > ? ORDER BY id", (self._last_id,)).fetchall()
+        if not rows:
+            return
+        topic_vectors, audience_vectors, context_keys = [], [], []
+        for row_id, topic, audience, context, analysis, topic_vector, audience_vector, created_at in rows:
+            try:
+                entry = {'topic': topic, 'audience': audience, 'analysis': json.loads(analysis),
+                         'created_at': created_at}
+            except ValueError as e:
+                logger.error(f"Skipping unreadable semantic cache entry {row_id}: {e}")
+                continue
+            self.entries.append(entry)
+            context_keys.append(context)
+            topic_vectors.append(np.frombuffer(topic_vector, dtype=np.float32))
+            audience_vectors.append(np.frombuffer(audience_vector, dtype=np.float32))
+        self._last_id = rows[-1][0]
+        if not topic_vectors:
+            return
+        self.context_keys = np.concatenate([self.context_keys, np.array(context_keys, dtype=object)])
+        blocks = [] if self.topic_vectors is None else [self.topic_vectors]
+        self.topic_vectors = np.vstack(blocks + topic_vectors)
+        blocks = [] if self.audience_vectors is None else [self.audience_vectors]
+        self.audience_vectors = np.vstack(blocks + audience_vectors)
+
+    def _embed(self, topic: str, audience: str):
+        vectors = _normalize(self.embedding_model.embed([topic, audience]).astype(np.float32, copy=False))
+        return vectors[0], vectors[1]
+
+    def _log_lookup(self, record: Dict) -> None:
+        try:
+            with open(f"{self.path}.lookups.jsonl", 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+        except IOError as e:
+            logger.error(f"Error writing semantic cache lookup log: {e}")
+
+    def lookup(self, topic: str, audience: str, context: Optional[Dict] = None) -> Optional[Dict]:
+        """
+        Return the stored analysis for the closest (topic, audience) pair above the
+        threshold among the entries stored with the same `context`, if any.
+        """
+        context_key = _context_key(context)
+        topic_vector, audience_vector = self._embed(topic, audience)
+        with self._lock:
+            self._refresh()
+            self.stats['lookups'] += 1
+            best_index, topic_score, audience_score = None, None, None
+            candidates = np.flatnonzero(self.context_keys == context_key) if self.entries else []
+            if len(candidates):
+                topic_scores = self.topic_vectors[candidates] @ topic_vector
+                audience_scores = self.audience_vectors[candidates] @ audience_vector
+                combined = np.minimum(topic_scores, audience_scores)
+                best = int(np.argmax(combined))
+                topic_score, audience_score = float(topic_scores[best]), float(audience_scores[best])
+                best_index = int(candidates[best])
+            hit = best_index is not None and min(topic_score, audience_score) >= self.threshold
+            if hit:
+                self.stats['hits'] += 1
+            entry = self.entries[best_index] if best_index is not None else None
+
+        self._log_lookup({
+            'time': time.time(),
+            'topic': topic,
+            'audience': audience,
+            'match_topic': entry['topic'] if entry else None,
+            'match_audience': entry['audience'] if entry else None,
+            'topic_similarity': topic_score,
+            'audience_similarity': audience_score,
+            'threshold': self.threshold,
+            'hit': hit,
+        })
+        if hit:
+            logger.info(f"Semantic cache hit for '{topic}' / '{audience}': reusing analysis of "
+                        f"'{entry['topic']}' / '{entry['audience']}' "
+                        f"(similarity {topic_score:.3f} / {audience_score:.3f})")
+            return entry['analysis']
+        return None
+
+    def store(self, topic: str, audience: str, analysis: Dict, context: Optional[Dict] = None) -> None:
+        topic_vector, audience_vector = self._embed(topic, audience)
+        conn = self._connection()
+        with conn:
+            conn.execute(
+                "INSERT INTO analyses (topic, audience, context, analysis, topic_vector, audience_vector, "
+                "created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (topic, audience, _context_key(context), json.dumps(analysis, ensure_ascii=False),
+                 topic_vector.astype(np.float32).tobytes(), audience_vector.astype(np.float32).tobytes(),
+                 time.time()),
+            )
+        with self._lock:
+            self._refresh()
+
+
+_semantic_cache = None
+_semantic_cache_lock = threading.Lock()
+
+
+def get_semantic_cache(embedding_model) -> Optional[SemanticCache]:
+    """Return the process-wide semantic cache, or None when it is disabled in config."""
+    global _semantic_cache
+    if not getattr(config, 'SEMANTIC_CACHE_ENABLED', True):
+        return None
+    with _semantic_cache_lock:
+        if _semantic_cache is None:
+            _semantic_cache = SemanticCache(
+                getattr(config, 'SEMANTIC_CACHE_PATH', os.path.join('output', 'cache', 'semantic_analysis')),
+                embedding_model,
+                threshold=getattr(config, 'SEMANTIC_CACHE_THRESHOLD', 0.9),
+            )
+        return _semantic_cache
@@ -0,0 +1,475 @@
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import config
+from modules.artifacts import ArtifactStore, artifact_key, content_digest
+from modules.deadlines import DEFERRABLE_STAGES, DeadlineScheduler, deadline_scope
+from modules.instrumentation import span
+from modules.llm_gateway import DeadlineExceeded
+from modules.token_counter import TokenCounter
+
+logger = logging.getLogger(__name__)
+
+# Part of every stage key. Bump it when a prompt or the output format of a stage
+# changes, so outputs stored by older code are not reused.
+ARTIFACT_VERSION = 1
+
+# Fields of a fetched page that later stages read; the retrieval date changes on every fetch
+PAGE_FIELDS = ('title', 'summary', 'content', 'url')
+
+
+@dataclass(frozen=True)
+class Stage:
+    """
+    One step of generating a script for a topic.
+
+    Attributes:
+        name (str): Stage name.
+        deps (Tuple[str]): Stages whose outputs this stage reads.
+        cacheable (bool): Whether a stored output is reused instead of running the stage
+            again. Fetch and index always run: the page cache revalidates pages by
+            revision and the vector store skips unchanged documents, so both are cheap
+            to repeat and never serve a stale page or a missing index.
+        fingerprint (Callable): Maps the stage output to the value downstream stage keys
+            are derived from. Defaults to the whole output.
+    """
+    name: str
+    deps: Tuple[str, ...] = ()
+    cacheable: bool = True
+    fingerprint: Optional[Callable[[Dict], Any]] = None
+
+
+def _page_fingerprint(output: Dict) -> str:
+    page = output['topic_content']
+    return content_digest({field: page.get(field) for field in PAGE_FIELDS})
+
+
+def _index_fingerprint(output: Dict) -> None:
+    # Later stages read the index only through the page that was indexed, which they depend on directly
+    return None
+
+
+GRAPH = (
+    Stage('fetch', cacheable=False, fingerprint=_page_fingerprint),
+    Stage('index', ('fetch',), cacheable=False, fingerprint=_index_fingerprint),
+    Stage('analyze', ('fetch', 'index')),
+    Stage('script', ('analyze',)),
+    Stage('engagement', ('script',)),
+)
+STAGES = {stage.name: stage for stage in GRAPH}
+STAGE_NAMES = [stage.name for stage in GRAPH]
+
+
+def topic_basename(topic: str) -> str:
+    return topic.replace(' ', '_')
+
+
+def job_basename(topic: str, audience: str, per_audience: bool) -> str:
+    """Base name of a job's script files; `per_audience` keeps the files of several audiences of one topic apart."""
+    basename = topic_basename(topic)
+    if per_audience:
+        basename += '_' + "".join(c if c.isalnum() else "_" for c in audience)
+    return basename
+
+
+class GenerationPipeline:
+    """
+    Runs the stages of `GRAPH` for jobs, checkpointing every stage output.
+
+    A job is a dict with at least 'topic' and 'audience'; each stage adds its outputs
+    to it. Every output is written to the artifact store under a key derived from the
+    stage's parameters and the fingerprints of the outputs it depends on. When a
+    stage's key is already in the store, the stored output is used instead of running
+    the stage, so an interrupted or failed run resumes after the last completed stage
+    and only stages downstream of a changed input run again.
+
+    With a `DeadlineScheduler`, every stage runs against a deadline. Work that no longer
+    fits is degraded rather than allowed to overrun: the analysis gets a smaller content
+    budget, and engagement analysis is deferred (left for the next run) when it would not
+    finish in time. Each degradation is listed in the job's 'degradations'.
+    """
+
+    def __init__(self, token_counter: TokenCounter, output_dir: str, wikipedia_fetcher=None, indexer=None,
+                 artifact_store: Optional[ArtifactStore] = None, compact: bool = False,
+                 token_budget: Optional[int] = None, top_k: Optional[int] = None, reuse: bool = True,
+                 fan_out: bool = False, scheduler: Optional[DeadlineScheduler] = None, stream: bool = False,
+                 echo: bool = False):
+        """
+        Args:
+            artifact_store (ArtifactStore): Store for stage outputs; None disables checkpointing.
+            reuse (bool): Use stored outputs of completed stages. When False every stage runs
+                and its output replaces the stored one.
+            fan_out (bool): Analyze each page once for any audience and adapt that analysis
+                per audience, instead of analyzing the full page for every audience.
+            scheduler (DeadlineScheduler): Time budgets of topics and stages; None runs
+                every stage to completion however long it takes.
+            stream (bool): Stream scripts into their files as they are generated.
+            echo (bool): With `stream`, also print scripts to stdout as they arrive.
+        """
+        self.token_counter = token_counter
+        self.content_dir = os.path.join(output_dir, 'content')
+        self.script_dir = os.path.join(output_dir, 'scripts')
+        os.makedirs(self.content_dir, exist_ok=True)
+        os.makedirs(self.script_dir, exist_ok=True)
+        self.wikipedia_fetcher = wikipedia_fetcher
+        self.indexer = indexer
+        self.artifact_store = artifact_store
+        self.compact = compact
+        self.token_budget = token_budget
+        self.top_k = top_k
+        self.reuse = reuse
+        self.fan_out = fan_out
+        self.scheduler = scheduler
+        self.stream = stream
+        self.echo = echo
+        self._lock = threading.Lock()
+        self._indexed_topics = set()
+        self._index_locks = {}
+        self._neutral = {}
+        self._neutral_locks = {}
+
+    def stage_key(self, job: Dict, stage: Stage) -> str:
+        digests = job.setdefault('digests', {})
+        missing = [dep for dep in stage.deps if dep not in digests]
+        if missing:
+            raise RuntimeError(f"Stage '{stage.name}' of '{job['topic']}' needs {', '.join(missing)} to run first.")
+        return artifact_key(stage.name, {
+            'version': ARTIFACT_VERSION,
+            'params': getattr(self, f'_params_{stage.name}')(job),
+            'deps': {dep: digests[dep] for dep in stage.deps},
+        })
+
+    def _lookup(self, key: str, cacheable: bool = True) -> Optional[Any]:
+        if self.artifact_store is None or not self.reuse or not cacheable:
+            return None
+        return self.artifact_store.get(key)
+
+    def _store(self, key: str, stage_name: str, output: Any) -> None:
+        if self.artifact_store is not None:
+            with span('write', artifact=key):
+                self.artifact_store.put(key, stage_name, output)
+
+    def _apply(self, job: Dict, stage: Stage, output: Dict, reused: bool) -> None:
+        job.update(output)
+        job['digests'][stage.name] = stage.fingerprint(output) if stage.fingerprint else content_digest(output)
+        getattr(self, f'_finish_{stage.name}', lambda job: None)(job)
+        if reused:
+            logger.info(f"Reusing stored {stage.name} output for '{job['topic']}' ({job['audience']})")
+            job.setdefault('reused_stages', []).append(stage.name)
+
+    def run_stage(self, job: Dict, stage_name: str) -> bool:
+        """
+        Run one stage for `job`, or restore its stored output.
+
+        Returns:
+            bool: True if the stored output was reused.
+        """
+        stage = STAGES[stage_name]
+        topic = job['topic']
+        with self.token_counter.scope(topic=topic, stage=stage.name), \
+                span(f'stage.{stage.name}', topic=topic, stage=stage.name, audience=job['audience']) as current:
+            key = self.stage_key(job, stage)
+            output = self._lookup(key, stage.cacheable)
+            if output is None and stage.name == 'analyze' and self._shrink_analysis(job):
+                key = self.stage_key(job, stage)
+                output = self._lookup(key)
+            reused = output is not None
+            if not reused:
+                output = self._execute(job, stage)
+                if output is None:
+                    current.set(deferred=True)
+                    return False
+                self._store(key, stage.name, output)
+            self._apply(job, stage, output, reused)
+
+            usage = self.token_counter.usage(topic=topic, stage=stage.name)
+            current.set(reused=reused, **{field: amount for field, amount in usage.items() if amount})
+        return reused
+
+    def _execute(self, job: Dict, stage: Stage) -> Optional[Dict]:
+        """Run a stage within its deadline. Returns None when a deferrable stage was deferred."""
+        run = getattr(self, f'_run_{stage.name}')
+        if self.scheduler is None:
+            return run(job)
+        if self.scheduler.should_defer(job, stage.name):
+            self._defer(job, stage, f"{self.scheduler.remaining(job):.1f}s left of the topic budget")
+            return None
+        try:
+            with deadline_scope(self.scheduler.stage_deadline(job, stage.name)):
+                return run(job)
+        except DeadlineExceeded as e:
+            if stage.name not in DEFERRABLE_STAGES:
+                self.scheduler.record(job, stage.name, 'cancelled', str(e))
+                raise
+            self._defer(job, stage, str(e))
+            return None
+
+    def _defer(self, job: Dict, stage: Stage, reason: str) -> None:
+        # Nothing is stored, so the stage runs when the topic is resumed
+        self.scheduler.record(job, stage.name, 'deferred', reason)
+        job[stage.name] = None
+
+    def _shrink_analysis(self, job: Dict) -> bool:
+        """Give the analysis a smaller content budget if the topic is short of time. Returns True if it did."""
+        # A fan-out analysis is shared by every audience of the topic, so it is not shrunk for one of them
+        if self.scheduler is None or self.fan_out:
+            return False
+        default_budget = self.token_budget or getattr(config, 'ANALYSIS_TOKEN_BUDGET', 3000)
+        budget = self.scheduler.analysis_token_budget(job, default_budget)
+        if budget is None or budget >= default_budget:
+            return False
+        job['analysis_token_budget'] = budget
+        self.scheduler.record(job, 'analyze', 'shrunk', f"{self.scheduler.remaining(job):.1f}s left",
+                              token_budget=budget)
+        return True
+
+    def run(self, job: Dict) -> Dict:
+        """Run every stage for one job in order."""
+        for stage_name in STAGE_NAMES:
+            self.run_stage(job, stage_name)
+        return job
+
+    def run_fan_out(self, topic: str, audiences: List[str], max_workers: Optional[int] = None) -> List[Dict]:
+        """
+        Generate scripts of one topic for several audiences.
+
+        The page is fetched and indexed once. Analysis and script generation run
+        concurrently, one thread per audience, and with `fan_out` set they share one
+        audience-neutral analysis. Finally all scripts are scored in one batched
+        engagement request.
+
+        Returns:
+            List[Dict]: One finished job per audience.
+        """
+        jobs = [{'topic': topic, 'audience': audience, 'basename': job_basename(topic, audience, len(audiences) > 1)}
+                for audience in audiences]
+        first = jobs[0]
+        self.run_stage(first, 'fetch')
+        self.run_stage(first, 'index')
+        for job in jobs[1:]:
+            job.update(topic_content=first['topic_content'], content_file=first['content_file'],
+                       index_stats=first['index_stats'], digests=dict(first['digests']))
+            if 'deadline' in first:
+                job['deadline'] = first['deadline']
+
+        def generate(job):
+            self.run_stage(job, 'analyze')
+            self.run_stage(job, 'script')
+
+        with ThreadPoolExecutor(max_workers=max_workers or len(jobs), thread_name_prefix='fan-out') as executor:
+            for future in [executor.submit(generate, job) for job in jobs]:
+                future.result()
+        self.run_engagement_batch(jobs)
+        return jobs
+
+    def run_engagement_batch(self, jobs: List[Dict]) -> None:
+        """Run the engagement stage for jobs of one topic, scoring every script not already scored in one request."""
+        from modules import script_generator
+
+        stage = STAGES['engagement']
+        pending = []
+        for job in jobs:
+            key = self.stage_key(job, stage)
+            output = self._lookup(key)
+            if output is not None:
+                self._apply(job, stage, output, reused=True)
+            elif self.scheduler is not None and self.scheduler.should_defer(job, stage.name):
+                self._defer(job, stage, f"{self.scheduler.remaining(job):.1f}s left of the topic budget")
+            else:
+                pending.append((job, key))
+        if not pending:
+            return
+
+        topic = pending[0][0]['topic']
+        audiences = [job['audience'] for job, _ in pending]
+        with self.token_counter.scope(topic=topic, stage=stage.name), \
+                span(f'stage.{stage.name}', topic=topic, stage=stage.name, audience=', '.join(audiences),
+                     scripts=len(pending)) as current:
+            deadline = None
+            if self.scheduler is not None:
+                deadline = min(self.scheduler.stage_deadline(job, stage.name) for job, _ in pending)
+            try:
+                with deadline_scope(deadline):
+                    results = script_generator.analyze_scripts_engagement(
+                        [job['script'] for job, _ in pending], self.token_counter, audiences)
+            except DeadlineExceeded as e:
+                for job, _ in pending:
+                    self._defer(job, stage, str(e))
+                current.set(deferred=True)
+                return
+            for (job, key), engagement in zip(pending, results):
+                output = {'engagement': engagement}
+                self._store(key, stage.name, output)
+                self._apply(job, stage, output, reused=False)
+            usage = self.token_counter.usage(topic=topic, stage=stage.name)
+            current.set(**{field: amount for field, amount in usage.items() if amount})
+
+    # -- fetch -------------------------------------------------------------------------------
+
+    def _params_fetch(self, job: Dict) -> Dict:
+        return {'topic': job['topic']}
+
+    def _run_fetch(self, job: Dict) -> Dict:
+        if 'topic_content' in job:
+            return {'topic_content': job['topic_content']}
+        return {'topic_content': self.wikipedia_fetcher.fetch_wikipedia_content(job['topic'])}
+
+    def _finish_fetch(self, job: Dict) -> None:
+        if 'content_file' not in job:
+            topic_filename = os.path.join(self.content_dir, f"{topic_basename(job['topic'])}.json")
+            self.wikipedia_fetcher.save_content(job['topic_content'], topic_filename)
+            job['content_file'] = topic_filename
+
+    # -- index -------------------------------------------------------------------------------
+
+    def _params_index(self, job: Dict) -> Dict:
+        return {}
+
+    def _run_index(self, job: Dict) -> Dict:
+        title = job['topic_content']['title']
+        with self._lock:
+            lock = self._index_locks.setdefault(title, threading.Lock())
+        # Other jobs of the topic wait until it is indexed, and retry if indexing failed
+        with lock:
+            if title in self._indexed_topics:
+                return {'index_stats': None}
+            stats = self.indexer.add_document_to_index(job['topic_content'])
+            self._indexed_topics.add(title)
+        return {'index_stats': {field: value for field, value in stats.items() if field != 'embedded_texts'}}
+
+    # -- analyze -----------------------------------------------------------------------------
+
+    def _analysis_budget(self, job: Dict) -> Tuple[bool, Optional[int]]:
+        """(compact, token budget) of the job's analysis; a budget shrunk by the scheduler forces compaction."""
+        if 'analysis_token_budget' in job:
+            return True, job['analysis_token_budget']
+        return self.compact, self.token_budget if self.compact else None
+
+    def _params_analyze(self, job: Dict) -> Dict:
+        # A shrunk analysis has its own key and is kept out of the semantic cache, so a later
+        # run with time to spare redoes it in full
+        compact, token_budget = self._analysis_budget(job)
+        return {'topic': job['topic'], 'audience': job['audience'], 'compact': compact,
+                'token_budget': token_budget, 'top_k': self.top_k if compact else None, 'fan_out': self.fan_out}
+
+    def _run_analyze(self, job: Dict) -> Dict:
+        from modules import content_analyzer
+        if self.fan_out:
+            neutral, compaction = self._neutral_analysis(job)
+            analysis = content_analyzer.adapt_analysis(neutral, job['topic'], job['audience'], self.token_counter)
+            return {'analysis': analysis, 'compaction': compaction}
+
+        content, compaction = job['topic_content']['content'], None
+        compact, token_budget = self._analysis_budget(job)
+        if compact:
+            content, compaction = content_analyzer.compact_content(
+                self.indexer, job['topic_content'], job['topic'], job['audience'], self.token_counter,
+                token_budget, self.top_k)
+        # The audience-specific compacted text differs between near-duplicate audiences, so the
+        # semantic cache matches on the page and the compaction settings instead
+        cache_context = {'page': job['digests']['fetch'], 'compact': compact, 'token_budget': token_budget,
+                         'top_k': self.top_k if compact else None}
+        analysis = content_analyzer.analyze_content(content, job['topic'], job['audience'], self.token_counter,
+                                                    cache_context,
+                                                    use_semantic_cache='analysis_token_budget' not in job)
+        return {'analysis': analysis, 'compaction': compaction}
+
+    def _neutral_analysis(self, job: Dict) -> Tuple[Dict, Optional[Dict]]:
+        """
+        The audience-neutral analysis of the job's page, computed once per page and
+        parameters: concurrent callers wait for the first one, later runs read it from
+        the artifact store.
+        """
+        from modules import content_analyzer
+
+        key = artifact_key('analyze.neutral', {
+            'version': ARTIFACT_VERSION,
+            'params': {'topic': job['topic'], 'compact': self.compact,
+                       'token_budget': self.token_budget if self.compact else None,
+                       'top_k': self.top_k if self.compact else None},
+            'deps': {'fetch': job['digests']['fetch']},
+        })
+        with self._lock:
+            lock = self._neutral_locks.setdefault(key, threading.Lock())
+        with lock:
+            if key in self._neutral:
+                return self._neutral[key]
+            with span('analyze.neutral', topic=job['topic']) as current:
+                output = self._lookup(key)
+                current.set(reused=output is not None)
+                if output is None:
+                    content, compaction = job['topic_content']['content'], None
+                    if self.compact:
+                        content, compaction = content_analyzer.compact_content(
+                            self.indexer, job['topic_content'], job['topic'], 'a general audience',
+                            self.token_counter, self.token_budget, self.top_k)
+                    analysis = content_analyzer.analyze_content_neutral(content, job['topic'], self.token_counter)
+                    output = {'analysis': analysis, 'compaction': compaction}
+                    self._store(key, 'analyze.neutral', output)
+            self._neutral[key] = (output['analysis'], output['compaction'])
+            return self._neutral[key]
+
+    # -- script ------------------------------------------------------------------------------
+
+    def _params_script(self, job: Dict) -> Dict:
+        return {'audience': job['audience']}
+
+    def _script_filename(self, job: Dict) -> str:
+        return os.path.join(self.script_dir, f"{job.get('basename') or topic_basename(job['topic'])}_script.txt")
+
+    def _run_script(self, job: Dict) -> Dict:
+        from modules import script_generator
+        if not self.stream:
+            return {'script': script_generator.generate_tiktok_script(job['analysis'], job['audience'],
+                                                                      self.token_counter)}
+
+        # Write the script as it arrives; _finish_script rewrites the file with the final text
+        started = time.perf_counter()
+        first_token_at = None
+
+        with open(self._script_filename(job), 'w', encoding='utf-8') as f:
+            def on_text(text):
+                nonlocal first_token_at
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                f.write(text)
+                f.flush()
+                if self.echo:
+                    sys.stdout.write(text)
+                    sys.stdout.flush()
+
+            script = script_generator.generate_tiktok_script(job['analysis'], job['audience'], self.token_counter,
+                                                             on_text=on_text)
+        if self.echo:
+            sys.stdout.write('\n')
+        if first_token_at is not None:
+            job['script_ttft'] = round(first_token_at - started, 3)
+        return {'script': script}
+
+    def _finish_script(self, job: Dict) -> None:
+        script_filename = self._script_filename(job)
+        with span('write', path=script_filename), open(script_filename, 'w', encoding='utf-8') as f:
+            f.write(job['script'])
+        job.setdefault('files', {})['script'] = script_filename
+
+    # -- engagement --------------------------------------------------------------------------
+
+    def _params_engagement(self, job: Dict) -> Dict:
+        return {}
+
+    def _run_engagement(self, job: Dict) -> Dict:
+        from modules import script_generator
+        return {'engagement': script_generator.analyze_script_engagement(job['script'], self.token_counter)}
+
+    def _finish_engagement(self, job: Dict) -> None:
+        engagement_filename = os.path.join(
+            self.script_dir, f"{job.get('basename') or topic_basename(job['topic'])}_engagement.txt")
+        with span('write', path=engagement_filename), open(engagement_filename, 'w', encoding='utf-8') as f:
+            f.write(job['engagement']['engagement_analysis'])
+        job.setdefault('files', {})['engagement'] = engagement_filename
@@ -1,29 +1,267 @@
-import tiktoken
+import logging
+import threading
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+import config
+
+logger = logging.getLogger(__name__)
+
+# USD per 1K tokens. Local embedding models cost nothing.
+PRICING = {
+    'claude-2.1': {'prompt': 0.008, 'completion': 0.024},
+    'claude-2.0': {'prompt': 0.008, 'completion': 0.024},
+    'claude-instant-1.2': {'prompt': 0.0008, 'completion': 0.0024},
+    'claude-3-haiku': {'prompt': 0.00025, 'completion': 0.00125},
+    'claude-3-sonnet': {'prompt': 0.003, 'completion': 0.015},
+    'claude-3-opus': {'prompt': 0.015, 'completion': 0.075},
+    'gpt-3.5-turbo': {'prompt': 0.0015, 'completion': 0.002},
+    'gpt-3.5-turbo-16k': {'prompt': 0.003, 'completion': 0.004},
+    'gpt-4-0613': {'prompt': 0.03, 'completion': 0.06},
+    'gpt-4-32k': {'prompt': 0.06, 'completion': 0.12},
+}
+EMBEDDING_PRICING = {
+    'hugging_face': 0.0,
+    'text-embedding-ada-002': 0.0001,
+}
+
+# Encoding used for models tiktoken does not know (Claude, local embedding models). It is
+# only used for local estimates; billed LLM usage comes from the API responses.
+FALLBACK_ENCODING = 'cl100k_base'
+
+# Texts shorter than this are counted inline; longer batches are counted on tiktoken's thread pool
+BATCH_COUNT_MIN_CHARS = 100000
+
+USAGE_FIELDS = ('prompt_tokens', 'completion_tokens', 'embedding_tokens', 'requests',
+                'cache_hits', 'cache_misses', 'cached_prompt_tokens', 'cached_completion_tokens')
+
+
+@lru_cache(maxsize=None)
+def get_encoder(model: str):
+    """Return the tiktoken encoder for `model`, loading it once per process."""
+    import tiktoken
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding(FALLBACK_ENCODING)
+
+
+def get_pricing(model: Optional[str]) -> Dict[str, float]:
+    """
+    Look up the price of an LLM per 1K prompt and completion tokens.
+
+    Dated model versions (e.g. 'claude-3-haiku-20240307') match their family entry.
+    Unknown models are priced at zero with a warning instead of failing the run.
+    """
+    if model in PRICING:
+        return PRICING[model]
+    for name in sorted(PRICING, key=len, reverse=True):
+        if model and model.startswith(name):
+            return PRICING[name]
+    _warn_unpriced(model)
+    return {'prompt': 0.0, 'completion': 0.0}
+
+
+def get_embedding_pricing(model: Optional[str]) -> float:
+    """Price per 1K tokens of an embedding model; models not in the table run locally and are free."""
+    return EMBEDDING_PRICING.get(model, 0.0)
+
+
+@lru_cache(maxsize=None)
+def _warn_unpriced(model: Optional[str]) -> None:
+    logger.warning(f"No pricing known for model '{model}', counting its cost as 0")
+
+
+def _empty_usage() -> Dict[str, int]:
+    return dict.fromkeys(USAGE_FIELDS, 0)
+
 
 class TokenCounter:
-    def __init__(self):
-        self.total_embedding_token_count = 0
-        self.prompt_llm_token_count = 0
-        self.completion_llm_token_count = 0
+    """
+    Thread-safe token and cost accounting for a run.
+
+    Every recorded amount is attributed to a (topic, stage, model) key so totals can be
+    broken down per topic, per stage or per model. Topic and stage come from the
+    innermost `scope()` active on the recording thread, so worker threads that handle
+    different topics at the same time keep their numbers apart.
+    """
+
+    def __init__(self, llm_model: Optional[str] = None, embedding_model: Optional[str] = None):
+        self.llm_model = llm_model or getattr(config, 'LLM_MODEL', 'claude-2.1')
+        self.embedding_model = embedding_model or getattr(config, 'EMBEDDING_MODEL', 'hugging_face')
+        self._usage = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    # -- scopes ------------------------------------------------------------------------------
+
+    @contextmanager
+    def scope(self, topic: Optional[str] = None, stage: Optional[str] = None):
+        """Attribute everything recorded on this thread inside the block to `topic` and/or `stage`."""
+        previous = getattr(self._local, 'scope', (None, None))
+        self._local.scope = (topic if topic is not None else previous[0], stage if stage is not None else previous[1])
+        try:
+            yield
+        finally:
+            self._local.scope = previous
+
+    def _record(self, model: Optional[str], **amounts) -> None:
+        topic, stage = getattr(self._local, 'scope', (None, None))
+        with self._lock:
+            usage = self._usage.setdefault((topic, stage, model), _empty_usage())
+            for field, amount in amounts.items():
+                usage[field] += amount
+
+    def _total(self, field: str) -> int:
+        with self._lock:
+            return sum(usage[field] for usage in self._usage.values())
+
+    # -- counting ----------------------------------------------------------------------------
+
+    def count_tokens(self, text: str, model: str = "gpt-3.5-turbo") -> int:
+        return len(get_encoder(model).encode_ordinary(text))
+
+    def count_tokens_batch(self, texts: List[str], model: str = "gpt-3.5-turbo") -> List[int]:
+        """Count tokens of many texts; large batches are encoded on tiktoken's native thread pool."""
+        encoder = get_encoder(model)
+        if sum(len(text) for text in texts) < BATCH_COUNT_MIN_CHARS:
+            return [len(encoder.encode_ordinary(text)) for text in texts]
+        return [len(tokens) for tokens in encoder.encode_ordinary_batch(texts)]
+
+    def truncate_to_tokens(self, text: str, max_tokens: int, model: str = "gpt-3.5-turbo") -> str:
+        encoder = get_encoder(model)
+        tokens = encoder.encode_ordinary(text)
+        if len(tokens) <= max_tokens:
+            return text
+        return encoder.decode(tokens[:max_tokens])
+
+    # -- recording ---------------------------------------------------------------------------
+
+    def add_embedding_tokens(self, token_count: int, model: Optional[str] = None):
+        self._record(model or self.embedding_model, embedding_tokens=token_count)
+
+    def add_prompt_tokens(self, token_count: int, model: Optional[str] = None):
+        self._record(model or self.llm_model, prompt_tokens=token_count)
+
+    def add_completion_tokens(self, token_count: int, model: Optional[str] = None):
+        self._record(model or self.llm_model, completion_tokens=token_count)
+
+    def add_llm_usage(self, prompt_tokens: int, completion_tokens: int, model: Optional[str] = None):
+        """Record one billed LLM request."""
+        self._record(model or self.llm_model, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+                     requests=1)
+
+    def add_cache_hit(self, prompt_tokens: int, completion_tokens: int, model: Optional[str] = None):
+        self._record(model or self.llm_model, cache_hits=1, cached_prompt_tokens=prompt_tokens,
+                     cached_completion_tokens=completion_tokens)
+
+    def add_cache_miss(self, model: Optional[str] = None):
+        self._record(model or self.llm_model, cache_misses=1)
+
+    # -- totals ------------------------------------------------------------------------------
+
+    @property
+    def total_embedding_token_count(self) -> int:
+        return self._total('embedding_tokens')
 
     @property
-    def total_llm_token_count(self):
+    def prompt_llm_token_count(self) -> int:
+        return self._total('prompt_tokens')
+
+    @property
+    def completion_llm_token_count(self) -> int:
+        return self._total('completion_tokens')
+
+    @property
+    def total_llm_token_count(self) -> int:
         return self.prompt_llm_token_count + self.completion_llm_token_count
 
-    def count_tokens(self, text: str, model: str = "gpt-3.5-turbo") -> int:
-        encoder = tiktoken.encoding_for_model(model)
-        return len(encoder.encode(text))
+    @property
+    def cache_hits(self) -> int:
+        return self._total('cache_hits')
+
+    @property
+    def cache_misses(self) -> int:
+        return self._total('cache_misses')
+
+    @property
+    def cached_prompt_token_count(self) -> int:
+        return self._total('cached_prompt_tokens')
+
+    @property
+    def cached_completion_token_count(self) -> int:
+        return self._total('cached_completion_tokens')
+
+    @staticmethod
+    def _cost(model: Optional[str], usage: Dict[str, int]) -> Dict[str, float]:
+        if usage['embedding_tokens']:
+            embedding = get_embedding_pricing(model) * usage['embedding_tokens'] / 1000
+        else:
+            embedding = 0.0
+        if usage['prompt_tokens'] or usage['completion_tokens'] or usage['cache_hits']:
+            pricing = get_pricing(model)
+        else:
+            pricing = {'prompt': 0.0, 'completion': 0.0}
+        return {
+            'embedding': embedding,
+            'prompt': pricing['prompt'] * usage['prompt_tokens'] / 1000,
+            'completion': pricing['completion'] * usage['completion_tokens'] / 1000,
+            'cache_savings': (pricing['prompt'] * usage['cached_prompt_tokens']
+                              + pricing['completion'] * usage['cached_completion_tokens']) / 1000,
+        }
+
+    def usage(self, topic: Optional[str] = None, stage: Optional[str] = None) -> Dict[str, int]:
+        """Token counts summed over all models for one topic and/or stage (None matches any)."""
+        totals = _empty_usage()
+        with self._lock:
+            for (usage_topic, usage_stage, _), usage in self._usage.items():
+                if (topic is None or usage_topic == topic) and (stage is None or usage_stage == stage):
+                    for field in USAGE_FIELDS:
+                        totals[field] += usage[field]
+        return totals
+
+    def breakdown(self, by: str = 'topic') -> Dict[Optional[str], Dict]:
+        """
+        Usage and cost grouped by 'topic', 'stage' or 'model'.
 
-    def add_embedding_tokens(self, token_count: int):
-        self.total_embedding_token_count += token_count
+        Returns:
+            Dict: Maps each group (None for usage recorded outside any scope) to its token
+                counts plus 'cost' (USD, excluding cache savings) and 'cache_savings'.
+        """
+        position = {'topic': 0, 'stage': 1, 'model': 2}[by]
+        with self._lock:
+            items = [(key, dict(usage)) for key, usage in self._usage.items()]
+        groups = {}
+        for key, usage in items:
+            group = groups.setdefault(key[position], dict(_empty_usage(), cost=0.0, cache_savings=0.0))
+            for field in USAGE_FIELDS:
+                group[field] += usage[field]
+            cost = self._cost(key[2], usage)
+            group['cost'] += cost['embedding'] + cost['prompt'] + cost['completion']
+            group['cache_savings'] += cost['cache_savings']
+        return groups
 
-    def add_prompt_tokens(self, token_count: int):
-        self.prompt_llm_token_count += token_count
+    def costs(self) -> Dict[str, float]:
+        """Total cost in USD per kind: embedding, prompt, completion, total and cache_savings."""
+        with self._lock:
+            items = [(key, dict(usage)) for key, usage in self._usage.items()]
+        totals = {'embedding': 0.0, 'prompt': 0.0, 'completion': 0.0, 'cache_savings': 0.0}
+        for key, usage in items:
+            for kind, amount in self._cost(key[2], usage).items():
+                totals[kind] += amount
+        totals['total'] = totals['embedding'] + totals['prompt'] + totals['completion']
+        return totals
 
-    def add_completion_tokens(self, token_count: int):
-        self.completion_llm_token_count += token_count
 
-def print_token_count(token_counter, embed_model, model="gpt-3.5-turbo"):
+def print_token_count(token_counter, embed_model=None, model=None):
+    """
+    Print token usage and cost.
+
+    Costs are computed from the models each amount was recorded for; `embed_model` and
+    `model` are kept for compatibility with older callers and are not needed.
+    """
+    costs = token_counter.costs()
     print(
         "Embedding Tokens: ",
         token_counter.total_embedding_token_count,
@@ -38,26 +276,40 @@ def print_token_count(token_counter, embed_model, model="gpt-3.5-turbo"):
         token_counter.total_llm_token_count,
         "\n",
     )
-    pricing = {
-        'gpt-3.5-turbo': {'prompt': 0.0015, 'completion': 0.002},
-        'gpt-3.5-turbo-16k': {'prompt': 0.003, 'completion': 0.004},
-        'gpt-4-0613': {'prompt': 0.03, 'completion': 0.06},
-        'gpt-4-32k': {'prompt': 0.06, 'completion': 0.12},
-        'embedding': {'hugging_face': 0, 'text-embedding-ada-002': 0.0001}
-    }
     print(
         "Embedding Cost: ",
-        pricing['embedding'][embed_model] * token_counter.total_embedding_token_count/1000,
+        costs['embedding'],
         "\n",
         "LLM Prompt Cost: ",
-        pricing[model]["prompt"] * token_counter.prompt_llm_token_count/1000,
+        costs['prompt'],
         "\n",
         "LLM Completion Cost: ",
-        pricing[model]["completion"] * token_counter.completion_llm_token_count/1000,
+        costs['completion'],
         "\n",
         "Total LLM Cost: ",
-        pricing[model]["prompt"] * token_counter.prompt_llm_token_count/1000 + pricing[model]["completion"] * token_counter.completion_llm_token_count/1000,
+        costs['prompt'] + costs['completion'],
         "\n",
         "Total cost: ",
-        pricing['embedding'][embed_model] * token_counter.total_embedding_token_count/1000 + pricing[model]["prompt"] * token_counter.prompt_llm_token_count/1000 + pricing[model]["completion"] * token_counter.completion_llm_token_count/1000,
-    )
\ No newline at end of file
+        costs['total'],
+    )
+    print(
+        "LLM Cache Hits: ",
+        token_counter.cache_hits,
+        "\n",
+        "LLM Cache Misses: ",
+        token_counter.cache_misses,
+        "\n",
+        "Cached Tokens (not billed): ",
+        token_counter.cached_prompt_token_count + token_counter.cached_completion_token_count,
+        "\n",
+        "Cache Savings: ",
+        costs['cache_savings'],
+    )
+    for group, title in (('stage', 'Cost per stage'), ('topic', 'Cost per topic')):
+        breakdown = token_counter.breakdown(group)
+        if not any(key is not None for key in breakdown):
+            continue
+        print(f"\n{title}:")
+        for key, usage in sorted(breakdown.items(), key=lambda item: item[1]['cost'], reverse=True):
+            print(f"  {key or '(unattributed)'}: ${usage['cost']:.4f} ({usage['prompt_tokens']} prompt, "
+                  f"{usage['completion_tokens']} completion, {usage['embedding_tokens']} embedding tokens)")
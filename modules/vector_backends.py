@@ -0,0 +1,608 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+import config
+
+logger = logging.getLogger(__name__)
+
+# (point id, cosine similarity, payload)
+SearchHit = Tuple[str, float, Dict]
+
+# IDs per `IN (...)` query, well below SQLite's limit on variables per statement
+SQL_BATCH_SIZE = 500
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class VectorBackend:
+    """
+    Storage and search interface behind `VectorStore`.
+
+    Backends store one vector and one JSON payload per point ID and answer batched
+    cosine-similarity searches with optional exact-match payload filters.
+    """
+
+    name = 'base'
+
+    def upsert(self, ids: Sequence[str], vectors, payloads: Sequence[Dict]) -> None:
+        raise NotImplementedError
+
+    def delete(self, ids: Sequence[str]) -> None:
+        raise NotImplementedError
+
+    def search(self, vectors, top_k: int, filters: Optional[Dict] = None) -> List[List[SearchHit]]:
+        raise NotImplementedError
+
+    def get(self, ids: Sequence[str]) -> Dict[str, Dict]:
+        """Payloads of the given point IDs; unknown IDs are left out."""
+        raise NotImplementedError
+
+    def count(self) -> int:
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        raise NotImplementedError
+
+    @contextmanager
+    def bulk_load(self):
+        """Context for loading many points at once; backends may defer index maintenance until it exits."""
+        yield
+
+
+class QdrantBackend(VectorBackend):
+    """
+    Qdrant server, or Qdrant's local mode when `location` (':memory:') or `path` is given.
+
+    Writes go through `upload_points` in batches of `upsert_batch_size`, optionally from
+    `upsert_parallel` worker processes, and over gRPC with `prefer_grpc`. New collections
+    get keyword payload indexes on `payload_indexes`, the given HNSW parameters and,
+    for large collections, int8 scalar quantization and on-disk vectors. Inside
+    `bulk_load()` HNSW indexing is switched off and restored afterwards, so the graph is
+    built once instead of being updated with every batch.
+    """
+
+    name = 'qdrant'
+
+    def __init__(self, collection_name: str, client=None, host: Optional[str] = None, port: Optional[int] = None,
+                 location: Optional[str] = None, path: Optional[str] = None, prefer_grpc: bool = False,
+                 grpc_port: int = 6334, upsert_batch_size: int = 256, upsert_parallel: int = 1,
+                 payload_indexes: Sequence[str] = ('title', 'url'), hnsw_m: Optional[int] = None,
+                 hnsw_ef_construct: Optional[int] = None, search_hnsw_ef: Optional[int] = None,
+                 quantization: Optional[str] = None, on_disk: bool = False,
+                 indexing_threshold: Optional[int] = None):
+        from qdrant_client import QdrantClient
+
+        if quantization not in (None, 'int8'):
+            raise ValueError(f"Unsupported quantization '{quantization}'. Expected 'int8' or None.")
+        if client is None:
+            if location or path:
+                client = QdrantClient(location=location, path=path)
+            else:
+                client = QdrantClient(host=host, port=port, grpc_port=grpc_port, prefer_grpc=prefer_grpc)
+        self.client = client
+        self.collection_name = collection_name
+        self.upsert_batch_size = upsert_batch_size
+        self.upsert_parallel = upsert_parallel
+        self.payload_indexes = list(payload_indexes)
+        self.hnsw_m = hnsw_m
+        self.hnsw_ef_construct = hnsw_ef_construct
+        self.search_hnsw_ef = search_hnsw_ef
+        self.quantization = quantization
+        self.on_disk = on_disk
+        # Qdrant's own default applies when None
+        self.indexing_threshold = indexing_threshold
+        self._collection_ready = False
+        self._bulk_loading = False
+
+    def _ensure_collection(self, dim: int) -> None:
+        from qdrant_client.http import models as rest
+
+        if self._collection_ready:
+            return
+        if not self.client.collection_exists(self.collection_name):
+            quantization_config = None
+            if self.quantization == 'int8':
+                quantization_config = rest.ScalarQuantization(scalar=rest.ScalarQuantizationConfig(
+                    type=rest.ScalarType.INT8, quantile=0.99, always_ram=True))
+            self.client.create_collection(
+                collection_name=self.collection_name,
+                vectors_config=rest.VectorParams(size=dim, distance=rest.Distance.COSINE, on_disk=self.on_disk or None),
+                hnsw_config=rest.HnswConfigDiff(m=self.hnsw_m, ef_construct=self.hnsw_ef_construct,
+                                                on_disk=self.on_disk or None),
+                optimizers_config=rest.OptimizersConfigDiff(
+                    indexing_threshold=0 if self._bulk_loading else self.indexing_threshold),
+                quantization_config=quantization_config,
+                on_disk_payload=self.on_disk or None,
+            )
+            for field_name in self.payload_indexes:
+                self.client.create_payload_index(self.collection_name, field_name,
+                                                 field_schema=rest.PayloadSchemaType.KEYWORD)
+        self._collection_ready = True
+
+    def _set_indexing_threshold(self, threshold: Optional[int]) -> None:
+        from qdrant_client.http import models as rest
+
+        if self.client.collection_exists(self.collection_name):
+            self.client.update_collection(
+                collection_name=self.collection_name,
+                # 20000 KB is Qdrant's default threshold
+                optimizers_config=rest.OptimizersConfigDiff(
+                    indexing_threshold=threshold if threshold is not None else 20000),
+            )
+
+    @contextmanager
+    def bulk_load(self):
+        if self._bulk_loading:
+            yield
+            return
+        self._bulk_loading = True
+        self._set_indexing_threshold(0)
+        try:
+            yield
+        finally:
+            self._bulk_loading = False
+            self._set_indexing_threshold(self.indexing_threshold)
+
+    @staticmethod
+    def _build_filter(filters: Optional[Dict]):
+        from qdrant_client.http import models as rest
+
+        if not filters:
+            return None
+        return rest.Filter(must=[
+            rest.FieldCondition(key=key, match=rest.MatchValue(value=value)) for key, value in filters.items()
+        ])
+
+    def upsert(self, ids: Sequence[str], vectors, payloads: Sequence[Dict]) -> None:
+        from qdrant_client.http import models as rest
+
+        if not len(ids):
+            return
+        vectors = np.asarray(vectors, dtype=np.float32)
+        self._ensure_collection(vectors.shape[1])
+        self.client.upload_points(
+            collection_name=self.collection_name,
+            points=[rest.PointStruct(id=point_id, vector=vector.tolist(), payload=payload)
+                    for point_id, vector, payload in zip(ids, vectors, payloads)],
+            batch_size=self.upsert_batch_size,
+            parallel=self.upsert_parallel,
+            wait=True,
+        )
+
+    def delete(self, ids: Sequence[str]) -> None:
+        from qdrant_client.http import models as rest
+
+        if ids and self.client.collection_exists(self.collection_name):
+            self.client.delete(collection_name=self.collection_name,
+                               points_selector=rest.PointIdsList(points=list(ids)))
+
+    def search(self, vectors, top_k: int, filters: Optional[Dict] = None) -> List[List[SearchHit]]:
+        from qdrant_client.http import models as rest
+
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if not self.client.collection_exists(self.collection_name):
+            return [[] for _ in range(len(vectors))]
+        query_filter = self._build_filter(filters)
+        params = None
+        if self.search_hnsw_ef or self.quantization:
+            params = rest.SearchParams(
+                hnsw_ef=self.search_hnsw_ef,
+                quantization=rest.QuantizationSearchParams(rescore=True) if self.quantization else None,
+            )
+        responses = self.client.search_batch(
+            collection_name=self.collection_name,
+            requests=[rest.SearchRequest(vector=vector.tolist(), limit=top_k, filter=query_filter, params=params,
+                                         with_payload=True)
+                      for vector in vectors],
+        )
+        return [[(str(point.id), point.score, point.payload) for point in points] for points in responses]
+
+    def get(self, ids: Sequence[str]) -> Dict[str, Dict]:
+        if not ids or not self.client.collection_exists(self.collection_name):
+            return {}
+        points = self.client.retrieve(self.collection_name, ids=list(ids), with_payload=True, with_vectors=False)
+        return {str(point.id): point.payload for point in points}
+
+    def count(self) -> int:
+        if not self.client.collection_exists(self.collection_name):
+            return 0
+        return self.client.count(self.collection_name, exact=True).count
+
+    def clear(self) -> None:
+        if self.client.collection_exists(self.collection_name):
+            self.client.delete_collection(self.collection_name)
+        self._collection_ready = False
+
+
+class EmbeddedBackend(VectorBackend):
+    """
+    In-process vector store for single-node jobs and CI, with no server to run.
+
+    Vectors are L2-normalized and kept contiguously in a memory-mapped file as float16,
+    or as int8 with one float32 scale per row. Point IDs and payloads live in a SQLite
+    side table that maps them to rows. Search is a blocked NumPy matrix product over all
+    rows; once the collection passes `ivf_threshold` rows, an IVF index (k-means
+    centroids with `nprobe` probed lists) restricts scoring to a fraction of the rows.
+    Searches with a payload filter score all matching rows exactly.
+    """
+
+    name = 'embedded'
+
+    def __init__(self, path: str, dtype: str = 'float16', ivf_threshold: Optional[int] = 100000,
+                 nprobe: int = 8, block_size: int = 65536):
+        if dtype not in ('float16', 'int8'):
+            raise ValueError(f"Unsupported vector dtype '{dtype}'. Expected 'float16' or 'int8'.")
+        self.path = path
+        self.dtype = dtype
+        self.ivf_threshold = ivf_threshold
+        self.nprobe = nprobe
+        self.block_size = block_size
+        self._lock = threading.RLock()
+        os.makedirs(path, exist_ok=True)
+
+        self._db = sqlite3.connect(os.path.join(path, 'points.sqlite3'), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS points (id TEXT PRIMARY KEY, row INTEGER NOT NULL, payload TEXT NOT NULL)")
+        self._db.execute("CREATE UNIQUE INDEX IF NOT EXISTS points_row ON points (row)")
+        self._db.commit()
+
+        self.dim = None
+        self.capacity = 0
+        self.rows = 0  # High-water mark of used rows
+        self._vectors = None
+        self._scales = None
+        self._ivf = None
+        self._bulk_loading = False
+        meta = self._read_meta()
+        if meta:
+            if meta['dtype'] != dtype:
+                raise ValueError(f"Vector store at {path} uses {meta['dtype']} vectors, not {dtype}.")
+            self.dim, self.capacity, self.rows = meta['dim'], meta['capacity'], meta['rows']
+            self._open_arrays()
+            self._load_ivf()
+
+        self._alive = np.zeros(self.capacity, dtype=bool)
+        used_rows = [row for (row,) in self._db.execute("SELECT row FROM points")]
+        self._alive[used_rows] = True
+        self._free_rows = sorted(set(range(self.rows)) - set(used_rows), reverse=True)
+
+    # -- storage ---------------------------------------------------------------------------
+
+    def _read_meta(self) -> Optional[Dict]:
+        meta_path = os.path.join(self.path, 'meta.json')
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _write_meta(self) -> None:
+        meta_path = os.path.join(self.path, 'meta.json')
+        with open(f"{meta_path}.tmp", 'w', encoding='utf-8') as f:
+            json.dump({'dim': self.dim, 'dtype': self.dtype, 'capacity': self.capacity, 'rows': self.rows}, f)
+        os.replace(f"{meta_path}.tmp", meta_path)
+
+    def _open_arrays(self) -> None:
+        storage_dtype = np.float16 if self.dtype == 'float16' else np.int8
+        vector_path = os.path.join(self.path, f'vectors.{self.dtype}')
+        self._resize_file(vector_path, self.capacity * self.dim * np.dtype(storage_dtype).itemsize)
+        self._vectors = np.memmap(vector_path, dtype=storage_dtype, mode='r+', shape=(self.capacity, self.dim))
+        if self.dtype == 'int8':
+            scale_path = os.path.join(self.path, 'scales.float32')
+            self._resize_file(scale_path, self.capacity * 4)
+            self._scales = np.memmap(scale_path, dtype=np.float32, mode='r+', shape=(self.capacity,))
+
+    @staticmethod
+    def _resize_file(path: str, size: int) -> None:
+        with open(path, 'ab') as f:
+            if f.tell() < size:
+                f.truncate(size)
+
+    def _grow(self, needed_rows: int) -> None:
+        if needed_rows <= self.capacity:
+            return
+        capacity = max(1024, self.capacity)
+        while capacity < needed_rows:
+            capacity *= 2
+        if self._vectors is not None:
+            self._vectors.flush()
+            del self._vectors
+        self.capacity = capacity
+        self._open_arrays()
+        alive = np.zeros(capacity, dtype=bool)
+        alive[:len(self._alive)] = self._alive
+        self._alive = alive
+        if self._ivf is not None:
+            assignments = np.full(capacity, -1, dtype=np.int32)
+            assignments[:len(self._ivf['assignments'])] = self._ivf['assignments']
+            self._ivf['assignments'] = assignments
+
+    def _encode(self, vectors: np.ndarray):
+        if self.dtype == 'float16':
+            return vectors.astype(np.float16), None
+        scales = np.abs(vectors).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        return np.round(vectors / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+
+    def _decode_rows(self, rows) -> np.ndarray:
+        vectors = np.asarray(self._vectors[rows], dtype=np.float32)
+        if self.dtype == 'int8':
+            vectors *= self._scales[rows][:, None]
+        return vectors
+
+    # -- IVF index -------------------------------------------------------------------------
+
+    def _load_ivf(self) -> None:
+        ivf_path = os.path.join(self.path, 'ivf.npz')
+        if os.path.exists(ivf_path):
+            data = np.load(ivf_path)
+            assignments = np.full(self.capacity, -1, dtype=np.int32)
+            assignments[:len(data['assignments'])] = data['assignments']
+            self._ivf = {'centroids': data['centroids'], 'assignments': assignments,
+                         'trained_rows': int(data['trained_rows']), 'lists': None}
+
+    def _save_ivf(self) -> None:
+        ivf_path = os.path.join(self.path, 'ivf.npz')
+        with open(f"{ivf_path}.tmp", 'wb') as f:
+            np.savez(f, centroids=self._ivf['centroids'], assignments=self._ivf['assignments'][:self.rows],
+                     trained_rows=self._ivf['trained_rows'])
+        os.replace(f"{ivf_path}.tmp", ivf_path)
+
+    def _train_ivf(self, iterations: int = 10, seed: int = 0) -> None:
+        live_rows = np.flatnonzero(self._alive[:self.rows])
+        nlist = max(1, int(4 * np.sqrt(len(live_rows))))
+        rng = np.random.default_rng(seed)
+        sample_rows = np.sort(rng.choice(live_rows, size=min(len(live_rows), nlist * 64), replace=False))
+        sample = self._decode_rows(sample_rows)
+        centroids = sample[rng.choice(len(sample), size=nlist, replace=False)]
+        for _ in range(iterations):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            for c in range(nlist):
+                members = sample[labels == c]
+                if len(members):
+                    centroids[c] = members.mean(axis=0)
+            centroids = _normalize(centroids)
+
+        assignments = np.full(self.capacity, -1, dtype=np.int32)
+        for start in range(0, self.rows, self.block_size):
+            rows = np.arange(start, min(start + self.block_size, self.rows))
+            assignments[rows] = np.argmax(self._decode_rows(rows) @ centroids.T, axis=1)
+        self._ivf = {'centroids': centroids, 'assignments': assignments, 'trained_rows': len(live_rows),
+                     'lists': None}
+        self._save_ivf()
+        logger.info(f"Trained IVF index with {nlist} lists over {len(live_rows)} vectors")
+
+    def _maybe_train_ivf(self) -> None:
+        live = int(self._alive.sum())
+        if self.ivf_threshold is None or live < self.ivf_threshold:
+            return
+        # Retrain when the collection has doubled since the centroids were fit
+        if self._ivf is None or live >= 2 * self._ivf['trained_rows']:
+            self._train_ivf()
+
+    def _ivf_lists(self) -> List[np.ndarray]:
+        if self._ivf['lists'] is None:
+            assignments = self._ivf['assignments'][:self.rows]
+            order = np.argsort(assignments, kind='stable')
+            bounds = np.searchsorted(assignments[order], np.arange(len(self._ivf['centroids']) + 1))
+            self._ivf['lists'] = [order[bounds[c]:bounds[c + 1]] for c in range(len(self._ivf['centroids']))]
+        return self._ivf['lists']
+
+    def _select_by_ids(self, columns: str, ids: Sequence[str]) -> List[Tuple]:
+        ids = list(ids)
+        rows = []
+        for start in range(0, len(ids), SQL_BATCH_SIZE):
+            batch = ids[start:start + SQL_BATCH_SIZE]
+            rows.extend(self._db.execute(
+                f"SELECT {columns} FROM points WHERE id IN ({','.join('?' * len(batch))})", batch))
+        return rows
+
+    # -- public API ------------------------------------------------------------------------
+
+    def upsert(self, ids: Sequence[str], vectors, payloads: Sequence[Dict]) -> None:
+        if not len(ids):
+            return
+        vectors = _normalize(vectors)
+        with self._lock:
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"Expected {self.dim}-dimensional vectors, got {vectors.shape[1]}.")
+
+            existing = dict(self._select_by_ids('id, row', ids))
+            rows = []
+            for point_id in ids:
+                if point_id in existing:
+                    rows.append(existing[point_id])
+                elif self._free_rows:
+                    rows.append(self._free_rows.pop())
+                else:
+                    rows.append(self.rows)
+                    self.rows += 1
+            self._grow(self.rows)
+
+            rows = np.asarray(rows)
+            encoded, scales = self._encode(vectors)
+            self._vectors[rows] = encoded
+            if scales is not None:
+                self._scales[rows] = scales
+            self._alive[rows] = True
+            if self._ivf is not None:
+                self._ivf['assignments'][rows] = np.argmax(vectors @ self._ivf['centroids'].T, axis=1)
+                self._ivf['lists'] = None
+
+            with self._db:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO points (id, row, payload) VALUES (?, ?, ?)",
+                    [(point_id, int(row), json.dumps(payload, ensure_ascii=False))
+                     for point_id, row, payload in zip(ids, rows, payloads)],
+                )
+            self._vectors.flush()
+            if self._scales is not None:
+                self._scales.flush()
+            self._write_meta()
+            if not self._bulk_loading:
+                self._update_ivf()
+
+    def _update_ivf(self) -> None:
+        self._maybe_train_ivf()
+        if self._ivf is not None:
+            self._save_ivf()
+
+    @contextmanager
+    def bulk_load(self):
+        # Train and save the IVF index once at the end instead of after every batch
+        with self._lock:
+            nested, self._bulk_loading = self._bulk_loading, True
+        try:
+            yield
+        finally:
+            if not nested:
+                with self._lock:
+                    self._bulk_loading = False
+                    self._update_ivf()
+
+    def delete(self, ids: Sequence[str]) -> None:
+        if not ids:
+            return
+        with self._lock:
+            rows = [row for (row,) in self._select_by_ids('row', ids)]
+            with self._db:
+                self._db.executemany("DELETE FROM points WHERE id = ?", [(point_id,) for point_id in ids])
+            self._alive[rows] = False
+            self._free_rows.extend(rows)
+            self._free_rows.sort(reverse=True)
+            if self._ivf is not None:
+                self._ivf['assignments'][rows] = -1
+                self._ivf['lists'] = None
+
+    def _filter_mask(self, filters: Optional[Dict]) -> np.ndarray:
+        mask = self._alive[:self.rows].copy()
+        if filters:
+            conditions = ' AND '.join('json_extract(payload, ?) = ?' for _ in filters)
+            params = []
+            for key, value in filters.items():
+                params.extend([f'$."{key}"', value])
+            allowed = np.zeros(self.rows, dtype=bool)
+            allowed[[row for (row,) in self._db.execute(f"SELECT row FROM points WHERE {conditions}", params)]] = True
+            mask &= allowed
+        return mask
+
+    def _score_rows(self, queries: np.ndarray, rows: np.ndarray) -> np.ndarray:
+        scores = np.asarray(self._vectors[rows], dtype=np.float32) @ queries.T
+        if self.dtype == 'int8':
+            scores *= self._scales[rows][:, None]
+        return scores
+
+    @staticmethod
+    def _merge_top_k(best_scores, best_rows, scores, rows, top_k):
+        if best_scores is not None:
+            scores = np.concatenate([best_scores, scores])
+            rows = np.concatenate([best_rows, rows])
+        if len(scores) > top_k:
+            keep = np.argpartition(-scores, top_k - 1)[:top_k]
+            scores, rows = scores[keep], rows[keep]
+        return scores, rows
+
+    def search(self, vectors, top_k: int, filters: Optional[Dict] = None) -> List[List[SearchHit]]:
+        queries = _normalize(np.atleast_2d(vectors))
+        with self._lock:
+            if self.rows == 0:
+                return [[] for _ in range(len(queries))]
+            mask = self._filter_mask(filters)
+            results = []
+            # A payload filter can leave few rows in the probed lists, so filtered searches score
+            # every matching row exactly instead; filters such as a title are selective anyway
+            if self._ivf is not None and not filters:
+                lists = self._ivf_lists()
+                probes = np.argsort(-(queries @ self._ivf['centroids'].T), axis=1)[:, :self.nprobe]
+                for query, query_probes in zip(queries, probes):
+                    candidates = np.concatenate([lists[c] for c in query_probes])
+                    candidates = np.sort(candidates[mask[candidates]])
+                    scores = self._score_rows(query[np.newaxis, :], candidates)[:, 0] if len(candidates) else np.empty(0)
+                    results.append(self._merge_top_k(None, None, scores, candidates, top_k))
+            else:
+                best = [(None, None)] * len(queries)
+                candidates = np.flatnonzero(mask)
+                for start in range(0, len(candidates), self.block_size):
+                    rows = candidates[start:start + self.block_size]
+                    block_scores = self._score_rows(queries, rows)
+                    best = [self._merge_top_k(best_scores, best_rows, block_scores[:, i], rows, top_k)
+                            for i, (best_scores, best_rows) in enumerate(best)]
+                results = [(s, r) if s is not None else (np.empty(0), np.empty(0, dtype=int)) for s, r in best]
+
+            hits = []
+            for scores, rows in results:
+                order = np.argsort(-scores)
+                rows, scores = rows[order], scores[order]
+                payloads = {}
+                if len(rows):
+                    placeholders = ','.join('?' * len(rows))
+                    payloads = {row: (point_id, json.loads(payload)) for point_id, row, payload in self._db.execute(
+                        f"SELECT id, row, payload FROM points WHERE row IN ({placeholders})", [int(r) for r in rows])}
+                hits.append([(payloads[int(row)][0], float(score), payloads[int(row)][1])
+                             for row, score in zip(rows, scores) if int(row) in payloads])
+            return hits
+
+    def get(self, ids: Sequence[str]) -> Dict[str, Dict]:
+        return {point_id: json.loads(payload) for point_id, payload in self._select_by_ids('id, payload', ids)}
+
+    def count(self) -> int:
+        return self._db.execute("SELECT COUNT(*) FROM points").fetchone()[0]
+
+    def clear(self) -> None:
+        with self._lock:
+            with self._db:
+                self._db.execute("DELETE FROM points")
+            self._alive[:] = False
+            self._free_rows = []
+            self.rows = 0
+            self._ivf = None
+            ivf_path = os.path.join(self.path, 'ivf.npz')
+            if os.path.exists(ivf_path):
+                os.remove(ivf_path)
+            if self.dim is not None:
+                self._write_meta()
+
+
+def create_backend(backend: Optional[str] = None) -> VectorBackend:
+    """Create the vector backend selected by `backend` or config.VECTOR_BACKEND ('qdrant' or 'embedded')."""
+    backend = backend or getattr(config, 'VECTOR_BACKEND', 'qdrant')
+    if backend == 'qdrant':
+        return QdrantBackend(
+            config.QDRANT_COLLECTION_NAME,
+            host=getattr(config, 'QDRANT_HOST', None),
+            port=getattr(config, 'QDRANT_PORT', None),
+            location=getattr(config, 'QDRANT_LOCATION', None),
+            path=getattr(config, 'QDRANT_PATH', None),
+            prefer_grpc=getattr(config, 'QDRANT_PREFER_GRPC', False),
+            grpc_port=getattr(config, 'QDRANT_GRPC_PORT', 6334),
+            upsert_batch_size=getattr(config, 'QDRANT_UPSERT_BATCH_SIZE', 256),
+            upsert_parallel=getattr(config, 'QDRANT_UPSERT_PARALLEL', 1),
+            payload_indexes=getattr(config, 'QDRANT_PAYLOAD_INDEXES', ('title', 'url')),
+            hnsw_m=getattr(config, 'QDRANT_HNSW_M', None),
+            hnsw_ef_construct=getattr(config, 'QDRANT_HNSW_EF_CONSTRUCT', None),
+            search_hnsw_ef=getattr(config, 'QDRANT_SEARCH_HNSW_EF', None),
+            quantization=getattr(config, 'QDRANT_QUANTIZATION', None),
+            on_disk=getattr(config, 'QDRANT_ON_DISK', False),
+            indexing_threshold=getattr(config, 'QDRANT_INDEXING_THRESHOLD', None),
+        )
+    if backend == 'embedded':
+        return EmbeddedBackend(
+            getattr(config, 'EMBEDDED_VECTOR_STORE_PATH', os.path.join('output', 'vector_store')),
+            dtype=getattr(config, 'EMBEDDED_VECTOR_DTYPE', 'float16'),
+            ivf_threshold=getattr(config, 'EMBEDDED_IVF_THRESHOLD', 100000),
+            nprobe=getattr(config, 'EMBEDDED_IVF_NPROBE', 8),
+        )
+    raise ValueError(f"Unknown vector backend '{backend}'. Expected 'qdrant' or 'embedded'.")
@@ -1,49 +1,285 @@
-from typing import List
-from qdrant_client import QdrantClient
-from llama_index.core import Document
+import contextlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import uuid
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+from llama_index.core import Document, get_response_synthesizer
 from llama_index.core.ingestion import IngestionPipeline
-from llama_index.core.node_parser import SentenceSplitter
-from llama_index.core.extractors import TitleExtractor
-from llama_index.embeddings.huggingface import HuggingFaceEmbedding
-from llama_index.vector_stores.qdrant import QdrantVectorStore
-from llama_index.core import VectorStoreIndex
+from llama_index.core.storage.docstore import SimpleDocumentStore
+from llama_index.core.schema import MetadataMode, NodeWithScore
+from llama_index.core.vector_stores.utils import metadata_dict_to_node, node_to_metadata_dict
 import config
+from modules.embeddings import get_embedding_model
+from modules.instrumentation import span
+from modules.lexical_index import LexicalIndex, reciprocal_rank_fusion
+from modules.vector_backends import VectorBackend, create_backend
+from modules.wiki_node_parser import WikipediaSectionParser
+
+logger = logging.getLogger(__name__)
+
+
+class DocumentRecords:
+    """
+    Record of which chunks each stored document produced, and the document hash they came from.
+
+    One SQLite row per document, so recording an ingest writes only the documents that
+    changed instead of rewriting the whole record.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript("""
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS documents (doc_id TEXT PRIMARY KEY, hash TEXT NOT NULL,
+                                                  chunk_ids TEXT NOT NULL);
+        """)
+        self._db.commit()
+
+    def get(self, doc_id: str) -> Tuple[Optional[str], List[str]]:
+        """Hash and chunk IDs recorded for a document, or (None, []) if it is not stored."""
+        with self._lock:
+            row = self._db.execute('SELECT hash, chunk_ids FROM documents WHERE doc_id = ?', (doc_id,)).fetchone()
+        if row is None:
+            return None, []
+        return row[0], json.loads(row[1])
+
+    def put(self, records: Iterable[Tuple[str, str, List[str]]]) -> None:
+        """Record (doc_id, hash, chunk IDs) triples, replacing earlier records of the same documents."""
+        with self._lock, self._db:
+            self._db.executemany('INSERT OR REPLACE INTO documents (doc_id, hash, chunk_ids) VALUES (?, ?, ?)',
+                                 [(doc_id, doc_hash, json.dumps(chunk_ids)) for doc_id, doc_hash, chunk_ids in records])
+
+    def chunk_ids(self) -> List[str]:
+        """IDs of all recorded chunks."""
+        with self._lock:
+            rows = self._db.execute('SELECT chunk_ids FROM documents').fetchall()
+        return [chunk_id for (chunk_ids,) in rows for chunk_id in json.loads(chunk_ids)]
+
+    def count(self) -> int:
+        with self._lock:
+            return self._db.execute('SELECT COUNT(*) FROM documents').fetchone()[0]
+
+    def clear(self) -> None:
+        with self._lock, self._db:
+            self._db.execute('DELETE FROM documents')
+
 
 class VectorStore:
-    def __init__(self):
-        self.client = QdrantClient(host=config.QDRANT_HOST, port=config.QDRANT_PORT)
-        self.vector_store = QdrantVectorStore(
-            client=self.client,
-            collection_name=config.QDRANT_COLLECTION_NAME
-        )
+    """
+    Chunk store with incremental, deduplicating ingestion on top of a pluggable vector backend.
+
+    The backend is a Qdrant server (default) or the embedded, in-process store, selected
+    with config.VECTOR_BACKEND; both are driven through the same ingest and search API.
+
+    Chunk IDs are derived from the document ID and the chunk's content hash, and a
+    persistent record remembers which chunks each document produced. Re-adding an
+    unchanged document is skipped outright; a changed document only embeds and upserts
+    its new chunks and deletes the chunks that disappeared.
+
+    Next to the vectors, a BM25 lexical index over the chunk texts is kept in sync, and
+    searches fuse the dense and lexical rankings with reciprocal-rank fusion (hybrid
+    mode, the default unless config.SEARCH_MODE is 'dense'). Exact names, dates and
+    numbers that embeddings blur are then still found.
+    """
+
+    def __init__(self, backend: Optional[VectorBackend] = None):
+        self.backend = backend or create_backend()
+        # The document records describe what a backend holds, so each backend keeps its own
+        self.state_dir = os.path.join(
+            getattr(config, 'INGESTION_STATE_DIR', os.path.join('output', 'cache', 'ingestion')), self.backend.name)
+        os.makedirs(self.state_dir, exist_ok=True)
+        self.documents = DocumentRecords(os.path.join(self.state_dir, 'documents.sqlite3'))
+        self._import_docstore()
         self.pipeline = self._create_ingestion_pipeline()
-        self.index = None
+        self.search_mode = getattr(config, 'SEARCH_MODE', 'hybrid')
+        self.lexical_index = LexicalIndex(os.path.join(self.state_dir, 'lexical.sqlite3'))
+        self._backfill_lexical_index()
+
+    def _import_docstore(self) -> None:
+        # Earlier versions kept the records in a JSON docstore; import it once so nothing is re-embedded
+        path = os.path.join(self.state_dir, 'docstore.json')
+        if not os.path.exists(path) or self.documents.count():
+            return
+        docstore = SimpleDocumentStore.from_persist_path(path)
+        ref_doc_info = docstore.get_all_ref_doc_info() or {}
+        self.documents.put((doc_id, docstore.get_document_hash(doc_id), info.node_ids)
+                           for doc_id, info in ref_doc_info.items() if docstore.get_document_hash(doc_id))
+        os.replace(path, path + '.imported')
+        logger.info(f"Imported {self.documents.count()} document records from {path}")
+
+    def _backfill_lexical_index(self) -> None:
+        # Chunks stored before the lexical index existed are indexed from their payloads
+        if self.lexical_index.count():
+            return
+        chunk_ids = self.documents.chunk_ids()
+        if not chunk_ids:
+            return
+        payloads = self.backend.get(chunk_ids)
+        nodes = [metadata_dict_to_node(payload) for payload in payloads.values()]
+        self.lexical_index.add((node.node_id, node.get_content(), node.metadata) for node in nodes)
+        logger.info(f"Added {len(nodes)} existing chunks to the lexical index")
 
     def _create_ingestion_pipeline(self):
-        embed_model = HuggingFaceEmbedding(model_name=config.HUGGINGFACE_MODEL_NAME)
+        # Parsing only: embedding and upserts are done for new chunks in add_documents.
+        # Titles, URLs and section paths come from the fetched article, so no LLM call is needed.
         return IngestionPipeline(
             transformations=[
-                SentenceSplitter(chunk_size=512, chunk_overlap=20),
-                TitleExtractor(),
-                embed_model,
+                WikipediaSectionParser(
+                    chunk_size=getattr(config, 'CHUNK_SIZE_TOKENS', 512),
+                    chunk_overlap=getattr(config, 'CHUNK_OVERLAP_TOKENS', 32),
+                ),
             ],
-            vector_store=self.vector_store,
         )
 
-    def add_documents(self, documents: List[Document]):
-        self.pipeline.run(documents=documents)
-        self.index = VectorStoreIndex.from_vector_store(self.vector_store)
+    @staticmethod
+    def _chunk_id(doc_id: str, node) -> str:
+        return str(uuid.uuid5(uuid.NAMESPACE_URL, f"{doc_id}:{node.hash}"))
 
-    def search(self, query: str, top_k: int = 5):
-        if not self.index:
-            raise ValueError("Index not created. Please add documents first.")
-        return self.index.as_query_engine().query(query)
+    def add_documents(self, documents: List[Document]) -> Dict:
+        """
+        Add or update documents.
+
+        New chunks of all documents are embedded and upserted together. With at least
+        config.BULK_LOAD_MIN_DOCUMENTS documents the write runs inside the backend's
+        bulk-load mode, which defers index maintenance until all chunks are stored.
+
+        Returns:
+            Dict: Ingestion statistics, including the texts that had to be embedded.
+        """
+        stats = {'documents_skipped': 0, 'chunks_added': 0, 'chunks_deleted': 0, 'chunks_unchanged': 0,
+                 'embedded_texts': []}
+        updates = []
+        new_nodes, stale_ids = [], []
+        for document in documents:
+            doc_id = document.doc_id
+            stored_hash, stored_ids = self.documents.get(doc_id)
+            if stored_hash == document.hash:
+                logger.info(f"Document '{doc_id}' is unchanged, skipping ingestion")
+                stats['documents_skipped'] += 1
+                continue
+
+            nodes = {}
+            with span('chunk', document=doc_id) as current:
+                for node in self.pipeline.run(documents=[document]):
+                    node.id_ = self._chunk_id(doc_id, node)
+                    nodes[node.id_] = node
+                current.set(chunks=len(nodes))
+
+            existing_ids = set(stored_ids)
+            document_new_nodes = [node for node_id, node in nodes.items() if node_id not in existing_ids]
+            document_stale_ids = list(existing_ids - set(nodes))
+            new_nodes.extend(document_new_nodes)
+            stale_ids.extend(document_stale_ids)
+            updates.append((document, nodes))
+
+            stats['chunks_added'] += len(document_new_nodes)
+            stats['chunks_deleted'] += len(document_stale_ids)
+            stats['chunks_unchanged'] += len(nodes) - len(document_new_nodes)
+            logger.info(f"Indexing '{doc_id}': {len(document_new_nodes)} new, {len(document_stale_ids)} stale, "
+                        f"{len(nodes) - len(document_new_nodes)} unchanged chunks")
+
+        if not updates:
+            return stats
+
+        bulk = len(updates) >= getattr(config, 'BULK_LOAD_MIN_DOCUMENTS', 16)
+        with self.backend.bulk_load() if bulk else contextlib.nullcontext():
+            if new_nodes:
+                # Embedded straight into one NumPy array; large ingests are sharded across processes
+                with span('embed', texts=len(new_nodes)):
+                    vectors = get_embedding_model().embed(
+                        [node.get_content(metadata_mode=MetadataMode.EMBED) for node in new_nodes], normalize=True)
+                with span('upsert', points=len(new_nodes), backend=self.backend.name):
+                    self.backend.upsert(
+                        [node.node_id for node in new_nodes],
+                        vectors,
+                        [node_to_metadata_dict(node, remove_text=False, flat_metadata=False) for node in new_nodes],
+                    )
+                    self.lexical_index.add((node.node_id, node.get_content(), node.metadata) for node in new_nodes)
+                stats['embedded_texts'].extend(node.get_content() for node in new_nodes)
+            if stale_ids:
+                with span('delete', points=len(stale_ids), backend=self.backend.name):
+                    self.backend.delete(stale_ids)
+                    self.lexical_index.delete(stale_ids)
+
+        # Only record documents once their chunks are stored, so a failed write is retried next time
+        self.documents.put((document.doc_id, document.hash, list(nodes)) for document, nodes in updates)
+        return stats
+
+    def _search_nodes(self, queries: List[str], top_k: int, filters: Optional[Dict],
+                      mode: Optional[str] = None) -> List[List[NodeWithScore]]:
+        if not queries:
+            return []
+        mode = mode or self.search_mode
+        if mode not in ('dense', 'hybrid'):
+            raise ValueError(f"Unknown search mode '{mode}'. Expected 'dense' or 'hybrid'.")
+        # Hybrid mode fuses deeper candidate lists from both retrievers
+        candidates = top_k if mode == 'dense' else max(top_k * getattr(config, 'HYBRID_CANDIDATE_FACTOR', 4), 20)
+
+        # One forward pass for all queries, then one batched search
+        with span('embed', texts=len(queries), kind='query'):
+            vectors = get_embedding_model().embed(queries, normalize=True)
+        with span('search', queries=len(queries), mode=mode, backend=self.backend.name):
+            dense_results = self.backend.search(vectors, candidates, filters)
+        if mode == 'dense':
+            return [
+                [NodeWithScore(node=metadata_dict_to_node(payload), score=score) for _, score, payload in hits]
+                for hits in dense_results
+            ]
+
+        results = []
+        for query, hits in zip(queries, dense_results):
+            payloads = {point_id: payload for point_id, _, payload in hits}
+            lexical_ids = [chunk_id for chunk_id, _ in self.lexical_index.search(query, candidates, filters)]
+            fused = reciprocal_rank_fusion([list(payloads), lexical_ids])[:top_k]
+            missing = [chunk_id for chunk_id, _ in fused if chunk_id not in payloads]
+            if missing:
+                payloads.update(self.backend.get(missing))
+            results.append([NodeWithScore(node=metadata_dict_to_node(payloads[chunk_id]), score=score)
+                            for chunk_id, score in fused if chunk_id in payloads])
+        return results
+
+    @staticmethod
+    def _to_chunk(node: NodeWithScore) -> Dict:
+        return {
+            'id': node.node.node_id,
+            'text': node.node.get_content(),
+            'score': node.score,
+            'metadata': node.node.metadata,
+            'start_char_idx': node.node.start_char_idx,
+        }
+
+    def search(self, queries: Union[str, List[str]], top_k: int = 5, filters: Optional[Dict] = None,
+               mode: Optional[str] = None) -> Union[List[Dict], List[List[Dict]]]:
+        """
+        Retrieve the best matching chunks without any LLM call.
+
+        Args:
+            queries (str or List[str]): One query, or a batch of queries embedded and searched together.
+            top_k (int): Number of chunks per query.
+            filters (Dict): Exact-match metadata filters, e.g. {'title': 'Boston'}.
+            mode (str): 'hybrid' (dense + BM25, fused) or 'dense'. Defaults to config.SEARCH_MODE.
+
+        Returns:
+            List[Dict]: Scored chunks (id, text, score, metadata, start_char_idx), best first.
+                Scores are cosine similarities in dense mode and fused RRF scores in hybrid mode.
+                A list of such lists when a batch of queries was given.
+        """
+        single = isinstance(queries, str)
+        results = [[self._to_chunk(node) for node in nodes]
+                   for nodes in self._search_nodes([queries] if single else list(queries), top_k, filters, mode)]
+        return results[0] if single else results
+
+    def synthesize(self, query: str, top_k: int = 5, filters: Optional[Dict] = None):
+        """Retrieve chunks for `query` and have the LLM synthesize an answer from them (opt-in, slow)."""
+        nodes = self._search_nodes([query], top_k, filters)[0]
+        return get_response_synthesizer().synthesize(query, nodes)
 
     def clear(self):
-        self.client.delete_collection(config.QDRANT_COLLECTION_NAME)
-        self.vector_store = QdrantVectorStore(
-            client=self.client,
-            collection_name=config.QDRANT_COLLECTION_NAME
-        )
-        self.pipeline = self._create_ingestion_pipeline()
-        self.index = None
\ No newline at end of file
+        self.backend.clear()
+        self.lexical_index.clear()
+        self.documents.clear()
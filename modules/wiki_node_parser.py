@@ -0,0 +1,102 @@
+import re
+from typing import Any, List, Sequence, Tuple
+from llama_index.core.bridge.pydantic import Field
+from llama_index.core.node_parser import NodeParser
+from llama_index.core.node_parser.node_utils import build_nodes_from_splits
+from llama_index.core.schema import BaseNode
+from modules.token_counter import get_encoder
+
+HEADING_RE = re.compile(r'^(#+) (.*)$', re.MULTILINE)
+
+def split_sections(text: str) -> List[Tuple[List[str], str]]:
+    """
+    Split `#`-heading formatted article text into (section path, section body) pairs.
+
+    Text before the first heading gets an empty path.
+    """
+    sections = []
+    path = []
+    matches = list(HEADING_RE.finditer(text))
+    lead = text[:matches[0].start()] if matches else text
+    if lead.strip():
+        sections.append(([], lead.strip()))
+    for i, match in enumerate(matches):
+        level = len(match.group(1))
+        path = path[:level - 1] + [match.group(2).strip()]
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(text)
+        body = text[match.end():end].strip()
+        if body:
+            sections.append((list(path), body))
+    return sections
+
+class WikipediaSectionParser(NodeParser):
+    """
+    Chunks Wikipedia articles along their `#`/`##` section hierarchy.
+
+    Each section becomes one chunk when it fits in `chunk_size` tokens (counted with
+    tiktoken); longer sections are split on paragraph boundaries, and single paragraphs
+    that are still too long are split into overlapping token windows. Every chunk gets
+    its section path as metadata next to the document's title and URL, so no LLM call
+    is needed to describe it.
+    """
+
+    chunk_size: int = Field(default=512, description="Maximum chunk size in tokens.")
+    chunk_overlap: int = Field(default=32, description="Token overlap when a paragraph has to be split.")
+    tokenizer_model: str = Field(default="gpt-3.5-turbo", description="tiktoken model used for counting.")
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "WikipediaSectionParser"
+
+    def _count_tokens(self, text: str) -> int:
+        return len(get_encoder(self.tokenizer_model).encode_ordinary(text))
+
+    def _split_paragraph(self, paragraph: str) -> List[str]:
+        encoder = get_encoder(self.tokenizer_model)
+        tokens = encoder.encode_ordinary(paragraph)
+        step = max(1, self.chunk_size - self.chunk_overlap)
+        return [encoder.decode(tokens[start:start + self.chunk_size]) for start in range(0, len(tokens), step)
+                if start == 0 or start + self.chunk_overlap < len(tokens)]
+
+    def split_section(self, body: str) -> List[str]:
+        if self._count_tokens(body) <= self.chunk_size:
+            return [body]
+        chunks = []
+        current, current_tokens = [], 0
+        for paragraph in (p.strip() for p in body.split('\n\n')):
+            if not paragraph:
+                continue
+            paragraph_tokens = self._count_tokens(paragraph)
+            if paragraph_tokens > self.chunk_size:
+                if current:
+                    chunks.append('\n\n'.join(current))
+                    current, current_tokens = [], 0
+                chunks.extend(self._split_paragraph(paragraph))
+                continue
+            if current and current_tokens + paragraph_tokens > self.chunk_size:
+                chunks.append('\n\n'.join(current))
+                current, current_tokens = [], 0
+            current.append(paragraph)
+            current_tokens += paragraph_tokens
+        if current:
+            chunks.append('\n\n'.join(current))
+        return chunks
+
+    def _parse_nodes(self, nodes: Sequence[BaseNode], show_progress: bool = False, **kwargs: Any) -> List[BaseNode]:
+        all_nodes = []
+        for node in nodes:
+            splits, paths = [], []
+            for path, body in split_sections(node.get_content()):
+                for chunk in self.split_section(body):
+                    splits.append(chunk)
+                    paths.append(path)
+            chunk_nodes = build_nodes_from_splits(splits, node, id_func=self.id_func)
+            for chunk_node, path in zip(chunk_nodes, paths):
+                chunk_node.metadata['section'] = ' > '.join(path) if path else 'Introduction'
+                chunk_node.metadata['section_level'] = len(path)
+                chunk_node.excluded_embed_metadata_keys = list(
+                    set(chunk_node.excluded_embed_metadata_keys) | {'url', 'section_level'})
+                chunk_node.excluded_llm_metadata_keys = list(
+                    set(chunk_node.excluded_llm_metadata_keys) | {'url', 'section_level'})
+            all_nodes.extend(chunk_nodes)
+        return all_nodes
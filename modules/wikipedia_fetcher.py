@@ -2,36 +2,174 @@ import wikipediaapi
 import json
 import os
 import logging
+import re
+import time
 from datetime import datetime
+from typing import Optional, Tuple
+import requests
+import config
+from modules.instrumentation import span
+from modules.page_cache import PageCache
 
 logger = logging.getLogger(__name__)
 
+USER_AGENT = 'Weisheit93/0.1 (jtprado@protonmail.com)'
+API_URL = 'https://en.wikipedia.org/w/api.php'
+
+# Section headings in plain-text extracts requested with exsectionformat=wiki
+# A heading starts the text or follows a blank line
+EXTRACT_SECTION_RE = re.compile(r'(?:^|\n\n) *(?P<level>={2,}) (?P<title>.*?) ={2,} *(?:\n|$)')
+
+def format_extract_sections(extract: str) -> Tuple[str, str]:
+    """
+    Split a plain-text extract into its lead summary and the `#`-heading section format
+    produced by `WikipediaFetcher.format_wikipedia_content`.
+
+    Args:
+        extract (str): Extract text with `== Heading ==` style section markers.
+
+    Returns:
+        Tuple[str, str]: The summary and the formatted section content.
+    """
+    matches = list(EXTRACT_SECTION_RE.finditer(extract))
+    if not matches:
+        return extract.strip(), ""
+
+    summary = extract[:matches[0].start()].strip()
+    formatted_content = ""
+    for i, match in enumerate(matches):
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(extract)
+        level = len(match.group('level')) - 1
+        text = extract[match.end():end].strip()
+        formatted_content += f"{'#' * level} {match.group('title')}\n\n{text}\n\n"
+    return summary, formatted_content
+
 class WikipediaFetcher:
-    def __init__(self):
-        self.wiki_wiki = wikipediaapi.Wikipedia('Weisheit93/0.1 (jtprado@protonmail.com)', 'en')
+    def __init__(self, cache: Optional[PageCache] = None, offline: Optional[bool] = None,
+                 revalidate_after: Optional[float] = None, article_store=None):
+        """
+        Args:
+            cache (PageCache): Page cache to serve and store pages. Defaults to the cache at
+                config.PAGE_CACHE_PATH unless config.PAGE_CACHE_ENABLED is False.
+            offline (bool): Serve pages from the cache only, without any network access.
+            revalidate_after (float): Seconds during which a cached page is served without
+                checking its revision (default 0: always revalidate).
+            article_store (ArticleStore): Local article store built from a Wikipedia dump.
+                Defaults to the store at config.WIKIPEDIA_ARTICLE_STORE, if set. Pages found
+                in the store are served from it without network access.
+        """
+        self.wiki_wiki = wikipediaapi.Wikipedia(USER_AGENT, 'en')
+        if cache is None and getattr(config, 'PAGE_CACHE_ENABLED', True):
+            cache = PageCache(getattr(config, 'PAGE_CACHE_PATH', os.path.join('output', 'cache', 'pages.sqlite3')))
+        self.cache = cache
+        self.offline = offline if offline is not None else getattr(config, 'WIKIPEDIA_OFFLINE', False)
+        self.revalidate_after = revalidate_after if revalidate_after is not None else getattr(
+            config, 'PAGE_CACHE_REVALIDATE_AFTER', 0)
+        self.session = requests.Session()
+        self.session.headers['User-Agent'] = USER_AGENT
+        store_path = getattr(config, 'WIKIPEDIA_ARTICLE_STORE', None)
+        if article_store is None and store_path:
+            from modules.article_store import ArticleStore
+            article_store = ArticleStore(store_path)
+        self.article_store = article_store
 
     def fetch_wikipedia_content(self, topic: str) -> dict:
         """
         Fetch Wikipedia content for a given topic.
 
+        Cached pages are revalidated with a revision-only request and only downloaded
+        and formatted again when the page has a newer revision.
+
         Args:
             topic (str): The topic to fetch from Wikipedia.
 
         Returns:
             Dict: A dictionary containing the page title, summary, full content, and metadata.
         """
-        page = self.wiki_wiki.page(topic)
-        
+        with span('fetch', query=topic) as current:
+            return self._fetch_content(topic, current)
+
+    def _fetch_content(self, topic: str, current_span) -> dict:
+        if self.article_store is not None:
+            page = self.article_store.get(topic)
+            if page is not None:
+                current_span.set(source='article_store')
+                return page
+
+        cached = self.cache.get(topic) if self.cache else None
+
+        if self.offline:
+            if cached is None:
+                raise ValueError(f"No cached Wikipedia page found for '{topic}' (offline mode).")
+            current_span.set(source='cache')
+            return cached['content']
+
+        if cached and time.time() - cached['validated_at'] < self.revalidate_after:
+            current_span.set(source='cache')
+            return cached['content']
+
+        try:
+            revision = self.fetch_revision_info(topic)
+        except requests.exceptions.RequestException as e:
+            if cached is None:
+                raise
+            logger.warning(f"Could not revalidate cached page for '{topic}', serving cached copy: {e}")
+            current_span.set(source='cache')
+            return cached['content']
+
+        if revision is None:
+            raise ValueError(f"No Wikipedia page found for '{topic}'.")
+
+        if cached and cached['title'] == revision['title'] and cached['revision_id'] == revision['revision_id']:
+            logger.info(f"Cached page for '{topic}' is current (revision {revision['revision_id']})")
+            self.cache.mark_validated(revision['title'], aliases=[topic])
+            current_span.set(source='cache_revalidated')
+            return cached['content']
+
+        page = self.wiki_wiki.page(revision['title'])
+
         if not page.exists():
             raise ValueError(f"No Wikipedia page found for '{topic}'.")
-        
-        return {
-            'title': page.title,
-            'summary': page.summary,
-            'content': self.format_wikipedia_content(page),
-            'url': page.fullurl,
-            'retrieval_date': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        }
+
+        current_span.set(source='network')
+        # wikipediaapi loads the text lazily, so this span includes downloading the sections
+        with span('format'):
+            content = {
+                'title': page.title,
+                'summary': page.summary,
+                'content': self.format_wikipedia_content(page),
+                'url': page.fullurl,
+                'retrieval_date': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                'revision_id': revision['revision_id'],
+            }
+        if self.cache:
+            self.cache.put(revision['title'], revision['revision_id'], content, aliases=[topic, page.title])
+        return content
+
+    def fetch_revision_info(self, topic: str) -> Optional[dict]:
+        """
+        Resolve a topic to its canonical title and latest revision ID with one small API request.
+
+        Args:
+            topic (str): The topic or redirect title.
+
+        Returns:
+            Dict: The canonical 'title' and 'revision_id', or None if the page does not exist.
+        """
+        response = self.session.get(API_URL, params={
+            'action': 'query',
+            'format': 'json',
+            'formatversion': 2,
+            'titles': topic,
+            'redirects': 1,
+            'prop': 'revisions',
+            'rvprop': 'ids',
+        }, timeout=30)
+        response.raise_for_status()
+        pages = response.json().get('query', {}).get('pages', [])
+        if not pages or pages[0].get('missing') or pages[0].get('invalid'):
+            return None
+        return {'title': pages[0]['title'], 'revision_id': pages[0]['revisions'][0]['revid']}
 
     def format_wikipedia_content(self, page: wikipediaapi.WikipediaPage) -> str:
         def format_sections(sections, level=0):
@@ -53,7 +191,7 @@ class WikipediaFetcher:
         """
         try:
             os.makedirs(os.path.dirname(filename), exist_ok=True)
-            with open(filename, 'w', encoding='utf-8') as f:
+            with span('write', path=filename), open(filename, 'w', encoding='utf-8') as f:
                 json.dump(content, f, ensure_ascii=False, indent=2)
             logger.info(f"Content saved to {filename}")
         except IOError as e:
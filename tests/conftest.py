@@ -0,0 +1,61 @@
+import os
+import re
+import sys
+import types
+import zlib
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+try:
+    import config  # noqa: F401
+except ImportError:
+    # config.py holds the API keys and is not part of the repository. Modules read
+    # optional settings with defaults, so an empty module is enough for the tests.
+    sys.modules['config'] = types.ModuleType('config')
+
+
+class WordHashingEmbedding:
+    """Bag-of-words feature hashing: texts with the same words get the same vector."""
+
+    def embed(self, texts):
+        vectors = np.zeros((len(texts), 256), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in re.findall(r'\w+', text.lower()):
+                vectors[row, zlib.crc32(word.encode('utf-8')) % 256] += 1
+        return vectors
+
+
+class CountingTransport:
+    """LLM transport answering with the benchmark's fake completions and recording the prompts."""
+
+    def __init__(self):
+        self.prompts = []
+
+    @property
+    def calls(self):
+        return len(self.prompts)
+
+    def complete(self, request, on_text=None, timeout=None):
+        from benchmarks.fake_llm_server import fake_completion
+        from modules import llm_gateway
+
+        self.prompts.append(request.prompt)
+        return llm_gateway.CompletionResult(text=fake_completion(request.prompt), model=request.model,
+                                            stop_reason='stop_sequence', prompt_tokens=1, completion_tokens=1)
+
+
+@pytest.fixture
+def fake_llm(tmp_path, monkeypatch):
+    """Route LLM calls to a CountingTransport, with an empty semantic cache and no completion cache."""
+    from modules import content_analyzer, llm_gateway, semantic_cache
+
+    transport = CountingTransport()
+    monkeypatch.setattr(semantic_cache, '_semantic_cache',
+                        semantic_cache.SemanticCache(str(tmp_path / 'semantic'), WordHashingEmbedding()))
+    monkeypatch.setattr(content_analyzer, 'get_embedding_model', lambda: None)
+    monkeypatch.setattr(llm_gateway, '_gateway', llm_gateway.LLMGateway(
+        transport=transport, cache=None, requests_per_minute=None, tokens_per_minute=None))
+    return transport
@@ -0,0 +1,69 @@
+import zlib
+import json
+
+import pytest
+
+pytest.importorskip('wikipediaapi')
+
+from modules import article_store
+from modules.article_store import ArticleStore, ArticleStoreWriter, build_article
+
+
+def write_store(path, articles, redirects=()):
+    writer = ArticleStoreWriter(str(path))
+    for title, wikitext in articles:
+        record = json.dumps(build_article(title, wikitext), ensure_ascii=False).encode('utf-8')
+        writer.add(title, zlib.compress(record))
+    for title, target in redirects:
+        writer.add_redirect(title, target)
+    return writer.close()
+
+
+def test_articles_and_redirect_chains_round_trip(tmp_path):
+    stats = write_store(tmp_path, [('Boston', 'Boston is a city.'), ('Paris', 'Paris is a city.')],
+                        [('Beantown', 'Boston#Names'), ('Bean town', 'Beantown')])
+    store = ArticleStore(str(tmp_path))
+    assert stats == {'articles': 2, 'redirects': 2, 'bytes': stats['bytes']}
+    assert store.get('boston')['summary'] == 'Boston is a city.'
+    assert store.get('Bean_town')['title'] == 'Boston'
+    assert store.get('Paris')['title'] == 'Paris'
+    assert store.get('London') is None
+    assert not (tmp_path / 'titles.tmp.sqlite3').exists()
+
+
+def test_colliding_hashes_return_the_requested_article(tmp_path, monkeypatch):
+    monkeypatch.setattr(article_store, '_title_hash', lambda title: 42)
+    write_store(tmp_path, [('Boston', 'Boston is a city.'), ('Paris', 'Paris is a city.')])
+    store = ArticleStore(str(tmp_path))
+    assert store.get('Paris')['title'] == 'Paris'
+    assert store.get('Boston')['title'] == 'Boston'
+    assert store.get('London') is None
+
+
+def test_article_starting_with_a_heading_keeps_the_section():
+    page = build_article('Boston', "== History ==\nFounded in 1630.\n\n== Geography ==\nOn the coast.")
+    assert page['summary'] == ''
+    assert page['content'].startswith('# History\n\nFounded in 1630.')
+    assert '# Geography' in page['content']
+
+
+def test_strip_wikitext_keeps_prose_and_headings():
+    wikitext = (
+        "{{Infobox city|name=Boston}}\n"
+        "'''Boston''' is the capital of [[Massachusetts]].<ref>Census</ref> "
+        "It was founded by [[Puritans|Puritan]] settlers.<!-- editorial note -->\n"
+        "[[File:Boston skyline.jpg|thumb|The skyline]]\n"
+        "{| class=\"wikitable\"\n| 1630 || founded\n|}\n"
+        "== History ==\n"
+        "* Settled in 1630 &amp; incorporated in 1822, see [https://example.org the archive].\n"
+        "[[Category:Cities]]\n"
+    )
+    assert article_store.strip_wikitext(wikitext) == (
+        "Boston is the capital of Massachusetts. It was founded by Puritan settlers.\n\n"
+        "== History ==\n\n"
+        "Settled in 1630 & incorporated in 1822, see the archive."
+    )
+
+
+def test_strip_wikitext_removes_nested_templates():
+    assert article_store.strip_wikitext("Before {{outer|{{inner}}}} after") == "Before  after"
@@ -0,0 +1,48 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from modules.artifacts import ArtifactStore, artifact_key, content_digest
+
+
+def test_digest_and_key_ignore_dict_order():
+    assert content_digest({'a': 1, 'b': [1, 2]}) == content_digest({'b': [1, 2], 'a': 1})
+    assert artifact_key('script', {'page': 'x'}) != artifact_key('analyze', {'page': 'x'})
+
+
+def test_round_trip_and_shared_objects(tmp_path):
+    store = ArtifactStore(str(tmp_path))
+    value = {'script': 'Did you know…', 'tokens': [1, 2, 3]}
+    first = artifact_key('script', {'audience': 'kids'})
+    second = artifact_key('script', {'audience': 'teens'})
+
+    digest = store.put(first, 'script', value)
+    assert store.put(second, 'script', value) == digest
+    assert store.get(first) == value
+    assert store.get(second) == value
+    assert store.get(artifact_key('script', {'audience': 'adults'})) is None
+    assert len(os.listdir(os.path.join(tmp_path, 'objects', digest[:2]))) == 1
+    assert ArtifactStore(str(tmp_path)).get(first) == value
+
+
+def test_corrupt_objects_are_ignored(tmp_path):
+    store = ArtifactStore(str(tmp_path))
+    key = artifact_key('analyze', {'page': 'x'})
+    digest = store.put(key, 'analyze', {'summary': 'Boston'})
+    with open(store._object_path(digest), 'wb') as f:
+        f.write(b'{"summary": "Bost')
+
+    assert store.get(key) is None
+    assert not [name for _, _, files in os.walk(tmp_path) for name in files if name.endswith('.tmp')]
+
+
+def test_concurrent_puts_of_the_same_output(tmp_path):
+    store = ArtifactStore(str(tmp_path))
+    key = artifact_key('analyze', {'page': 'x'})
+    value = {'summary': 'Boston ' * 10000}
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        digests = set(pool.map(lambda _: store.put(key, 'analyze', value), range(200)))
+
+    assert len(digests) == 1
+    assert store.get(key) == value
+    assert not [name for _, _, files in os.walk(tmp_path) for name in files if name.endswith('.tmp')]
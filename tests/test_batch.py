@@ -0,0 +1,81 @@
+import threading
+
+import pytest
+
+from modules.batch import BatchRunner
+from modules.token_counter import TokenCounter
+
+
+class RecordingPipeline:
+    """Stands in for the stage functions of a runner's pipeline and records what ran."""
+
+    def __init__(self, fail=None, fail_engagement=False):
+        self.fail = fail or {}
+        self.fail_engagement = fail_engagement
+        self.stages = []
+        self.batches = []
+        self._lock = threading.Lock()
+
+    def run_stage(self, job, stage):
+        with self._lock:
+            self.stages.append((job['topic'], job['audience'], stage))
+        if self.fail.get((job['topic'], job['audience'])) == stage:
+            raise RuntimeError(f'{stage} failed')
+
+    def run_engagement_batch(self, jobs):
+        with self._lock:
+            self.batches.append(sorted(job['audience'] for job in jobs))
+        if self.fail_engagement:
+            raise RuntimeError('engagement failed')
+
+
+def run(tmp_path, jobs, pipeline, fan_out=True):
+    runner = BatchRunner(str(tmp_path), TokenCounter(), fan_out=fan_out,
+                         manifest_path=str(tmp_path / 'manifest.json'))
+    runner.pipeline.run_stage = pipeline.run_stage
+    runner.pipeline.run_engagement_batch = pipeline.run_engagement_batch
+    runner.run(jobs)
+    return runner
+
+
+def jobs_for(*pairs):
+    return [{'topic': topic, 'audience': audience} for topic, audience in pairs]
+
+
+def test_fanned_out_topics_score_engagement_in_one_batch(tmp_path):
+    pipeline = RecordingPipeline()
+    jobs = jobs_for(('Boston', 'kids'), ('Boston', 'teens'), ('Paris', 'kids'), ('Boston', 'adults'))
+    runner = run(tmp_path, jobs, pipeline)
+
+    assert pipeline.batches == [['adults', 'kids', 'teens']]
+    assert [stage for stage in pipeline.stages if stage[2] == 'engagement'] == [('Paris', 'kids', 'engagement')]
+    assert runner.summary()['completed'] == 4
+    assert all('engagement' in job['timings'] for job in jobs)
+
+
+def test_without_fan_out_engagement_runs_per_job(tmp_path):
+    pipeline = RecordingPipeline()
+    run(tmp_path, jobs_for(('Boston', 'kids'), ('Boston', 'teens')), pipeline, fan_out=False)
+
+    assert pipeline.batches == []
+    assert sum(stage == 'engagement' for _, _, stage in pipeline.stages) == 2
+
+
+def test_failed_jobs_leave_the_batch(tmp_path):
+    pipeline = RecordingPipeline(fail={('Boston', 'teens'): 'script'})
+    jobs = jobs_for(('Boston', 'kids'), ('Boston', 'teens'), ('Boston', 'adults'))
+    runner = run(tmp_path, jobs, pipeline)
+
+    assert pipeline.batches == [['adults', 'kids']]
+    assert [job['status'] for job in jobs] == ['completed', 'failed', 'completed']
+    assert runner.summary()['failed'] == 1
+
+
+@pytest.mark.parametrize('fail', [{('Boston', 'kids'): 'fetch', ('Boston', 'teens'): 'analyze'}, {}])
+def test_batch_failures_fail_every_job_of_the_batch(tmp_path, fail):
+    pipeline = RecordingPipeline(fail=fail, fail_engagement=True)
+    jobs = jobs_for(('Boston', 'kids'), ('Boston', 'teens'))
+    runner = run(tmp_path, jobs, pipeline)
+
+    assert runner.summary()['failed'] == 2
+    assert len(pipeline.batches) == (0 if fail else 1)
@@ -0,0 +1,48 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip('wikipediaapi')
+
+from modules import bulk_fetcher
+from modules.bulk_fetcher import BulkWikipediaFetcher
+
+
+class FlakyClient:
+    """Answers title and extract queries for any title after failing the first `failures` requests."""
+
+    def __init__(self, failures=0, error=ConnectionError('connection reset')):
+        self.failures = failures
+        self.error = error
+        self.requests = 0
+
+    async def get_json(self, url, params):
+        self.requests += 1
+        if self.requests <= self.failures:
+            raise self.error
+        titles = params['titles'].split('|')
+        if params['prop'] == 'extracts':
+            return {'query': {'pages': [{'title': titles[0], 'extract': f"{titles[0]} is a topic.\n\n== History ==\nLong."}]}}
+        return {'query': {'pages': [{'title': title, 'revisions': [{'revid': 1}], 'fullurl': f"https://w/{title}"}
+                                    for title in titles]}}
+
+    async def close(self):
+        pass
+
+
+def fetch(client, topics, **kwargs):
+    fetcher = BulkWikipediaFetcher(http_client=client, requests_per_second=1000, max_retries=2)
+    return asyncio.run(fetcher.fetch_many(topics, **kwargs))
+
+
+def test_connection_errors_and_timeouts_are_retried(monkeypatch):
+    monkeypatch.setattr(bulk_fetcher.random, 'uniform', lambda low, high: 0)
+    for error in (ConnectionError('connection reset'), asyncio.TimeoutError()):
+        results = fetch(FlakyClient(failures=2, error=error), ['Boston'])
+        assert results['Boston']['title'] == 'Boston'
+
+
+def test_failed_title_resolution_is_reported_per_topic(monkeypatch):
+    monkeypatch.setattr(bulk_fetcher.random, 'uniform', lambda low, high: 0)
+    results = fetch(FlakyClient(failures=100), ['Boston', 'Paris'])
+    assert all(isinstance(results[topic], ConnectionError) for topic in ('Boston', 'Paris'))
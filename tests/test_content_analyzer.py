@@ -0,0 +1,35 @@
+from modules.content_analyzer import parse_analysis
+
+
+def test_parse_analysis_splits_the_five_sections():
+    analysis = """1. Summary:
+Boston is one of the oldest cities in the United States.
+It is the capital of Massachusetts.
+
+2. Key facts:
+- Founded in 1630
+- Home of the Boston Tea Party
+
+3. Hooks:
+- What city started a revolution with tea?
+
+4. Simplified explanation:
+A colony is a settlement ruled by another country.
+
+5. Anecdote:
+Locals still argue about how to pronounce "Quincy".
+"""
+    parsed = parse_analysis(analysis)
+
+    assert parsed['summary'].strip() == ('Boston is one of the oldest cities in the United States. '
+                                         'It is the capital of Massachusetts.')
+    assert [fact for fact in parsed['key_facts'] if fact] == ['- Founded in 1630', '- Home of the Boston Tea Party']
+    assert [hook for hook in parsed['hooks'] if hook] == ['- What city started a revolution with tea?']
+    assert parsed['simplified_content'].strip() == 'A colony is a settlement ruled by another country.'
+    assert parsed['anecdote'].strip() == 'Locals still argue about how to pronounce "Quincy".'
+
+
+def test_parse_analysis_ignores_text_before_the_first_section():
+    parsed = parse_analysis("Here's my analysis:\n2. Key facts\nOnly one fact")
+    assert parsed['summary'] == ''
+    assert parsed['key_facts'] == ['Only one fact']
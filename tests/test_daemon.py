@@ -0,0 +1,34 @@
+import threading
+from http.server import ThreadingHTTPServer
+
+from modules import daemon
+
+
+class RecordingGenerator:
+    def __init__(self):
+        self.calls = []
+
+    def run_jobs(self, jobs, **options):
+        self.calls.append((jobs, options))
+        return {'topics': [], 'manifest_file': 'manifest.json'}
+
+
+def test_job_options_reach_the_batch_runner():
+    generator = RecordingGenerator()
+    handler = type('Handler', (daemon._DaemonRequestHandler,), {'generator': generator})
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        jobs = [{'topic': 'Boston', 'audience': 'teens'}]
+        daemon.submit_jobs(jobs, '127.0.0.1', server.server_address[1], compact=True, resume=False, fan_out=True,
+                           topic_budget=60, window=600, stream=False)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    (received, options), = generator.calls
+    assert received == jobs
+    assert options['compact'] is True
+    assert (options['resume'], options['fan_out'], options['stream']) == (False, True, False)
+    assert (options['topic_budget'], options['window']) == (60, 600)
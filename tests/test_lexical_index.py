@@ -0,0 +1,54 @@
+import pytest
+
+from modules.lexical_index import LexicalIndex, reciprocal_rank_fusion, tokenize
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = LexicalIndex(str(tmp_path / 'lexical.sqlite3'))
+    index.add([
+        ('boston-1', 'Boston was founded in 1630 by Puritan settlers.', {'title': 'Boston'}),
+        ('boston-2', 'The Boston Tea Party took place in 1773.', {'title': 'Boston'}),
+        ('paris-1', 'Paris hosted the Summer Olympics in 1900 and 1924.', {'title': 'Paris'}),
+    ])
+    return index
+
+
+def test_tokenize_drops_stopwords_and_keeps_numbers():
+    assert tokenize('The Tea Party of 1773') == ['tea', 'party', '1773']
+
+
+def test_bm25_ranks_exact_terms_first(index):
+    results = index.search('tea party 1773')
+    assert [chunk_id for chunk_id, _ in results] == ['boston-2']
+    assert index.search('1630 Puritan')[0][0] == 'boston-1'
+    assert index.search('the of') == []
+
+
+def test_rarer_terms_weigh_more(index):
+    index.add([('boston-3', 'Boston Boston Boston harbor.', {'title': 'Boston'})])
+    results = dict(index.search('boston olympics'))
+    # 'olympics' occurs in one chunk, 'boston' in three
+    assert results['paris-1'] > results['boston-1']
+
+
+def test_filters_and_deletes(index):
+    assert [chunk_id for chunk_id, _ in index.search('1900 1630', filters={'title': 'Paris'})] == ['paris-1']
+    index.delete(['paris-1'])
+    assert index.count() == 2
+    assert index.search('olympics') == []
+    index.clear()
+    assert index.count() == 0
+
+
+def test_index_persists(index):
+    reopened = LexicalIndex(index.path)
+    assert reopened.count() == 3
+    assert reopened.search('tea')[0][0] == 'boston-2'
+
+
+def test_reciprocal_rank_fusion_favours_ids_ranked_by_both():
+    fused = reciprocal_rank_fusion([['a', 'b', 'c'], ['c', 'b', 'd']], k=60)
+    assert {item_id for item_id, _ in fused[:2]} == {'b', 'c'}
+    assert dict(fused)['a'] == pytest.approx(1 / 61)
+    assert dict(fused)['b'] == pytest.approx(2 / 62)
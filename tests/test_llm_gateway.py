@@ -0,0 +1,99 @@
+import threading
+import time
+
+import pytest
+
+from modules import llm_gateway
+from modules.deadlines import deadline_scope
+
+
+class StreamingTransport:
+    """Streams a fixed completion in `chunks` pieces, `delay` seconds apart."""
+
+    def __init__(self, chunks=10, delay=0.05):
+        self.chunks = chunks
+        self.delay = delay
+        self.calls = 0
+        self.timeouts = []
+
+    def complete(self, request, on_text=None, timeout=None):
+        self.calls += 1
+        self.timeouts.append(timeout)
+        parts = [f"part{i} " for i in range(self.chunks)]
+        for part in parts:
+            time.sleep(self.delay)
+            if on_text is not None:
+                on_text(part)
+        return llm_gateway.CompletionResult(text=''.join(parts), model=request.model, stop_reason='stop_sequence',
+                                            prompt_tokens=1, completion_tokens=self.chunks)
+
+
+def make_gateway(transport, **kwargs):
+    kwargs.setdefault('requests_per_minute', None)
+    kwargs.setdefault('tokens_per_minute', None)
+    return llm_gateway.LLMGateway(transport=transport, cache=None, **kwargs)
+
+
+def test_streamed_completion_reports_time_to_first_token():
+    gateway = make_gateway(StreamingTransport(chunks=3, delay=0.02))
+    chunks = []
+    result = gateway.complete('prompt', 10, on_text=chunks.append)
+    assert ''.join(chunks) == result.text
+    assert 0 < result.time_to_first_token < 0.5
+
+
+def test_stream_is_cancelled_at_the_deadline():
+    gateway = make_gateway(StreamingTransport())
+    with pytest.raises(llm_gateway.DeadlineExceeded), deadline_scope(time.monotonic() + 0.12):
+        gateway.complete('prompt', 10, on_text=lambda text: None)
+
+
+def test_coalesced_waiter_reissues_after_the_owners_deadline():
+    transport = StreamingTransport()
+    gateway = make_gateway(transport)
+    errors, results = [], []
+
+    def owner():
+        try:
+            with deadline_scope(time.monotonic() + 0.12):
+                gateway.complete('prompt', 10, on_text=lambda text: None)
+        except llm_gateway.DeadlineExceeded as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=owner)
+    thread.start()
+    time.sleep(0.03)
+    results.append(gateway.complete('prompt', 10))
+    thread.join()
+
+    assert errors and results[0].text.startswith('part0')
+    assert gateway.stats['coalesced'] == 1
+    assert transport.calls == 2
+
+
+def test_rate_limit_wait_does_not_sleep_past_the_deadline():
+    bucket = llm_gateway.TokenBucket(60, capacity=1)
+    bucket.acquire(1)
+    start = time.monotonic()
+    with pytest.raises(llm_gateway.DeadlineExceeded):
+        bucket.acquire(1, deadline=start + 0.1)
+    assert time.monotonic() - start < 0.1
+
+
+def test_waiting_for_a_request_slot_counts_against_the_deadline():
+    transport = StreamingTransport(chunks=10, delay=0.05)
+    gateway = make_gateway(transport, max_concurrency=1)
+    busy = threading.Thread(target=gateway.complete, args=('slow prompt', 10))
+    busy.start()
+    time.sleep(0.05)
+
+    start = time.monotonic()
+    with pytest.raises(llm_gateway.DeadlineExceeded), deadline_scope(start + 0.1):
+        gateway.complete('other prompt', 10)
+    assert time.monotonic() - start < 0.2
+
+    # A request that gets a slot in time is sent with the time left after queueing for it
+    with deadline_scope(time.monotonic() + 2.0):
+        gateway.complete('third prompt', 10)
+    busy.join()
+    assert transport.timeouts[-1] < 2.0 - 0.1
@@ -0,0 +1,64 @@
+import pytest
+
+from modules import llm_gateway, script_generator
+
+SCORES = "1. Hook Strength: 8/10 - Strong.\n2. Clarity and Simplicity: 7/10 - Clear."
+
+
+class ScriptedTransport:
+    """Answers the batched request with `batched` and single-script requests with their script's score."""
+
+    def __init__(self, batched):
+        self.batched = batched
+        self.prompts = []
+
+    def complete(self, request, on_text=None, timeout=None):
+        self.prompts.append(request.prompt)
+        if 'each of the following' in request.prompt:
+            text = self.batched
+        else:
+            text = f"Single score for {'kids' if 'kids script' in request.prompt else 'teens'}"
+        return llm_gateway.CompletionResult(text=text, model=request.model, stop_reason='stop_sequence',
+                                            prompt_tokens=1, completion_tokens=1)
+
+
+@pytest.fixture
+def llm(monkeypatch):
+    def install(batched):
+        transport = ScriptedTransport(batched)
+        monkeypatch.setattr(llm_gateway, '_gateway', llm_gateway.LLMGateway(
+            transport=transport, cache=None, requests_per_minute=None, tokens_per_minute=None))
+        return transport
+    return install
+
+
+def test_sections_are_split_on_heading_lines(llm):
+    transport = llm(f"### Script 1\n{SCORES}\n\n### Script 2:\n{SCORES} Script 1 was better.")
+    results = script_generator.analyze_scripts_engagement(['kids script', 'teens script'], None, ['kids', 'teens'])
+
+    assert results[0] == {'engagement_analysis': SCORES}
+    assert results[1] == {'engagement_analysis': f"{SCORES} Script 1 was better."}
+    assert len(transport.prompts) == 1
+
+
+def test_body_lines_mentioning_a_script_do_not_start_a_section(llm):
+    transport = llm(f"### Script 1\n{SCORES}\nScript 2 ideas could borrow this hook.\n\n### Script 2\n{SCORES}")
+    results = script_generator.analyze_scripts_engagement(['kids script', 'teens script'], None)
+
+    assert results[0]['engagement_analysis'].endswith("Script 2 ideas could borrow this hook.")
+    assert results[1] == {'engagement_analysis': SCORES}
+    assert len(transport.prompts) == 1
+
+
+@pytest.mark.parametrize('batched', [
+    f"### Script 1\n{SCORES}",
+    f"### Script 2\n{SCORES}\n### Script 1\n{SCORES}",
+    f"**Script 1**\n{SCORES}\n**Script 2**\n{SCORES}",
+])
+def test_unexpected_sections_score_every_script_separately(llm, batched):
+    transport = llm(batched)
+    results = script_generator.analyze_scripts_engagement(['kids script', 'teens script'], None)
+
+    assert results == [{'engagement_analysis': 'Single score for kids'},
+                       {'engagement_analysis': 'Single score for teens'}]
+    assert len(transport.prompts) == 3
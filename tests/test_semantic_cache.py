@@ -0,0 +1,49 @@
+import pytest
+
+from conftest import WordHashingEmbedding
+from modules import content_analyzer
+from modules.semantic_cache import SemanticCache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return SemanticCache(str(tmp_path / 'semantic'), WordHashingEmbedding(), threshold=0.9)
+
+
+def test_near_duplicate_audience_hits(cache):
+    cache.store('Boston', 'teens 13-17', {'summary': 'boston'}, {'page': 'a'})
+    assert cache.lookup('Boston', 'Teens (13-17)', {'page': 'a'}) == {'summary': 'boston'}
+    assert cache.stats == {'lookups': 1, 'hits': 1}
+
+
+def test_different_topic_misses(cache):
+    cache.store('Boston', 'teens', {'summary': 'boston'}, {'page': 'a'})
+    assert cache.lookup('Paris', 'teens', {'page': 'a'}) is None
+
+
+def test_different_context_misses(cache):
+    cache.store('Boston', 'teens', {'summary': 'full'}, {'page': 'a', 'compact': False})
+    assert cache.lookup('Boston', 'teens', {'page': 'b', 'compact': False}) is None
+    assert cache.lookup('Boston', 'teens', {'page': 'a', 'compact': True}) is None
+    cache.store('Boston', 'teens', {'summary': 'compact'}, {'page': 'a', 'compact': True})
+    assert cache.lookup('Boston', 'teens', {'page': 'a', 'compact': True}) == {'summary': 'compact'}
+
+
+def test_entries_are_shared_between_instances(tmp_path):
+    path = str(tmp_path / 'semantic')
+    writer = SemanticCache(path, WordHashingEmbedding())
+    reader = SemanticCache(path, WordHashingEmbedding())
+    assert reader.lookup('Boston', 'teens') is None
+    writer.store('Boston', 'teens', {'summary': 'boston'})
+    assert reader.lookup('Boston', 'teens') == {'summary': 'boston'}
+
+
+def test_changed_content_calls_the_llm_again(fake_llm):
+    content = "Boston is one of the oldest municipalities in the United States, founded in 1630."
+    first = content_analyzer.analyze_content(content, 'Boston', 'teens', None)
+    assert content_analyzer.analyze_content(content, 'Boston', 'teens', None) == first
+    assert fake_llm.calls == 1
+
+    revised = content + " It hosts the oldest public park in the country, the Boston Common."
+    content_analyzer.analyze_content(revised, 'Boston', 'teens', None)
+    assert fake_llm.calls == 2
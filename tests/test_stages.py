@@ -0,0 +1,96 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from modules import content_analyzer, semantic_cache
+from modules.artifacts import ArtifactStore
+from modules.deadlines import DeadlineScheduler
+from modules.stages import GenerationPipeline
+from modules.token_counter import TokenCounter
+
+
+class FlakyIndexer:
+    """Indexer that is slow, and fails its first `failures` calls."""
+
+    def __init__(self, failures=0, delay=0.05):
+        self.failures = failures
+        self.delay = delay
+        self.calls = 0
+        self.finished = threading.Event()
+
+    def add_document_to_index(self, content):
+        self.calls += 1
+        time.sleep(self.delay)
+        if self.calls <= self.failures:
+            raise ConnectionError('vector store unavailable')
+        self.finished.set()
+        return {'documents_skipped': 0, 'chunks_added': 3, 'embedded_texts': ['a', 'b', 'c']}
+
+
+def index_job():
+    return {'topic': 'Boston', 'audience': 'Teenagers', 'topic_content': {'title': 'Boston', 'content': '...'}}
+
+
+def test_jobs_of_a_topic_wait_for_its_indexing(tmp_path):
+    indexer = FlakyIndexer()
+    pipeline = GenerationPipeline(TokenCounter(), str(tmp_path), indexer=indexer)
+
+    def run(_):
+        output = pipeline._run_index(index_job())
+        # Nobody may go on to retrieval before the article is in the index
+        assert indexer.finished.is_set()
+        return output
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        outputs = list(pool.map(run, range(4)))
+
+    assert indexer.calls == 1
+    assert sum(output['index_stats'] is not None for output in outputs) == 1
+
+
+def test_failed_indexing_is_retried_by_the_next_job(tmp_path):
+    indexer = FlakyIndexer(failures=1, delay=0)
+    pipeline = GenerationPipeline(TokenCounter(), str(tmp_path), indexer=indexer)
+
+    with pytest.raises(ConnectionError):
+        pipeline._run_index(index_job())
+    assert pipeline._run_index(index_job())['index_stats']['chunks_added'] == 3
+    assert pipeline._run_index(index_job()) == {'index_stats': None}
+    assert indexer.calls == 2
+
+
+def analyze_job():
+    content = ("Boston is one of the oldest municipalities in the United States, founded in 1630. "
+               "It hosts the oldest public park in the country, the Boston Common.")
+    return {'topic': 'Boston', 'audience': 'Teenagers', 'digests': {'fetch': 'page', 'index': 'index'},
+            'topic_content': {'title': 'Boston', 'summary': content, 'content': content}}
+
+
+def test_degraded_analysis_is_redone_in_full_when_time_allows(tmp_path, fake_llm, monkeypatch):
+    monkeypatch.setattr(content_analyzer, 'compact_content', lambda indexer, page, query, audience, token_counter,
+                        token_budget, top_k: ("Boston was founded in 1630.", {'token_budget': token_budget}))
+    store = ArtifactStore(str(tmp_path / 'artifacts'))
+
+    def analyze(topic_budget):
+        pipeline = GenerationPipeline(TokenCounter(), str(tmp_path), artifact_store=store,
+                                      scheduler=DeadlineScheduler(topic_budget))
+        job = analyze_job()
+        pipeline.run_stage(job, 'analyze')
+        return job
+
+    degraded = analyze(topic_budget=1.0)
+    assert degraded['degradations'][0]['action'] == 'shrunk'
+    assert degraded['compaction'] is not None
+    # Near-duplicate audiences must not pick up the shrunk analysis either
+    semantic_cache._semantic_cache._refresh()
+    assert semantic_cache._semantic_cache.entries == []
+
+    full = analyze(topic_budget=3600.0)
+    assert 'degradations' not in full
+    assert full['compaction'] is None
+    assert 'reused_stages' not in full
+    assert fake_llm.calls == 2
+    assert 'Boston Common' in fake_llm.prompts[-1]
+    assert full['analysis'] != degraded['analysis']
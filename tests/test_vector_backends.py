@@ -0,0 +1,84 @@
+import sqlite3
+
+import numpy as np
+import pytest
+
+from modules.vector_backends import EmbeddedBackend
+
+
+def make_points(count, dim=16, seed=0):
+    vectors = np.random.default_rng(seed).normal(size=(count, dim)).astype(np.float32)
+    ids = [f'p{i}' for i in range(count)]
+    payloads = [{'title': 'Rare' if i % 97 == 0 else 'Common', 'index': i} for i in range(count)]
+    return ids, vectors, payloads
+
+
+def test_filtered_search_with_ivf_finds_all_matching_rows(tmp_path):
+    ids, vectors, payloads = make_points(2000)
+    backend = EmbeddedBackend(str(tmp_path), ivf_threshold=500, nprobe=1)
+    backend.upsert(ids, vectors, payloads)
+    assert backend._ivf is not None
+
+    rare = [i for i, payload in enumerate(payloads) if payload['title'] == 'Rare']
+    hits = backend.search(vectors[0], top_k=len(rare), filters={'title': 'Rare'})[0]
+
+    assert sorted(point_id for point_id, _, _ in hits) == sorted(f'p{i}' for i in rare)
+    assert hits[0][0] == 'p0'
+
+
+@pytest.mark.parametrize('dtype', ['float16', 'int8'])
+def test_upsert_search_and_delete(tmp_path, dtype):
+    ids, vectors, payloads = make_points(50)
+    backend = EmbeddedBackend(str(tmp_path), dtype=dtype, ivf_threshold=None)
+    backend.upsert(ids, vectors, payloads)
+
+    hits = backend.search(vectors[:2], top_k=3)
+    assert [hits[0][0][0], hits[1][0][0]] == ['p0', 'p1']
+    assert hits[0][0][1] == pytest.approx(1.0, abs=0.02)
+    assert hits[0][0][2] == payloads[0]
+    assert [score for _, score, _ in hits[0]] == sorted((score for _, score, _ in hits[0]), reverse=True)
+
+    backend.delete(['p0'])
+    assert backend.count() == 49
+    assert 'p0' not in [point_id for point_id, _, _ in backend.search(vectors[0], top_k=5)[0]]
+    assert backend.get(['p0', 'p1']) == {'p1': payloads[1]}
+
+
+def test_upsert_replaces_points_and_reuses_deleted_rows(tmp_path):
+    ids, vectors, payloads = make_points(10)
+    backend = EmbeddedBackend(str(tmp_path), ivf_threshold=None)
+    backend.upsert(ids, vectors, payloads)
+    backend.delete(['p3'])
+    backend.upsert(['p5', 'new'], vectors[[0, 1]], [{'title': 'Replaced'}, {'title': 'New'}])
+
+    assert backend.rows == 10
+    assert backend.count() == 10
+    assert backend.get(['p5'])['p5'] == {'title': 'Replaced'}
+    assert backend.search(vectors[0], top_k=2, filters={'title': 'Replaced'})[0][0][0] == 'p5'
+
+
+def test_points_persist_across_instances(tmp_path):
+    ids, vectors, payloads = make_points(20)
+    EmbeddedBackend(str(tmp_path), ivf_threshold=None).upsert(ids, vectors, payloads)
+
+    reopened = EmbeddedBackend(str(tmp_path), ivf_threshold=None)
+    assert reopened.count() == 20
+    assert reopened.search(vectors[7], top_k=1)[0][0][0] == 'p7'
+    reopened.clear()
+    assert reopened.search(vectors[7], top_k=1) == [[]]
+
+
+def test_large_batches_stay_below_the_sqlite_variable_limit(tmp_path):
+    ids, vectors, payloads = make_points(3000, dim=4)
+    backend = EmbeddedBackend(str(tmp_path), ivf_threshold=None)
+    if not hasattr(backend._db, 'setlimit'):
+        pytest.skip('needs Python 3.11 to lower the SQLite variable limit')
+    # The compile-time default of older SQLite builds
+    backend._db.setlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER, 999)
+    backend.upsert(ids, vectors, payloads)
+    backend.upsert(ids, vectors, payloads)
+    assert backend.count() == 3000
+
+    backend.delete(ids[:-1])
+    assert backend.count() == 1
+    assert list(backend.get(ids)) == [ids[-1]]
@@ -0,0 +1,42 @@
+import os
+
+import pytest
+
+pytest.importorskip('llama_index.core')
+
+from llama_index.core.schema import NodeRelationship, RelatedNodeInfo, TextNode
+from llama_index.core.storage.docstore import SimpleDocumentStore
+
+from modules.vector_store import DocumentRecords, VectorStore
+
+
+def test_document_records_replace_per_document(tmp_path):
+    records = DocumentRecords(str(tmp_path / 'documents.sqlite3'))
+    records.put([('Boston', 'h1', ['a', 'b']), ('Paris', 'h2', ['c'])])
+    records.put([('Boston', 'h3', ['d'])])
+
+    assert records.get('Boston') == ('h3', ['d'])
+    assert records.get('Tokyo') == (None, [])
+    assert sorted(records.chunk_ids()) == ['c', 'd']
+
+    reopened = DocumentRecords(records.path)
+    assert reopened.count() == 2
+    reopened.clear()
+    assert reopened.chunk_ids() == []
+
+
+def test_json_docstore_is_imported_once(tmp_path):
+    docstore = SimpleDocumentStore()
+    node = TextNode(id_='chunk-1', text='Boston is a city.',
+                    relationships={NodeRelationship.SOURCE: RelatedNodeInfo(node_id='Boston')})
+    docstore.add_documents([node], store_text=False)
+    docstore.set_document_hash('Boston', 'hash-1')
+    docstore.persist(persist_path=str(tmp_path / 'docstore.json'))
+
+    store = VectorStore.__new__(VectorStore)
+    store.state_dir = str(tmp_path)
+    store.documents = DocumentRecords(str(tmp_path / 'documents.sqlite3'))
+    store._import_docstore()
+
+    assert store.documents.get('Boston') == ('hash-1', ['chunk-1'])
+    assert not os.path.exists(tmp_path / 'docstore.json')
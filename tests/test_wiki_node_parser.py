@@ -0,0 +1,22 @@
+import pytest
+
+pytest.importorskip('llama_index.core')
+
+from modules.token_counter import get_encoder
+from modules.wiki_node_parser import WikipediaSectionParser
+
+
+@pytest.fixture
+def parser():
+    try:
+        get_encoder('gpt-3.5-turbo')
+    except Exception as e:
+        pytest.skip(f"tiktoken encoding unavailable: {e}")
+    return WikipediaSectionParser(chunk_size=8, chunk_overlap=2)
+
+
+def test_special_token_text_is_chunked_as_plain_text(parser):
+    paragraph = "Language models mark the end of a document with <|endoftext|> in their training data."
+    chunks = parser.split_section(paragraph + "\n\nA second paragraph.")
+    assert len(chunks) > 1
+    assert any('endoftext' in chunk for chunk in chunks)
@@ -0,0 +1,84 @@
+"""
+Check that importing the CLI entry point stays fast.
+
+Runs `python -X importtime -c "import main"` in a fresh interpreter, prints the slowest
+imports and fails when the total exceeds the budget or when a heavy dependency that
+should only be loaded by the stage that needs it is imported eagerly.
+
+Usage:
+    python tools/check_import_time.py [--budget-ms 300] [--module main] [--top 15]
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+# Dependencies that must only be imported lazily
+HEAVY_MODULES = [
+    'torch',
+    'sentence_transformers',
+    'transformers',
+    'llama_index',
+    'qdrant_client',
+    'openai',
+    'anthropic',
+    'tiktoken',
+    'numpy',
+    'wikipediaapi',
+]
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def measure_imports(module: str):
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=REPO_ROOT,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+
+    imports = []
+    for line in result.stderr.splitlines():
+        # Format: "import time: <self us> | <cumulative us> | <indented package name>"
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, self_us, cumulative_us, name = (part.strip() for part in line.replace('import time:', '|', 1).split('|'))
+        imports.append((name, int(self_us), int(cumulative_us)))
+    return imports
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check the import time budget of the CLI entry point')
+    parser.add_argument('--module', default='main', help='Module to import (default: main)')
+    parser.add_argument('--budget-ms', type=float, default=300.0, help='Maximum total import time in milliseconds')
+    parser.add_argument('--top', type=int, default=15, help='Number of slowest imports to print')
+    args = parser.parse_args()
+
+    imports = measure_imports(args.module)
+    total_ms = sum(self_us for _, self_us, _ in imports) / 1000
+
+    print(f"Slowest imports for 'import {args.module}' (cumulative ms):")
+    for name, _, cumulative_us in sorted(imports, key=lambda item: item[2], reverse=True)[:args.top]:
+        print(f"  {cumulative_us / 1000:8.1f}  {name}")
+    print(f"Total import time: {total_ms:.1f} ms (budget {args.budget_ms:.0f} ms)")
+
+    imported = {name.split('.')[0] for name, _, _ in imports}
+    eager_heavy = [module for module in HEAVY_MODULES if module in imported]
+
+    failed = False
+    if eager_heavy:
+        print(f"FAIL: heavy modules imported eagerly: {', '.join(eager_heavy)}")
+        failed = True
+    if total_ms > args.budget_ms:
+        print(f"FAIL: import time {total_ms:.1f} ms exceeds budget of {args.budget_ms:.0f} ms")
+        failed = True
+    if not failed:
+        print("OK")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
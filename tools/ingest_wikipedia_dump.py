@@ -0,0 +1,37 @@
+"""
+Build a local article store from a Wikipedia pages-articles dump.
+
+Streams the (optionally .bz2 compressed) XML dump, converts every article to the
+section format used by WikipediaFetcher on a pool of worker processes, and writes a
+compressed, memory-mapped store with a title index that includes redirects.
+Point config.WIKIPEDIA_ARTICLE_STORE at the output directory to use it.
+
+Usage:
+    python tools/ingest_wikipedia_dump.py enwiki-latest-pages-articles.xml.bz2 output/article_store [--workers 8]
+"""
+import argparse
+import logging
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modules.article_store import ingest_dump
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Ingest a Wikipedia XML dump into a local article store')
+    parser.add_argument('dump', help='Path to a pages-articles XML dump (.xml or .xml.bz2)')
+    parser.add_argument('store', help='Output directory of the article store')
+    parser.add_argument('--workers', type=int, help='Worker processes (default: number of CPUs)')
+    parser.add_argument('--chunksize', type=int, default=32, help='Pages handed to a worker at a time')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+    stats = ingest_dump(args.dump, args.store, workers=args.workers, chunksize=args.chunksize)
+    print(f"Stored {stats['articles']} articles and {stats['redirects']} redirects "
+          f"({stats['bytes'] / 1024 / 1024:.1f} MB) in {stats['seconds']} seconds")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,33 @@
+"""
+Aggregate JSON-lines run traces written with `main.py --trace`.
+
+Prints count, total, p50, p95 and max seconds per span name (or per stage, topic, ...)
+over any number of trace files, e.g. all runs of a large batch.
+
+Usage:
+    python tools/trace_report.py output/traces/*.jsonl [--group-by name|stage|topic] [--spans stage.]
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modules.instrumentation import aggregate_traces, print_span_summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Aggregate span timings of run traces')
+    parser.add_argument('traces', nargs='+', help='Trace files (.jsonl)')
+    parser.add_argument('--group-by', default='name', help='Span field to group by (default: name)')
+    parser.add_argument('--spans', help='Only report groups starting with this prefix, e.g. "stage."')
+    args = parser.parse_args()
+
+    summary = aggregate_traces(args.traces, args.group_by)
+    if args.spans:
+        summary = {group: stats for group, stats in summary.items() if group.startswith(args.spans)}
+    print_span_summary(summary)
+
+
+if __name__ == '__main__':
+    main()